@@ -0,0 +1,188 @@
+""" Check RSMs against CTL formulas from Python, without parsing command line arguments, writing files or configuring
+logging, e.g. for batch drivers that check many RSMs in one process
+"""
+
+import copy
+import random
+import time
+import budget
+import checker
+import stats
+from checker import check_exhaustive, check_lazy, known_fraction, record_context_counts, remove_unreachable_components
+from ctl_parser import parse_ctl, parse_ctl_formula
+from deduplication import merge_isomorphic_components
+from portfolio import Strategy, parse_strategy
+from prestar_checker import check_prestar
+from reduction import reduce_rsm
+from rsm_parser import parse_rsm
+from sequential_checker import check_sequential
+
+
+class Result:
+    """
+    a class to represent the outcome of checking a single formula, see check
+
+    Attributes
+    ----------
+
+    index : int
+        the position of the formula among the checked formulas, starting at 1
+    formula : CTL
+        the checked formula
+    result : bool or str
+        the value of the formula in the initial node, "unknown" if the budget was exceeded
+    exceeded : str or None
+        "timeout" or "memout" if the budget was exceeded, None otherwise
+    approach : str
+        the approach the formula was checked with, i.e., "lazy", "exhaustive", "sequential" or "prestar"
+    initial_node : str
+        the name of the initial node
+    initial_component : str
+        the name of the contextualized initial component after checking
+    statistics : dict
+        the phase timings, counters, peaks and info of the check, see Statistics.to_dict
+    machine : RSM
+        the checked RSM with the computed values, e.g. to generate a witness if all subformulas were kept
+    """
+
+    def __init__(self, index, formula, result, exceeded, approach, machine, statistics):
+        self.index = index
+        self.formula = formula
+        self.result = result
+        self.exceeded = exceeded
+        self.approach = approach
+        self.initial_node = machine.initial_node.base_name
+        self.initial_component = machine.initial_component.name
+        self.statistics = statistics
+        self.machine = machine
+
+    def __repr__(self):
+        return "Result(" + str(self.index) + ", " + str(self.formula) + ", " + str(self.result) + \
+            ("" if self.exceeded is None else ", " + self.exceeded) + ")"
+
+
+def load_formulas(formulas):
+    """
+    :param formulas: path of a .ctl file, or an iterable of formulas given as strings in the syntax of .ctl files or
+    as returned by parse_ctl_formula
+    :return: list of the parsed formulas
+    """
+    if isinstance(formulas, str):
+        return list(parse_ctl(formulas))
+    return [parse_ctl_formula(f) if isinstance(f, str) else f for f in formulas]
+
+
+def check_formula(machine, ctl, strategy, keep_subformulas=False, demand=False, limits=(None, None, None)):
+    """
+    Check a single formula on a parsed RSM, which is modified in the process. The statistics are collected in the
+    current statistics object, see stats.current, so parsing and preprocessing can be timed in it as well.
+
+    :param machine: the parsed RSM, pruned by remove_unreachable_components
+    :param ctl: the formula to check
+    :param strategy: the Strategy to use, its seed also seeds the random module
+    :param keep_subformulas: whether the values of all subformulas are kept, as needed for witnesses
+    :param demand: whether the lazy approach only evaluates the subformulas in the demanded nodes
+    :param limits: (max_time, max_memory, deadline) of the budget, see budget.start
+    :return: the value of ctl in the initial node ("unknown" if the budget was exceeded) and None or the reason why
+    the budget was exceeded
+    """
+    statistics = stats.current()
+    if strategy.seed is not None:
+        random.seed(strategy.seed)
+    retire_subformulas, demand_driven = checker.retire_subformulas, checker.demand_driven
+    checker.retire_subformulas = not keep_subformulas
+    checker.demand_driven = demand
+    budget.start(*limits)
+    try:
+        with statistics.phase("checking"):
+            if strategy.approach == "sequential":
+                check_sequential(machine, ctl)
+            elif strategy.approach == "prestar":
+                check_prestar(machine, ctl)
+            elif strategy.approach == "exhaustive":
+                check_exhaustive(machine, ctl)
+            else:
+                check_lazy(machine, ctl, strategy.expansion_heuristic, strategy.seed is not None)
+        return machine.initial_component.interpretation[machine.initial_node][ctl], None
+    except budget.BudgetExceeded as e:
+        # keep the partial statistics of the aborted check
+        if strategy.approach in ("lazy", "exhaustive"):
+            record_context_counts()
+        statistics.info["known_fraction"] = known_fraction(machine, ctl)
+        return "unknown", e.reason
+    finally:
+        budget.stop()
+        checker.retire_subformulas, checker.demand_driven = retire_subformulas, demand_driven
+
+
+def check(machine, formulas, strategy="getnext", sequential=True, deduplicate=False, reduce=False, demand=False,
+          keep_subformulas=False, max_time=0, max_memory=0, max_total_time=0):
+    """
+    Check an RSM against CTL formulas one after the other in this process, yielding the result of each formula as
+    soon as it is known. As in rsmcheck.py, each formula is checked on a fresh RSM, which takes over the exit summaries
+    of the previous one unless the RSM is reduced. Apart from the current statistics and the global random state, no
+    state is left behind, nothing is written and nothing is logged unless the caller configured logging.
+
+    :param machine: path of an .rsm file, which is parsed for each formula, or a parsed RSM, which is copied for each
+    formula since checking modifies it. copying takes longer than parsing, so paths are preferable for large RSMs.
+    :param formulas: path of a .ctl file, or an iterable of formulas given as strings in the syntax of .ctl files or
+    as returned by parse_ctl_formula
+    :param strategy: a Strategy or its specification as for -portfolio of rsmcheck.py, i.e., an expansion heuristic
+    of the lazy approach, exhaustive, sequential or prestar, optionally followed by @<seed>
+    :param sequential: whether RSMs without recursion are checked by the sequential approach unless the strategy is
+    prestar
+    :param deduplicate: whether isomorphic components are merged after parsing, see merge_isomorphic_components
+    :param reduce: whether the RSM is reduced w.r.t. the atomic propositions of each formula, see reduce_rsm
+    :param demand: whether the lazy approach only evaluates the subformulas in the demanded nodes
+    :param keep_subformulas: whether the values of all subformulas are kept, such that witnesses can be generated
+    from the checked RSMs of the results
+    :param max_time: maximal wall-clock time in seconds for checking a single formula (0 = no limit)
+    :param max_memory: maximal resident set size of the process in bytes while checking a formula (0 = no limit)
+    :param max_total_time: maximal wall-clock time in seconds for checking all formulas (0 = no limit)
+    :return: iterator of the Result of each formula, in the order of the formulas
+    """
+    if not isinstance(strategy, Strategy):
+        strategy = parse_strategy(strategy)
+    if keep_subformulas and (demand or reduce):
+        raise ValueError("the values of all subformulas cannot be kept with demand or reduce")
+    formulas = load_formulas(formulas)
+    deadline = time.monotonic() + max_total_time if max_total_time > 0 else None
+    exit_summaries = None
+
+    for index, ctl in enumerate(formulas, 1):
+        statistics = stats.reset()
+        with statistics.phase("parsing"):
+            formula_machine = parse_rsm(machine) if isinstance(machine, str) else copy.deepcopy(machine)
+            if deduplicate:
+                statistics.count("merged_components", merge_isomorphic_components(formula_machine))
+        if reduce:
+            with statistics.phase("reduction"):
+                num_nodes, num_reduced_nodes = reduce_rsm(formula_machine, ctl)
+            statistics.info["reduction_ratio"] = num_reduced_nodes / num_nodes
+        remove_unreachable_components(formula_machine)
+        if exit_summaries is not None:
+            formula_machine.exit_summaries = exit_summaries
+
+        formula_strategy = strategy
+        if sequential and strategy.approach != "prestar" and not formula_machine.is_recursive():
+            formula_strategy = parse_strategy("sequential")
+        elif strategy.approach == "sequential" and formula_machine.is_recursive():
+            raise ValueError("The sequential approach cannot check RSMs with recursion")
+
+        result, exceeded = check_formula(formula_machine, ctl, formula_strategy, keep_subformulas, demand,
+                                         (max_time, max_memory, deadline))
+        if not reduce:
+            # the reduction depends on the formula, otherwise all formulas are checked on the same base components
+            exit_summaries = formula_machine.exit_summaries
+        memory = stats.peak_memory()
+        if memory is not None:
+            statistics.peak("memory", memory)
+        statistics.info.update({
+            "index": index,
+            "formula": str(ctl),
+            "result": result,
+            "exceeded": exceeded,
+            "approach": formula_strategy.approach,
+            "strategy": formula_strategy.name
+        })
+        yield Result(index, ctl, result, exceeded, formula_strategy.approach, formula_machine, statistics.to_dict())
@@ -0,0 +1,114 @@
+""" Cooperative wall-clock and memory budget of a model checking run
+"""
+
+import time
+import stats
+
+
+class BudgetExceeded(Exception):
+    """
+    raised by Budget.check when the time or memory budget is exhausted
+
+    Attributes
+    ----------
+
+    reason : str
+        either "timeout" or "memout"
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Budget:
+    """
+    a class to represent the time and memory budget of checking a single formula
+    the checker calls check() regularly, i.e., in each lazy or exhaustive iteration and in each fixpoint round, such
+    that the check of a formula can be aborted gracefully instead of killing the whole process
+
+    Attributes
+    ----------
+
+    start_time : float
+        wall-clock time (time.monotonic) at which the budget was created
+    deadline : float or None
+        wall-clock time (time.monotonic) at which the budget is exhausted, None for no time limit
+    max_memory : int or None
+        maximal resident set size of the process in bytes, None for no memory limit
+
+    Methods
+    -------
+
+    check()
+        raise BudgetExceeded if the deadline has passed or the memory limit is exceeded
+    elapsed()
+        return the wall-clock time in seconds since the budget was created
+    """
+
+    # reading the memory consumption is comparatively expensive, so it is only done every so many seconds
+    memory_check_interval = 0.1
+
+    def __init__(self, max_time=None, max_memory=None, deadline=None):
+        """
+        Parameters
+        ----------
+        max_time : Optional float
+            number of seconds from now until the budget is exhausted
+        max_memory : Optional int
+            maximal resident set size of the process in bytes
+        deadline : Optional float
+            absolute wall-clock time (time.monotonic) at which the budget is exhausted at the latest, e.g. the end of
+            a global budget for several formulas
+        """
+        self.start_time = time.monotonic()
+        self.deadline = deadline
+        if max_time:
+            formula_deadline = self.start_time + max_time
+            self.deadline = formula_deadline if deadline is None else min(deadline, formula_deadline)
+        self.max_memory = max_memory or None
+        self._next_memory_check = self.start_time
+
+    def check(self):
+        now = time.monotonic()
+        if self.deadline is not None and now > self.deadline:
+            raise BudgetExceeded("timeout")
+        if self.max_memory is not None and now >= self._next_memory_check:
+            self._next_memory_check = now + self.memory_check_interval
+            memory = stats.current_memory()
+            if memory is not None and memory > self.max_memory:
+                raise BudgetExceeded("memout")
+
+    def elapsed(self):
+        return time.monotonic() - self.start_time
+
+
+_current = None
+
+
+def start(max_time=None, max_memory=None, deadline=None):
+    """
+    Start a new budget for the formula that is checked next.
+
+    :return: the new budget
+    """
+    global _current
+    _current = Budget(max_time, max_memory, deadline)
+    return _current
+
+
+def stop():
+    """
+    Stop enforcing the current budget.
+    """
+    global _current
+    _current = None
+
+
+def check():
+    """
+    Raise BudgetExceeded if the budget of the formula currently being checked is exhausted. Does nothing if no budget
+    has been started.
+    """
+    if _current is not None:
+        _current.check()
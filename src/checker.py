@@ -1,17 +1,26 @@
 """
 Collection of functions to determine the truth value of a CTL in a node
 """
+import heapq
 import random
-from utils import *
+import sys
+import utils
+from utils import IndexedSet, check_existential_formula, check_local_formula, demanded_nodes, is_propositional, \
+    set_existential_value
 from ctl_parser import get_subformulas
+from model import rsm
+from pyModelChecking import CTL
+import budget
+import stats
 import logging
-from collections import defaultdict
+from collections import defaultdict, deque
 from enum import Enum
+from itertools import count
+
+logger = logging.getLogger(__name__)
 
 num_contexts_built = 0
 num_contexts_relabeled = 0
-# track which components we tried to unpack in last exhaustive iteration so we detect fixed points
-last_boxes_to_unpack = set()
 # keep track of which CTL have been requested in which nodes for lazy unpacking
 requested_nodes = defaultdict(set)
 # keep track of which CTL have been requested in which nodes for lazy unpacking in the current call stack
@@ -24,12 +33,45 @@ component_stack = []
 double_requests = set()
 # keep track of formulas which are fully known in the whole RSM
 known_formulas = set()
+# subformulas that no unknown formula depends on anymore, their values are dropped from the interpretations
+retired_formulas = set()
+# whether retired subformulas are dropped during lazy checking, witnesses can only be generated if they are kept
+retire_subformulas = True
+# whether lazy checking only evaluates the values that can influence the value in the initial node, see demanded_nodes
+demand_driven = False
+# index of (box, component) pairs that can be contextualized, maintained for the RANDOM, ALL and PRIORITY heuristics
+contextualizable_boxes = IndexedSet()
+# existential subformulas considered when deciding whether a box can be contextualized
+existential_subformulas = []
+# components whose return nodes or callees changed since contextualizable_boxes was last updated
+changed_components = set()
+# keep track of the components referencing each component by one of their boxes, may contain outdated entries
+box_callers = defaultdict(set)
+# weights of the signals a box is scored by in the PRIORITY heuristic, the box with the lowest score is contextualized
+# next. the signals are the size of the referenced component relative to the largest component, whether a new context
+# has to be built instead of relabeling the box, the fraction of the existential subformulas already known in the call
+# nodes of the box and the number of boxes between the initial component and the box
+priority_weights = {"size": 1.0, "build": 1.0, "known": 1.0, "depth": 0.1}
+# heap of (score, insertion number, box, component) of contextualizable boxes for the PRIORITY heuristic, None for the
+# other heuristics. the scores may be outdated, they are recomputed when a box reaches the top of the heap
+priority_queue = None
+# (box, component) pairs in priority_queue
+priority_queued = set()
+# insertion numbers breaking ties between equal scores in priority_queue
+priority_numbers = count()
+# length of the shortest box stack leading to each component, may contain outdated entries
+component_depths = {}
+# number of nodes of the largest base component
+max_component_size = 1
+# optional profiling.MemoryProfiler taking snapshots around each lazy/exhaustive iteration
+memory_profiler = None
 
 
 class ExpansionHeuristics(Enum):
     GETNEXT = 1
     RANDOM = 2
     ALL = 3
+    PRIORITY = 4
 
 
 def check_exhaustive(machine, ctl):
@@ -49,96 +91,171 @@ def check_exhaustive(machine, ctl):
     global num_contexts_built
     global num_contexts_relabeled
     num_contexts_built = 0
+    num_contexts_relabeled = 0
     init_contexts_built = 0
 
     subformulas = get_subformulas(ctl)
 
-    top_level_existential_formulas = []
-    top_level_formulas = [ctl]
-    while top_level_formulas:
-        next_top_level_formulas = []
-        for f in top_level_formulas:
+    if "E" in str(ctl):
+        with stats.current().phase("initialize"):
+            machine.mark_context_independent_nodes()
+
+    # existential formulas nested in other existential formulas are needed in all nodes. since equal subformulas are
+    # the same object, this includes formulas that also occur at the top level
+    nested_existential_formulas = set()
+    for fs in subformulas.values():
+        for f in fs:
             if isinstance(f, CTL.E):
-                top_level_existential_formulas.append(f)
-            else:
-                next_top_level_formulas += f.subformulas()
-        top_level_formulas = next_top_level_formulas
+                nested_existential_formulas.update(g for gs in get_subformulas(f.subformula(0)).values() for g in gs
+                                                   if isinstance(g, CTL.E))
 
     # iterate via range to guarantee correct order of depths
     for depth in range(max(subformulas.keys()) + 1):
         for f in subformulas[depth]:
             if not isinstance(f, CTL.E):
-                for comp in machine.contextualized_components:
-                    for node in comp.base_component.nodes:
-                        check_locally(node, comp, f)
+                check_local_formula(machine, f)
             else:
                 name_appendix = "_init" + str(init_contexts_built)
                 init_contexts_built += 1
-                machine.initialize_single(f, name_appendix)
-                machine.remove_unreachable_components()
-                # TODO: restore finish early functionality
-                finish_early = f in top_level_existential_formulas
+                num_contexts_built += 1
+                with stats.current().phase("initialize"):
+                    machine.initialize_single(f, name_appendix)
+                remove_unreachable_components(machine)
+                # only the value in the initial node matters for formulas that are not nested in existential ones
+                finish_early = f not in nested_existential_formulas
                 # uncomment for full exhaustive run
                 # finish_early = False
+                check_existential_formula_exhaustive(machine, f, finish_early)
 
-                while check_existential_formula_exhaustive(machine, f, finish_early):
-                    pass
-
-    num_contexts_built += init_contexts_built
-
-    logging.debug("Built a total of " + str(num_contexts_built) + " contexts (plus " + str(num_contexts_relabeled) +
-                  " context relabels)")
+    record_context_counts()
+    logger.debug("Built a total of " + str(num_contexts_built) + " contexts (plus " + str(num_contexts_relabeled) +
+                 " context relabels)")
 
 
 def check_existential_formula_exhaustive(machine, f, finish_early=False):
     """
-    Find value for f in all nodes of machine. Build context if necessary. Return whether another step is necessary.
+    Find value for f in all nodes of machine (or only in the initial node if finish_early is set), building contexts
+    as necessary. Boxes whose return nodes know f while their referenced component does not know it in the
+    corresponding exit nodes are kept in a worklist. In each iteration, all boxes of the worklist are contextualized,
+    and only the components whose context or callees changed are evaluated again, which in turn queues the boxes whose
+    return nodes changed. If the worklist runs empty while f is still unknown somewhere, the remaining values only
+    depend on each other via recursion and are resolved as cycles.
     """
     global num_contexts_built
     global num_contexts_relabeled
 
-    if finish_early:
-        found_target = check_existential_formula(machine, f)
-        if found_target:
-            logging.debug("Determined CTL (" + str(f) + ") in initial node")
-            return False
-    else:
-        check_existential_formula(machine, f)
-
-    machine.remove_unreachable_components()
+    statistics = stats.current()
 
-    # collect boxes which have information that their referenced component does not have
-    boxes_to_unpack = set()
+    # components referencing each component by one of their boxes, may contain outdated entries
+    callers = defaultdict(set)
     for c in machine.contextualized_components:
-        for box in c.base_component.boxes:
+        for ref_component in c.box_mapping.values():
+            callers[ref_component].add(c)
+
+    check_existential_formula(machine, f)
+    worklist = deque()
+    queued = set()
+    queue_boxes(machine.contextualized_components, f, worklist, queued)
+
+    while True:
+        if finish_early and f in machine.initial_component.interpretation[machine.initial_node]:
+            logger.debug("Determined CTL (" + str(f) + ") in initial node")
+            return
+
+        if not worklist:
+            unknown_components = set()
+            for c in machine.contextualized_components:
+                for n, i in c.interpretation.items():
+                    if f not in i:
+                        unknown_components.add(c)
+                        break
+            if not unknown_components:
+                logger.debug("Determined CTL (" + str(f) + ") in all nodes")
+                return
+            # no context can be built anymore, so the unknown values lie on cycles. only EU and EG can be unknown on
+            # cycles, and only if the values of their subformulas are known, otherwise the default would be wrong
+            path_formula = f.subformula(0)
+            if not isinstance(path_formula, CTL.G) and not isinstance(path_formula, CTL.U):
+                raise ValueError("Could not determine " + str(f) + " in all nodes, although no context can be built")
+            for c in unknown_components:
+                for n, i in c.interpretation.items():
+                    if f not in i:
+                        if any(i.get(sub) is None for sub in path_formula.subformulas()):
+                            raise ValueError("Could not determine " + str(f) + " in " + str(n) + " of " + c.name +
+                                             ", since its subformulas are unknown there")
+                        c.set_truth_value(n, f, isinstance(path_formula, CTL.G))
+            queue_boxes(unknown_components, f, worklist, queued)
+            continue
+
+        statistics.count("exhaustive_iterations")
+        budget.check()
+        if memory_profiler is not None:
+            memory_profiler.start_iteration()
+
+        changed_components = set()
+        while worklist:
+            c, box = worklist.popleft()
+            queued.discard((c, box))
+            if c not in machine.contextualized_components:
+                continue
+            context_existed = c.contextualize_box(box)
             ref_component = c.box_mapping[box]
-            for rn in box.return_nodes:
-                if f not in ref_component.interpretation[rn.node]:
-                    boxes_to_unpack.add((c, box))
-                    continue
+            callers[ref_component].add(c)
+            if context_existed:
+                num_contexts_relabeled += 1
+            else:
+                num_contexts_built += 1
+                for callee in ref_component.box_mapping.values():
+                    callers[callee].add(ref_component)
+            changed_components.add(c)
+            changed_components.add(ref_component)
 
-    if all(f in i for c in machine.contextualized_components for n, i in c.interpretation.items()):
-        logging.debug("Determined CTL (" + str(f) + ") in all nodes")
-        return False
+        remove_unreachable_components(machine)
+        evaluated_components = evaluate_changed_components(machine, f, changed_components, callers)
+        queue_boxes(evaluated_components, f, worklist, queued)
 
-    for c, box in boxes_to_unpack:
-        #print("unpacking ", box, c.context)
-        context_existed = c.contextualize_box(box)
-        if context_existed:
-            num_contexts_relabeled += 1
-        else:
-            num_contexts_built += 1
+        if memory_profiler is not None:
+            memory_profiler.end_iteration()
 
-    global last_boxes_to_unpack
-    if last_boxes_to_unpack == boxes_to_unpack:
-        assert isinstance(f.subformula(0), CTL.G) or isinstance(f.subformula(0), CTL.U)
-        for c in machine.contextualized_components:
-            for n, i in c.interpretation.items():
-                if f not in i:
-                    i[f] = True if isinstance(f.subformula(0), CTL.G) else False
-    last_boxes_to_unpack = boxes_to_unpack
 
-    return True
+def evaluate_changed_components(machine, f, changed_components, callers):
+    """
+    Evaluate f in the changed components and, whenever the values of f in a component change, in its callers.
+    The components are evaluated in the order of the call graph, such that the callees are up to date before their
+    callers are evaluated. Recursive parts of the call graph are evaluated as a whole.
+
+    :param changed_components: components whose context or box mapping changed, extended by the callers on the fly
+    :param callers: dictionary mapping each component to the components referencing it
+    :return: set of evaluated components
+    """
+    evaluated_components = set()
+    for group in machine.get_evaluation_order():
+        if group.isdisjoint(changed_components):
+            continue
+        known_before = {c: sum(1 for i in c.interpretation.values() if f in i) for c in group}
+        check_existential_formula(machine, f, [group])
+        for c in group:
+            if sum(1 for i in c.interpretation.values() if f in i) != known_before[c]:
+                changed_components |= callers[c]
+        evaluated_components |= group
+    return evaluated_components
+
+
+def queue_boxes(components, f, worklist, queued):
+    """
+    Add the boxes of the given components to the worklist that know f in a return node while the referenced
+    component does not know f in the corresponding exit node.
+    """
+    for c in components:
+        for box in c.base_component.boxes:
+            if (c, box) in queued:
+                continue
+            ref_component = c.box_mapping[box]
+            for rn in box.return_nodes:
+                if f in c.interpretation[rn] and f not in ref_component.interpretation[rn.node]:
+                    worklist.append((c, box))
+                    queued.add((c, box))
+                    break
 
 
 def check_lazy(machine, ctl, expansion_heuristic, randomize_nondeterminism=False):
@@ -161,17 +278,91 @@ def check_lazy(machine, ctl, expansion_heuristic, randomize_nondeterminism=False
     global double_requests
     global num_contexts_built
     global num_contexts_relabeled
+    global known_formulas
+    global retired_formulas
+    global existential_subformulas
+    global contextualizable_boxes
+    global changed_components
+    global box_callers
+    global priority_queue
+    global priority_queued
+    global component_depths
+    global max_component_size
+
+    statistics = stats.current()
+
+    # formulas known in a previously checked machine tell nothing about this one
+    known_formulas = set()
+    retired_formulas = set()
 
     # initialization in exit nodes is not necessary for local properties
     if "E" in str(ctl):
-        machine.initialize(ctl)
+        with statistics.phase("initialize"):
+            machine.mark_context_independent_nodes()
+            machine.initialize(ctl)
     num_contexts_built = 1
-    machine.remove_unreachable_components()
+    num_contexts_relabeled = 0
+    remove_unreachable_components(machine)
 
     complete_machine_for_all_subformulas(machine, ctl)
+    if retire_subformulas:
+        drop_retired_subformulas(machine, ctl)
+
+    if expansion_heuristic == ExpansionHeuristics.GETNEXT:
+        unpack_lazily(machine, ctl, expansion_heuristic, randomize_nondeterminism)
+    else:
+        existential_subformulas = [f for fs in get_subformulas(ctl).values() for f in fs if isinstance(f, CTL.E)]
+        contextualizable_boxes = IndexedSet()
+        changed_components = set(machine.contextualized_components)
+        box_callers = defaultdict(set)
+        for c in machine.contextualized_components:
+            for ref_component in c.box_mapping.values():
+                box_callers[ref_component].add(c)
+        if expansion_heuristic == ExpansionHeuristics.PRIORITY:
+            priority_queue = []
+            priority_queued = set()
+            component_depths = {machine.initial_component: 0}
+            next_components = [machine.initial_component]
+            while next_components:
+                c = next_components.pop(0)
+                for ref_component in c.box_mapping.values():
+                    if ref_component not in component_depths:
+                        component_depths[ref_component] = component_depths[c] + 1
+                        next_components.append(ref_component)
+            max_component_size = max(len(c.nodes) for c in machine.base_components)
+        else:
+            priority_queue = None
+        utils.on_box_value_determined = box_value_determined
+        try:
+            unpack_lazily(machine, ctl, expansion_heuristic, randomize_nondeterminism)
+        finally:
+            utils.on_box_value_determined = None
+
+    record_context_counts()
+    logger.debug("Built a total of " + str(num_contexts_built) + " contexts (plus " + str(num_contexts_relabeled) +
+                 " context relabels)")
+
+
+def unpack_lazily(machine, ctl, expansion_heuristic, randomize_nondeterminism):
+    """
+    Contextualize the boxes chosen by the expansion heuristic and deduce all formulas again until ctl is known in the
+    initial node.
+    """
+    global requested_nodes
+    global requested_node_chain
+    global box_stack
+    global component_stack
+    global double_requests
+    global num_contexts_built
+    global num_contexts_relabeled
+
+    statistics = stats.current()
 
-    # do lazy unpacking
-    while ctl not in machine.initial_component.interpretation[machine.initial_node]:
+    while machine.initial_component.interpretation[machine.initial_node].get(ctl) is None:
+        statistics.count("lazy_iterations")
+        budget.check()
+        if memory_profiler is not None:
+            memory_profiler.start_iteration()
         to_contextualize = []
         # find box(ex) to unpack
         if expansion_heuristic == ExpansionHeuristics.GETNEXT:
@@ -182,24 +373,21 @@ def check_lazy(machine, ctl, expansion_heuristic, randomize_nondeterminism=False
             component_stack = [machine.initial_component]
             double_requests = set()
 
-            result = find_next_necessary_context(machine, machine.initial_node, ctl, randomize_nondeterminism)
+            with statistics.phase("get_next"):
+                result = find_next_necessary_context(machine, machine.initial_node, ctl, randomize_nondeterminism)
             to_contextualize = [result] if result is not None else []
         else:
-            contextualizable_boxes = []
-            for c in machine.contextualized_components:
-                for box in c.base_component.boxes:
-                    ref_component = c.box_mapping[box]
-                    for rn in box.return_nodes:
-                        for f in ctl.subformulas():
-                            if f not in ref_component.interpretation[rn.node] \
-                                    and f in c.interpretation[rn]:
-                                contextualizable_boxes.append((box, c))
+            update_contextualizable_boxes(machine)
             if expansion_heuristic == ExpansionHeuristics.RANDOM:
                 # random lazy, one randomly chosen box
-                to_contextualize = [random.choice(contextualizable_boxes)] if contextualizable_boxes else []
+                to_contextualize = [contextualizable_boxes.choice()] if contextualizable_boxes else []
             elif expansion_heuristic == ExpansionHeuristics.ALL:
                 # exhaustive contextualization but ternary checking
-                to_contextualize = contextualizable_boxes
+                to_contextualize = list(contextualizable_boxes)
+            elif expansion_heuristic == ExpansionHeuristics.PRIORITY:
+                # lazy, the box with the lowest score
+                result = pop_priority_box(machine)
+                to_contextualize = [result] if result is not None else []
 
         if to_contextualize:
             # unpack box(es)
@@ -209,6 +397,18 @@ def check_lazy(machine, ctl, expansion_heuristic, randomize_nondeterminism=False
                     num_contexts_relabeled += 1
                 else:
                     num_contexts_built += 1
+                if expansion_heuristic != ExpansionHeuristics.GETNEXT:
+                    ref_component = last_component.box_mapping[last_box]
+                    box_callers[ref_component].add(last_component)
+                    changed_components.add(last_component)
+                    if not context_existed:
+                        for callee in ref_component.box_mapping.values():
+                            box_callers[callee].add(ref_component)
+                        changed_components.add(ref_component)
+                    if priority_queue is not None:
+                        depth = component_depths.get(last_component, 0) + 1
+                        if depth < component_depths.get(ref_component, depth + 1):
+                            component_depths[ref_component] = depth
         else:
             if expansion_heuristic == ExpansionHeuristics.GETNEXT:
                 # could not properly determine next box to determine by standard decision tree
@@ -221,39 +421,132 @@ def check_lazy(machine, ctl, expansion_heuristic, randomize_nondeterminism=False
                         path_formula = f.subformula(0)
                         if isinstance(path_formula, CTL.G):
                             # if we found a phi-cycle for EG phi, the CTL is true by definition
-                            component.interpretation[node][f] = True
+                            set_existential_value(component, node, f, True)
                         if isinstance(path_formula, CTL.U):
                             # here we found an phi1-and-not-phi2-cycle for E phi1 U phi 2
                             # further we checked all branches while searching the next box toi unpack through backtracking
                             # this means no phi2 is reachable and thus the CTL is false
-                            component.interpretation[node][f] = False
+                            set_existential_value(component, node, f, False)
             else:
                 # if GetNext was not used as expansion heuristic we can only safely do global cycle resolution
                 # for a formula if all its subformulas are known everywhere, so here we find such formulas
                 subformulas = get_subformulas(ctl)
+                demand = demanded_nodes(machine, ctl) if demand_driven else None
                 # iterate via range to guarantee correct order of depths
                 found_unknown = False
                 for depth in range(max(subformulas.keys()) + 1):
                     for f in subformulas[depth]:
+                        if f in retired_formulas:
+                            continue
                         for c in machine.contextualized_components:
-                            for n in c.base_component.nodes:
-                                if f not in c.interpretation[n]:
+                            for n in c.base_component.nodes if demand is None else demand[f].get(c, ()):
+                                if c.interpretation[n].get(f) is None:
                                     path_formula = f.subformula(0)
                                     if isinstance(path_formula, CTL.G):
                                         found_unknown = True
-                                        c.interpretation[n][f] = True
+                                        set_existential_value(c, n, f, True)
                                     if isinstance(path_formula, CTL.U):
                                         found_unknown = True
-                                        c.interpretation[n][f] = False
+                                        set_existential_value(c, n, f, False)
                     if found_unknown:
                         break
 
-        machine.remove_unreachable_components()
+        removed_components = remove_unreachable_components(machine)
+        if expansion_heuristic != ExpansionHeuristics.GETNEXT:
+            for c in removed_components:
+                changed_components.discard(c)
+                for box in c.base_component.boxes:
+                    contextualizable_boxes.discard((box, c))
         # update machine
         complete_machine_for_all_subformulas(machine, ctl)
+        if retire_subformulas:
+            drop_retired_subformulas(machine, ctl)
 
-    logging.debug("Built a total of " + str(num_contexts_built) + " contexts (plus " + str(num_contexts_relabeled) +
-                  " context relabels)")
+        if memory_profiler is not None:
+            memory_profiler.end_iteration()
+
+
+def box_value_determined(component, node):
+    """
+    Mark the components whose boxes may have become (un)contextualizable because the value of an existential formula
+    was determined in a return node or exit node of component. Installed as utils.on_box_value_determined.
+    """
+    if isinstance(node, rsm.BoxNode):
+        changed_components.add(component)
+    else:
+        changed_components.update(box_callers[component])
+
+
+def update_contextualizable_boxes(machine):
+    """
+    Update the index of contextualizable boxes for the boxes of the changed components. A box is contextualizable if one
+    of its return nodes knows one of the existential subformulas while the referenced component does not know it in the
+    corresponding exit node.
+    """
+    for c in changed_components:
+        # outdated callers may have been removed from the machine in the meantime
+        if c not in machine.contextualized_components:
+            continue
+        for box in c.base_component.boxes:
+            ref_component = c.box_mapping[box]
+            contextualizable = any(f in c.interpretation[rn] and f not in ref_component.interpretation[rn.node]
+                                   for rn in box.return_nodes for f in existential_subformulas)
+            if contextualizable:
+                contextualizable_boxes.add((box, c))
+                if priority_queue is not None and (box, c) not in priority_queued:
+                    score, _ = score_box(machine, box, c)
+                    heapq.heappush(priority_queue, (score, next(priority_numbers), box, c))
+                    priority_queued.add((box, c))
+            else:
+                contextualizable_boxes.discard((box, c))
+    changed_components.clear()
+
+
+def score_box(machine, box, c):
+    """
+    Score a contextualizable box for the PRIORITY heuristic, see priority_weights.
+
+    :param machine: the RSM containing the component
+    :param box: the box to score
+    :param c: the contextualized component containing the box
+    :return: the weighted score (lower is better) and the dictionary of the unweighted signals
+    """
+    ref_component = c.box_mapping[box]
+    context, _ = c.get_box_context(box)
+    context_exists = machine.get_contextualized_component(ref_component.base_component, context) is not None
+    num_values = len(box.call_nodes) * len(existential_subformulas)
+    num_known = sum(1 for cn in box.call_nodes for f in existential_subformulas if f in c.interpretation[cn])
+    signals = {
+        "size": len(ref_component.base_component.nodes) / max_component_size,
+        "build": 0 if context_exists else 1,
+        "known": num_known / num_values if num_values else 0,
+        "depth": component_depths.get(c, 0)
+    }
+    return sum(priority_weights[signal] * value for signal, value in signals.items()), signals
+
+
+def pop_priority_box(machine):
+    """
+    Take the contextualizable box with the lowest score from the priority queue. The score of the top box is
+    recomputed first, if it got worse than the score of the next box in the queue, the box is queued again instead.
+
+    :return: the (box, component) pair to contextualize next, or None if no box is contextualizable
+    """
+    while priority_queue:
+        _, _, box, c = heapq.heappop(priority_queue)
+        if (box, c) not in contextualizable_boxes:
+            priority_queued.discard((box, c))
+            continue
+        score, signals = score_box(machine, box, c)
+        if priority_queue and score > priority_queue[0][0]:
+            heapq.heappush(priority_queue, (score, next(priority_numbers), box, c))
+            continue
+        priority_queued.discard((box, c))
+        logger.debug("Contextualizing box " + box.name + " in component " + c.name + " with score " +
+                     format(score, ".3f") + " (" + ", ".join(k + " " + format(v, ".3g") for k, v in signals.items()) +
+                     ")")
+        return box, c
+    return None
 
 
 def find_next_necessary_context(machine, node, ctl, randomize_nondeterminism):
@@ -301,7 +594,7 @@ def find_next_necessary_context(machine, node, ctl, randomize_nondeterminism):
         if randomize_nondeterminism:
             random.shuffle(subformulas)
         for sub in subformulas:
-            if sub not in current_component.interpretation[node]:
+            if current_component.interpretation[node].get(sub) is None:
                 if cn_pair not in requested_nodes[sub]:
                     # reset double requested nodes since cycle detection only works if all subformulas are known
                     res = find_next_necessary_context(machine, node, sub, randomize_nondeterminism)
@@ -358,7 +651,7 @@ def find_next_necessary_context(machine, node, ctl, randomize_nondeterminism):
 
         if isinstance(path_formula, CTL.G):
             sub = path_formula.subformula(0)
-            if sub not in current_component.interpretation[node]:
+            if current_component.interpretation[node].get(sub) is None:
                 # reset double requested nodes since cycle detection only works if all subformulas are known
                 if cn_pair not in requested_nodes[sub]:
                     res = find_next_necessary_context(machine, node, sub, randomize_nondeterminism)
@@ -383,14 +676,14 @@ def find_next_necessary_context(machine, node, ctl, randomize_nondeterminism):
         elif isinstance(path_formula, CTL.U):
             sub1 = path_formula.subformula(0)
             sub2 = path_formula.subformula(1)
-            if sub2 not in current_component.interpretation[node]:
+            if current_component.interpretation[node].get(sub2) is None:
                 # reset double requested nodes since cycle detection only works if all subformulas are known
                 if cn_pair not in requested_nodes[sub2]:
                     res = find_next_necessary_context(machine, node, sub2, randomize_nondeterminism)
                     if res is not None:
                         requested_node_chain[ctl].pop()
                         return res
-            if sub1 not in current_component.interpretation[node]:
+            if current_component.interpretation[node].get(sub1) is None:
                 # reset double requested nodes since cycle detection only works if all subformulas are known
                 if cn_pair not in requested_nodes[sub1]:
                     res = find_next_necessary_context(machine, node, sub1, randomize_nondeterminism)
@@ -418,7 +711,7 @@ def find_next_necessary_context(machine, node, ctl, randomize_nondeterminism):
             if randomize_nondeterminism:
                 random.shuffle(successors)
             for succ in successors:
-                if sub not in current_component.interpretation[succ]:
+                if current_component.interpretation[succ].get(sub) is None:
                     # reset double requested nodes since cycle detection only works if all subformulas are known
                     if (current_component, succ) not in requested_nodes[ctl]:
                         res = find_next_necessary_context(machine, succ, sub, randomize_nondeterminism)
@@ -431,29 +724,144 @@ def find_next_necessary_context(machine, node, ctl, randomize_nondeterminism):
 
 def complete_machine_for_all_subformulas(machine, ctl):
     """
-    Deduce all subformulas in all nodes of machine as far as possible.
+    Deduce all subformulas in all nodes of machine as far as possible. In demand driven mode, only the nodes of the slice
+    that can influence the value of ctl in the initial node are evaluated.
     """
     global known_formulas
+    statistics = stats.current()
+    statistics.start("complete_machine")
     subformulas = get_subformulas(ctl)
+    demand = None
+    if demand_driven:
+        with statistics.phase("demand"):
+            demand = demanded_nodes(machine, ctl)
+        statistics.peak("demanded_values", sum(len(nodes) for d in demand.values() for nodes in d.values()))
     # formulas already checked in this run (in case a formula appears multiple times as a sb
     checked_formulas = set()
 
     # iterate via range to guarantee correct order of depths
     for depth in range(max(subformulas.keys()) + 1):
         for f in subformulas[depth]:
-            if f in checked_formulas or f in known_formulas:
+            if f in checked_formulas or f in known_formulas or f in retired_formulas:
                 continue
+            nodes = None
+            if demand is not None:
+                nodes = demand.get(f)
+                if nodes is None:
+                    continue
             if not isinstance(f, CTL.E):
-                f_known_in_all_nodes = True
-                for comp in machine.contextualized_components:
-                    for node in comp.base_component.nodes:
-                        determined_f_in_node = check_locally(node, comp, f)
-                        f_known_in_all_nodes = f_known_in_all_nodes and determined_f_in_node
-                        checked_formulas.add(f)
-                if f_known_in_all_nodes:
+                checked_formulas.add(f)
+                # in demand driven mode, only propositional formulas are checked in all nodes
+                if check_local_formula(machine, f, nodes=nodes) and (nodes is None or is_propositional(f)):
                     known_formulas.add(f)
             else:
-                check_existential_formula(machine, f)
+                check_existential_formula(machine, f, nodes=nodes)
                 checked_formulas.add(f)
                 if all(f in i for c in machine.contextualized_components for n, i in c.interpretation.items()):
                     known_formulas.add(f)
+
+    statistics.stop("complete_machine")
+
+
+def drop_retired_subformulas(machine, ctl):
+    """
+    Drop the values of the subformulas that are not needed anymore from the interpretations. A subformula is retired
+    once every formula it occurs in is known in all nodes or retired itself, since known values are never recomputed
+    (new contexts extend known components and inherit their values). The values of existential formulas in exit and
+    return nodes are kept, they make up the contexts, so contexts are still matched exactly. The compacted
+    interpretation dicts stay shared between the same components.
+
+    :param machine: the RSM whose interpretations are compacted
+    :param ctl: the formula being checked, it is never retired
+    :return: the set of subformulas retired by this call
+    """
+    statistics = stats.current()
+    subformulas = get_subformulas(ctl)
+
+    # a subformula is live if it occurs in a live formula which is not known in all nodes yet, superformulas come first
+    live = {ctl}
+    for depth in sorted(subformulas.keys(), reverse=True):
+        for f in subformulas[depth]:
+            if f not in live or f in known_formulas:
+                continue
+            if isinstance(f, CTL.AtomicProposition) or isinstance(f, CTL.Bool):
+                continue
+            path_formula = f.subformula(0) if isinstance(f, CTL.E) or isinstance(f, CTL.A) else f
+            live.update(path_formula.subformulas())
+    newly_retired = {f for formulas in subformulas.values() for f in formulas
+                     if f not in live and f not in retired_formulas}
+    if not newly_retired:
+        return newly_retired
+
+    statistics.start("retire")
+    in_context = {f for f in newly_retired if isinstance(f, CTL.E)}
+    # old and compacted dict by the id of the old dict, the old dict is kept alive such that its id is not reused
+    compacted = {}
+    num_entries = 0
+    num_bytes = 0
+    for c in machine.contextualized_components:
+        for node, node_interpretation in c.interpretation.items():
+            if id(node_interpretation) not in compacted:
+                if isinstance(node, rsm.BoxNode) and node.is_return_node or c.base_component.is_exit(node):
+                    dropped = newly_retired - in_context
+                else:
+                    dropped = newly_retired
+                if dropped.isdisjoint(node_interpretation):
+                    compacted_interpretation = node_interpretation
+                else:
+                    compacted_interpretation = rsm.NodeInterpretation(node_interpretation.propositional_values, node,
+                                                                      {f: v for f, v in node_interpretation.items()
+                                                                       if f not in dropped})
+                    num_entries += len(node_interpretation) - len(compacted_interpretation)
+                    num_bytes += sys.getsizeof(node_interpretation) - sys.getsizeof(compacted_interpretation)
+                compacted[id(node_interpretation)] = (node_interpretation, compacted_interpretation)
+            c.interpretation[node] = compacted[id(node_interpretation)][1]
+    retired_formulas.update(newly_retired)
+    statistics.stop("retire")
+
+    statistics.count("retired_formulas", len(newly_retired))
+    statistics.count("retired_entries", num_entries)
+    statistics.count("retired_bytes", num_bytes)
+    logger.debug("Retired " + str(len(newly_retired)) + " subformulas, dropping " + str(num_entries) +
+                 " interpretation entries (" + str(num_bytes) + " bytes)")
+    return newly_retired
+
+
+def remove_unreachable_components(machine):
+    """
+    Remove all unreachable contextualized components from the machine while keeping track of the peak size of the
+    contextualized machine and the time spent pruning.
+
+    :return: list of removed components
+    """
+    statistics = stats.current()
+    statistics.peak("contextualized_components", len(machine.contextualized_components))
+    statistics.peak("contextualized_nodes", sum(len(c.base_component.nodes) for c in machine.contextualized_components))
+    with statistics.phase("pruning"):
+        return machine.remove_unreachable_components()
+
+
+def record_context_counts():
+    """
+    Copy the number of built and relabeled contexts into the statistics of the current run.
+    """
+    statistics = stats.current()
+    statistics.counters["contexts_built"] = num_contexts_built
+    statistics.counters["contexts_relabeled"] = num_contexts_relabeled
+
+
+def known_fraction(machine, ctl):
+    """
+    Compute the fraction of (contextualized node, subformula) pairs whose truth value is known, e.g. to report the
+    progress of a check that was aborted.
+
+    :return: fraction between 0 and 1 (1 if the machine has no nodes)
+    """
+    subformulas = [f for formulas in get_subformulas(ctl).values() for f in formulas]
+    total = 0
+    known = 0
+    for c in machine.contextualized_components:
+        for i in c.interpretation.values():
+            total += len(subformulas)
+            known += sum(1 for f in subformulas if i.get(f) is not None or f in retired_formulas)
+    return known / total if total else 1.0
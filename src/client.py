@@ -0,0 +1,211 @@
+""" Check an RSM against CTL formulas on a running server (see server.py), with the same output as rsmcheck.py
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+# Unix socket the server listens on and the client connects to if no TCP port is given, defined here such that the
+# client does not have to import the checker
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "rsmcheck.sock")
+
+
+async def request(payload, socket_path=DEFAULT_SOCKET, port=None):
+    """
+    Send a request to the server and yield its replies as they arrive, see CheckServer for their format.
+
+    :param payload: the request as a dictionary
+    :param socket_path: the Unix socket of the server
+    :param port: the TCP port of the server on localhost, used instead of the socket if given
+    """
+    if port is not None:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    else:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    try:
+        writer.write(json.dumps(payload).encode() + b"\n")
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("The server closed the connection before the request was finished")
+            reply = json.loads(line)
+            yield reply
+            if reply.get("done") or ("error" in reply and "index" not in reply):
+                return
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def result_message(reply):
+    """
+    :param reply: the reply of the server for a formula
+    :return: the message rsmcheck.py prints for the result
+    """
+    location = str(reply["initial_node"]) + " (component " + str(reply["initial_component"]) + ")"
+    if reply["exceeded"] is None:
+        negation = " not" if reply["result"] is False else ""
+        return str(reply["result"]) + ": " + reply["formula"] + " does" + negation + " hold in " + location
+    if "error" in reply:
+        return "unknown/error: " + reply["formula"] + " could not be determined in " + location + ", " + reply["error"]
+    statistics = reply["statistics"]
+    counters = statistics["counters"]
+    return "unknown/" + reply["exceeded"] + ": " + reply["formula"] + " could not be determined in " + location + \
+        " within the budget, " + format(100 * statistics["info"].get("known_fraction", 0), ".1f") + \
+        "% of the subformulas are known after " + \
+        str(counters.get("lazy_iterations", counters.get("exhaustive_iterations", 0))) + " iterations and " + \
+        str(counters.get("contexts_built", 0)) + " contexts built"
+
+
+async def check(args, priority_weights):
+    if args.strategy is not None:
+        strategy = args.strategy
+    elif args.exhaustive:
+        strategy = "exhaustive"
+    elif args.prestar:
+        strategy = "prestar"
+    else:
+        strategy = args.expansion_heuristic
+    payload = {"model": os.path.abspath(args.path_to_rsm), "ctl": os.path.abspath(args.path_to_ctl),
+               "strategy": strategy, "sequential": not args.no_sequential, "deduplicate": args.deduplicate,
+               "reduce": args.reduce, "demand": args.demand, "priority_weights": priority_weights,
+               "randomize_nondeterminism": args.randomize_nondeterminism,
+               "witness_format": args.witness_format if args.witness else None, "maxtime": args.maxtime,
+               "maxmem": args.maxmem, "maxtime_total": args.maxtime_total}
+
+    print("Checking RSM " + args.path_to_rsm + " against properties " + args.path_to_ctl)
+    # the results arrive as soon as they are known, but are printed in the order of the formulas
+    replies = {}
+    next_index = 1
+    async for reply in request(payload, args.socket, args.port):
+        if "error" in reply and "index" not in reply:
+            print("Error: " + reply["error"], file=sys.stderr)
+            return 1
+        if "index" not in reply:
+            continue
+        replies[reply["index"]] = reply
+        while next_index in replies:
+            reply = replies.pop(next_index)
+            print("checking CTL", next_index)
+            print(result_message(reply))
+            if args.stats and reply["statistics"] is not None:
+                statistics = reply["statistics"]
+                statistics["info"].update({
+                    "rsm": args.path_to_rsm,
+                    "ctl": args.path_to_ctl,
+                    "index": next_index,
+                    "formula": reply["formula"],
+                    "result": reply["result"],
+                    "exceeded": reply["exceeded"],
+                    "strategy": reply["strategy"],
+                    "randomize_nondeterminism": args.randomize_nondeterminism,
+                    "demand_driven": args.demand
+                })
+                with open(args.stats_file, 'a') as f:
+                    f.write(json.dumps(statistics))
+                    f.write("\n")
+            if "witness" in reply:
+                with open(args.witness_file, 'a') as f:
+                    f.write(reply["witness"])
+            next_index += 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check an RSM against a CTL on a running server, see server.py")
+    parser.add_argument("path_to_rsm", help="input .rsm file")
+    parser.add_argument("path_to_ctl", help="input .ctl file")
+    parser.add_argument("-socket",
+                        default=DEFAULT_SOCKET,
+                        help="Unix socket of the server (default: " + DEFAULT_SOCKET + ")")
+    parser.add_argument("-port",
+                        type=int,
+                        help="connect to the server on this TCP port of localhost instead of the Unix socket")
+    parser.add_argument("-exhaustive",
+                        action="store_true",
+                        help="use exhaustive checking approach")
+    parser.add_argument("-prestar",
+                        action="store_true",
+                        help="check exactly by pre* saturation, also for RSMs with recursion")
+    parser.add_argument("-no_sequential",
+                        action="store_true",
+                        help="use the lazy or exhaustive approach also for RSMs without recursion")
+    parser.add_argument("-expansion_heuristic",
+                        default="getnext",
+                        help="expansion heuristic for lazy checking, see rsmcheck.py")
+    parser.add_argument("-strategy",
+                        help="check with this strategy as for -portfolio of rsmcheck.py, e.g. random@1, instead of "
+                             "the one given by the other options")
+    parser.add_argument("-priority_weights",
+                        nargs="+",
+                        metavar="SIGNAL=WEIGHT",
+                        help="weights of the signals boxes are scored by in the priority heuristic, see rsmcheck.py")
+    parser.add_argument("-demand",
+                        action="store_true",
+                        help="only evaluate the subformulas in the states that can influence the value of the formula "
+                             "in the initial node")
+    parser.add_argument("-deduplicate",
+                        action="store_true",
+                        help="merge components that only differ in the names of their nodes and boxes when loading the "
+                             "RSM")
+    parser.add_argument("-reduce",
+                        action="store_true",
+                        help="reduce the RSM w.r.t. the atomic propositions of each formula before checking it")
+    parser.add_argument("-randomize_nondeterminism",
+                        action="store_true",
+                        help="randomize nondeterministic choices in GetNextExpansion")
+    parser.add_argument("-maxmem",
+                        type=float,
+                        default=0,
+                        help="maximal amount of MB before memout of a formula (default: 0 = no limit)")
+    parser.add_argument("-maxtime",
+                        type=float,
+                        default=0,
+                        help="maximal wall-clock time in minutes for checking a single formula (default: 0 = no "
+                             "limit)")
+    parser.add_argument("-maxtime_total",
+                        type=float,
+                        default=0,
+                        help="maximal wall-clock time in minutes for checking all formulas (default: 0 = no limit)")
+    parser.add_argument("-witness",
+                        action="store_true",
+                        help="generate witness paths for the computed results")
+    parser.add_argument("-witness_file",
+                        default="witness.log",
+                        help="witness file name")
+    parser.add_argument("-witness_format",
+                        choices=["text", "jsonl"],
+                        default="text",
+                        help="format of the witness file, see rsmcheck.py")
+    parser.add_argument("-stats",
+                        action="store_true",
+                        help="write a JSON report with phase timings and counters for each formula")
+    parser.add_argument("-stats_file",
+                        default="stats.jsonl",
+                        help="statistics file name, one JSON report per line")
+    args = parser.parse_args()
+    if args.demand and args.witness:
+        parser.error("-demand cannot be combined with -witness")
+    if args.reduce and args.witness:
+        parser.error("-reduce cannot be combined with -witness")
+    # the signals are validated by the server, which knows the priority heuristic
+    priority_weights = {}
+    for weight in args.priority_weights or []:
+        signal, _, value = weight.partition("=")
+        try:
+            priority_weights[signal] = float(value)
+        except ValueError:
+            parser.error("invalid weight " + value + " for signal " + signal + " in -priority_weights")
+    try:
+        sys.exit(asyncio.run(check(args, priority_weights)))
+    except (ConnectionError, FileNotFoundError) as e:
+        print("Cannot reach the server: " + str(e), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
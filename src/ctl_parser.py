@@ -19,11 +19,19 @@ def parse_ctl(path_to_file):
             # skip comments and empty lines
             if line.startswith("#") or len(line) == 0 or line == " ":
                 continue
-            parser = CTL.parser.Parser()
-            formula = parser(line)
-            formula = formula.get_equivalent_restricted_formula()
-            join_same_subformulas(formula)
-            yield formula
+            yield parse_ctl_formula(line)
+
+
+def parse_ctl_formula(line):
+    """
+    :param line: a single CTL formula in the syntax of the .ctl files
+    :return: the equivalent restricted formula, in which equal subformulas are the same object
+    """
+    parser = CTL.parser.Parser()
+    formula = parser(line)
+    formula = formula.get_equivalent_restricted_formula()
+    join_same_subformulas(formula)
+    return formula
 
 
 def join_same_subformulas(ctl):
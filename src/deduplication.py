@@ -0,0 +1,238 @@
+""" Merge structurally identical base components of an RSM, i.e., components that only differ in the names of their
+nodes and boxes
+"""
+
+from collections import Counter, defaultdict
+from model import rsm
+
+# maximal number of discrete colorings visited when searching for the canonical form of a component
+max_canonical_leaves = 64
+
+
+def refine_node_colors(component, palette, component_classes, node_indices):
+    """
+    Color the nodes of a component by color refinement: initially by their labels, entry/exit flags and kind (for box
+    nodes also the class of the referenced component and the canonical index of the referenced node), then see
+    refine_colors.
+
+    :param component: the base component
+    :param palette: dictionary assigning a number to each color, shared by all components such that the colors of
+    different components are comparable
+    :param component_classes: dictionary mapping each base component to its current class
+    :param node_indices: dictionary mapping base components to the canonical indices of their nodes, may be incomplete
+    :return: dictionary mapping each node to its color
+    """
+    colors = {}
+    for node in component.nodes:
+        if isinstance(node, rsm.BoxNode):
+            callee = node.box.component
+            color = ("call" if node.is_call_node else "return", tuple(sorted(component.get_labels(node))),
+                     component_classes[callee], node_indices.get(callee, {}).get(node.node))
+        else:
+            color = ("node", tuple(sorted(component.get_labels(node))), component.is_entry(node),
+                     component.is_exit(node))
+        colors[node] = palette.setdefault(color, len(palette))
+    return refine_colors(component, palette, colors)
+
+
+def refine_colors(component, palette, colors):
+    """
+    Repeatedly refine the colors of the nodes of a component by the colors of their successors and of the other nodes
+    of their box until the colors do not change anymore.
+
+    :param component: the base component
+    :param palette: the shared palette, see refine_node_colors
+    :param colors: dictionary mapping each node to its initial color
+    :return: dictionary mapping each node to its refined color
+    """
+    box_nodes = {box: box.call_nodes | box.return_nodes for box in component.boxes}
+    num_colors = len(set(colors.values()))
+    while True:
+        refined = {}
+        for node in component.nodes:
+            siblings = box_nodes[node.box] if isinstance(node, rsm.BoxNode) else ()
+            color = (colors[node], tuple(sorted(colors[s] for s in component.transitions[node])),
+                     tuple(sorted(colors[s] for s in siblings)))
+            refined[node] = palette.setdefault(color, len(palette))
+        colors = refined
+        if len(set(colors.values())) == num_colors:
+            return colors
+        num_colors = len(set(colors.values()))
+
+
+def canonical_form(component, palette, colors, budget=None):
+    """
+    Compute a canonical order of the nodes of a component. As long as some nodes share a color, each node of the
+    smallest such color is individualized in turn, the colors are refined again and the smallest resulting form is
+    taken. The search is cut off after max_canonical_leaves discrete colorings (then the remaining branches only follow
+    the first node), so the resulting isomorphisms have to be verified.
+
+    :param component: the base component
+    :param palette: the shared palette, see refine_node_colors
+    :param colors: the refined colors of its nodes, see refine_node_colors
+    :param budget: list holding the number of discrete colorings that may still be visited, for recursive calls
+    :return: the canonical order of the nodes and the canonical form of the component
+    """
+    if budget is None:
+        budget = [max_canonical_leaves]
+    if len(set(colors.values())) == len(component.nodes):
+        budget[0] -= 1
+        order = sorted(component.nodes, key=colors.get)
+        index = {node: i for i, node in enumerate(order)}
+        form = (tuple(colors[node] for node in order),
+                tuple(tuple(sorted(index[s] for s in component.transitions[node])) for node in order),
+                tuple(sorted(tuple(sorted(index[bn] for bn in box.call_nodes | box.return_nodes))
+                             for box in component.boxes)))
+        return order, form
+
+    cells = defaultdict(list)
+    for node in component.nodes:
+        cells[colors[node]].append(node)
+    color = min(c for c, nodes in cells.items() if len(nodes) > 1)
+    best_order, best_form = None, None
+    for node in cells[color]:
+        if best_form is not None and budget[0] <= 0:
+            break
+        individualized = dict(colors)
+        individualized[node] = palette.setdefault(("individualized", color), len(palette))
+        order, form = canonical_form(component, palette, refine_colors(component, palette, individualized), budget)
+        if best_form is None or form < best_form:
+            best_order, best_form = order, form
+    return best_order, best_form
+
+
+def is_isomorphism(component, representative, mapping, node_maps):
+    """
+    Check that mapping is an isomorphism from component to representative, where the nodes of referenced components
+    are compared by their counterparts in the representatives of their classes.
+
+    :param node_maps: dictionary mapping each merged base component to the mapping of its nodes to the nodes of its
+    representative
+    """
+    box_mapping = {}
+    for node, image in mapping.items():
+        if component.get_labels(node) != representative.get_labels(image) or \
+                Counter(mapping[s] for s in component.transitions[node]) != Counter(representative.transitions[image]):
+            return False
+        if isinstance(node, rsm.BoxNode):
+            if not isinstance(image, rsm.BoxNode) or node.is_call_node != image.is_call_node or \
+                    box_mapping.setdefault(node.box, image.box) is not image.box:
+                return False
+            callee_node = node_maps.get(node.box.component, {}).get(node.node, node.node)
+            image_callee_node = node_maps.get(image.box.component, {}).get(image.node, image.node)
+            if callee_node is not image_callee_node:
+                return False
+        elif isinstance(image, rsm.BoxNode) or component.is_entry(node) != representative.is_entry(image) or \
+                component.is_exit(node) != representative.is_exit(image):
+            return False
+    return True
+
+
+def redirect_box(box, representative, node_map):
+    """
+    Let a box reference the representative of its component instead, using node_map to translate its call and return
+    nodes.
+    """
+    caller = box.parent_component
+    for bn in box.call_nodes | box.return_nodes:
+        node = node_map[bn.node]
+        node_dict, name_dict = (caller.call_node_dict, caller.call_node_name_dict) if bn.is_call_node else \
+            (caller.return_node_dict, caller.return_node_name_dict)
+        del node_dict[(box, bn.node)]
+        del name_dict[(box.name, bn.node.name)]
+        node_dict[(box, node)] = bn
+        name_dict[(box.name, node.name)] = bn
+        bn.node = node
+        caller.nodes[bn]["labels"] = representative.nodes[node]["labels"]
+        caller.box_nodes[bn]["labels"] = representative.nodes[node]["labels"]
+    box.component = representative
+    box.entry_nodes = [node_map[n] for n in box.entry_nodes]
+    box.exit_nodes = [node_map[n] for n in box.exit_nodes]
+
+
+def merge_isomorphic_components(machine):
+    """
+    Merge the base components of a freshly parsed RSM that are isomorphic, i.e., have the same labels, entry and exit
+    nodes and transitions, and whose boxes reference isomorphic components, up to the names of nodes and boxes. Each
+    class of isomorphic components is represented by one of them (the initial component, if it is in the class), and
+    the boxes referencing the others are redirected to it, so they share contexts and fixpoint work. The canonical form
+    is computed by color refinement on the nodes, alternated with refining the classes of components until the classes
+    are stable. Only isomorphisms that pass verification are used for merging. The structural hash of each
+    component is stored in Component.structural_hash, and the contextualized components are recreated with the empty
+    context.
+
+    :param machine: the RSM as returned by parse_rsm
+    :return: the number of removed base components
+    """
+    initial_component = machine.initial_component.base_component
+    components = sorted(machine.base_components, key=lambda c: c.name)
+    classes = {c: 0 for c in components}
+    node_indices = {}
+    forms = {}
+    num_classes = 1
+    while True:
+        palette = {}
+        form_numbers = {}
+        new_classes = {}
+        new_node_indices = {}
+        colorings = {c: refine_node_colors(c, palette, classes, node_indices) for c in components}
+        invariants = {c: tuple(sorted(colors.values())) for c, colors in colorings.items()}
+        num_invariants = Counter(invariants.values())
+        for c in components:
+            if num_invariants[invariants[c]] == 1:
+                # no other component can be isomorphic, so any order of the nodes will do
+                order, form = list(c.nodes), ("unique", invariants[c])
+            else:
+                order, form = canonical_form(c, palette, colorings[c])
+            new_node_indices[c] = {node: i for i, node in enumerate(order)}
+            forms[c] = form
+            new_classes[c] = form_numbers.setdefault(form, len(form_numbers))
+        classes = new_classes
+        node_indices = new_node_indices
+        # the partition of the components only gets finer, so it is stable once the number of classes is
+        if len(form_numbers) == num_classes:
+            break
+        num_classes = len(form_numbers)
+
+    members = defaultdict(list)
+    for c in components:
+        c.structural_hash = hash(forms[c])
+        members[classes[c]].append(c)
+
+    node_maps = {}
+    representatives = {}
+    for class_members in members.values():
+        if len(class_members) == 1:
+            continue
+        representative = initial_component if initial_component in class_members else class_members[0]
+        order = sorted(representative.nodes, key=node_indices[representative].get)
+        for c in class_members:
+            if c is not representative:
+                node_maps[c] = {node: order[i] for node, i in node_indices[c].items()}
+                representatives[c] = representative
+    # the isomorphisms are only trusted if they are consistent with each other, not merging a component may break the
+    # isomorphism of its callers
+    verified = False
+    while not verified:
+        verified = True
+        for c in list(representatives):
+            if not is_isomorphism(c, representatives[c], node_maps[c], node_maps):
+                del representatives[c]
+                del node_maps[c]
+                verified = False
+    if not representatives:
+        return 0
+
+    for c in components:
+        if c in representatives:
+            continue
+        for box in c.boxes:
+            if box.component in representatives:
+                redirect_box(box, representatives[box.component], node_maps[box.component])
+    for c in representatives:
+        machine.base_components.remove(c)
+        del machine.base_component_dict[c.name]
+    machine._call_graph_sccs = None
+    machine.exit_summaries = None
+    machine.contextualize_base_components()
+    return len(representatives)
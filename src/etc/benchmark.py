@@ -0,0 +1,282 @@
+"""
+script to benchmark the checker on a fixed set of models and compare the results against a saved baseline
+must be used from the src folder, e.g. like this:
+python3 etc/benchmark.py -out ../baseline.json
+python3 etc/benchmark.py -baseline ../baseline.json -threshold 20
+for all options use
+python3 etc/benchmark.py -h
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_DIR = os.path.join(os.path.dirname(SRC_DIR), "models")
+
+# RSMs without recursion are checked by the sequential approach unless it is disabled
+HEURISTICS = {
+    "getnext": ["-no_sequential", "-expansion_heuristic", "getnext"],
+    "random": ["-no_sequential", "-expansion_heuristic", "random"],
+    "all": ["-no_sequential", "-expansion_heuristic", "all"],
+    "priority": ["-no_sequential", "-expansion_heuristic", "priority"],
+    "exhaustive": ["-no_sequential", "-exhaustive"],
+    "sequential": [],
+    "portfolio": ["-portfolio"]
+}
+
+# labels of the RSMs in models/random, see the README
+RANDOM_LABELS = ["-label", "a", "40", "-label", "b", "60", "-label", "c", "50"]
+
+
+def collect_model_cases():
+    """
+    :return: list of (name, rsm, ctl) for each RSM in models/ and each CTL file whose name starts with the RSM's name
+    """
+    cases = []
+    for path_to_rsm in sorted(glob.glob(os.path.join(MODELS_DIR, "*.rsm"))):
+        rsm_name = os.path.basename(path_to_rsm)[:-4]
+        for path_to_ctl in sorted(glob.glob(os.path.join(MODELS_DIR, rsm_name + "*.ctl"))):
+            ctl_name = os.path.basename(path_to_ctl)[:-4]
+            cases.append(("models/" + rsm_name + "/" + ctl_name, path_to_rsm, path_to_ctl))
+    return cases
+
+
+def generate_random_cases(work_dir, sizes, ctl_numbers, seed):
+    """
+    Generate the i-th random RSM for each size i with the same parameters as the ones in models/random, i.e.,
+    i components with 3i nodes and i/3 boxes each, 5% entry and exit nodes and a transition density of 20%.
+
+    :return: list of (name, rsm, ctl) pairing each generated RSM with each selected CTL file of models/random
+    """
+    cases = []
+    for size in sizes:
+        path_to_rsm = os.path.join(work_dir, "random_" + str(size) + ".rsm")
+        subprocess.run([sys.executable, os.path.join(SRC_DIR, "etc", "random_rsm.py"),
+                        str(size), str(3 * size), "5", "5", str(size // 3), "20"] + RANDOM_LABELS +
+                       ["-seed", str(seed + size), "-out", path_to_rsm],
+                       cwd=SRC_DIR, check=True, stdout=subprocess.DEVNULL)
+        for number in ctl_numbers:
+            path_to_ctl = os.path.join(MODELS_DIR, "random", str(number) + ".ctl")
+            cases.append(("random/" + str(size) + "/" + str(number), path_to_rsm, path_to_ctl))
+    return cases
+
+
+def extract_pdmu_cases(work_dir, names, full):
+    """
+    Extract the RSMs of models/PDMUs along with the single use-def formula (or all use-def formulas if full is set).
+
+    :return: list of (name, rsm, ctl)
+    """
+    cases = []
+    ctl_suffix = "_usedef.ctl" if full else "_single_usedef.ctl"
+    for name in names:
+        with zipfile.ZipFile(os.path.join(MODELS_DIR, "PDMUs", name + ".zip")) as z:
+            z.extract(name + ".rsm", work_dir)
+            z.extract(name + ctl_suffix, work_dir)
+        cases.append(("pdmu/" + name + "/" + ctl_suffix[1:-4],
+                      os.path.join(work_dir, name + ".rsm"), os.path.join(work_dir, name + ctl_suffix)))
+    return cases
+
+
+def run_once(path_to_rsm, path_to_ctl, heuristic, seed, work_dir, timeout):
+    """
+    Run rsmcheck.py once in a separate process and collect the statistics of all formulas in the CTL file.
+
+    :return: dictionary with the status ("ok", "timeout" or "error"), the checking time summed over all formulas (in
+    seconds), the number of contexts built summed over all formulas, the peak memory (in bytes) and the results
+    """
+    stats_file = os.path.join(work_dir, "stats.jsonl")
+    if os.path.exists(stats_file):
+        os.remove(stats_file)
+    try:
+        process = subprocess.run([sys.executable, os.path.join(SRC_DIR, "rsmcheck.py"), path_to_rsm, path_to_ctl,
+                                  "-log", os.path.join(work_dir, "benchmark.log"), "-stats", "-stats_file", stats_file,
+                                  "-seed", str(seed)] + HEURISTICS[heuristic],
+                                 cwd=work_dir, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"status": "timeout"}
+    if process.returncode != 0:
+        error = process.stderr.strip().splitlines()
+        return {"status": "error", "error": error[-1] if error else "exit code " + str(process.returncode)}
+
+    with open(stats_file) as f:
+        reports = [json.loads(line) for line in f]
+    return {
+        "status": "ok",
+        "time": sum(r["phases"]["checking"]["time"] for r in reports),
+        "contexts_built": sum(r["counters"].get("contexts_built", 0) for r in reports),
+        "memory": max((r["peaks"].get("memory", 0) for r in reports), default=0),
+        "results": [r["info"]["result"] for r in reports]
+    }
+
+
+def run_case(path_to_rsm, path_to_ctl, heuristic, repeat, work_dir, timeout):
+    """
+    Run a case repeat times and aggregate the runs by their median.
+    Each repetition uses its index as seed for the random choices of the checker.
+    """
+    runs = []
+    for i in range(repeat):
+        run = run_once(path_to_rsm, path_to_ctl, heuristic, i, work_dir, timeout)
+        if run["status"] != "ok":
+            return run
+        runs.append(run)
+    return {
+        "status": "ok",
+        "time": statistics.median(r["time"] for r in runs),
+        "times": [r["time"] for r in runs],
+        "contexts_built": statistics.median(r["contexts_built"] for r in runs),
+        "memory": statistics.median(r["memory"] for r in runs),
+        "results": runs[0]["results"]
+    }
+
+
+def compare(results, baseline, threshold, min_time):
+    """
+    Compare the results of a benchmark run against a baseline.
+
+    :param threshold: relative increase in percent of the median time, memory or contexts built considered a regression
+    :param min_time: absolute increase of the median time in seconds below which timing differences are ignored
+    :return: list of human readable regressions
+    """
+    regressions = []
+    factor = 1 + threshold / 100
+    for key, new in results.items():
+        if key not in baseline:
+            continue
+        old = baseline[key]
+        if old["status"] != "ok":
+            continue
+        if new["status"] != "ok":
+            regressions.append(key + ": " + new["status"] + " (baseline: ok)")
+            continue
+        if new["results"] != old["results"]:
+            regressions.append(key + ": results changed from " + str(old["results"]) + " to " + str(new["results"]))
+        if new["time"] > old["time"] * factor and new["time"] - old["time"] > min_time:
+            regressions.append(key + ": median time increased from " + format(old["time"], ".3f") + "s to " +
+                               format(new["time"], ".3f") + "s")
+        if new["contexts_built"] > old["contexts_built"] * factor:
+            regressions.append(key + ": contexts built increased from " + str(old["contexts_built"]) + " to " +
+                               str(new["contexts_built"]))
+        if new["memory"] > old["memory"] * factor:
+            regressions.append(key + ": peak memory increased from " + format(old["memory"] / 2**20, ".1f") +
+                               "MB to " + format(new["memory"] / 2**20, ".1f") + "MB")
+    return regressions
+
+
+def print_row(key, result, old=None):
+    if result["status"] != "ok":
+        print(f"{key:<60} {result['status']}")
+        return
+    line = f"{key:<60} {result['time']:>9.3f}s {result['contexts_built']:>8g} ctx {result['memory'] / 2**20:>8.1f}MB"
+    if old is not None and old["status"] == "ok" and old["time"] > 0:
+        line += f" {100 * (result['time'] - old['time']) / old['time']:>+7.1f}%"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the checker and compare against a baseline")
+    parser.add_argument("-suites",
+                        nargs="+",
+                        choices=["models", "random", "pdmu"],
+                        default=["models", "random", "pdmu"],
+                        help="which sets of models to run: the RSMs in models/, generated random RSMs checked "
+                             "against CTLs of models/random, and the RSMs in models/PDMUs")
+    parser.add_argument("-heuristics",
+                        nargs="+",
+                        choices=list(HEURISTICS),
+                        default=list(HEURISTICS),
+                        help="expansion heuristics to run each case with (exhaustive is the exhaustive approach, "
+                             "sequential the default behaviour, i.e., the sequential approach for RSMs without "
+                             "recursion)")
+    parser.add_argument("-repeat", type=int, default=3, help="number of repetitions of each case")
+    parser.add_argument("-timeout", type=int, default=600, help="timeout in seconds for a single run")
+    parser.add_argument("-random_sizes",
+                        nargs="+",
+                        type=int,
+                        default=[5, 10, 15, 20],
+                        help="sizes i of the generated random RSMs (i components with 3i nodes and i/3 boxes each)")
+    parser.add_argument("-random_ctls",
+                        nargs="+",
+                        type=int,
+                        default=[5, 15, 25, 35, 45],
+                        help="numbers of the CTL files in models/random to check the random RSMs against")
+    parser.add_argument("-seed", type=int, default=0, help="seed used for generating the random RSMs")
+    parser.add_argument("-pdmu",
+                        nargs="+",
+                        default=["dataflow", "avroraReg", "avroraMedTest", "avroraELF"],
+                        help="names of the PDMU examples to run, also available: dom2pdf fop2pdf")
+    parser.add_argument("-full_pdmu",
+                        action="store_true",
+                        help="check the PDMU examples against all use-def formulas instead of a single one")
+    parser.add_argument("-work_dir", help="directory for generated models and logs (default: temporary directory)")
+    parser.add_argument("-out", help="save the results as JSON, e.g. to be used as a baseline later on")
+    parser.add_argument("-baseline", help="JSON file of an earlier benchmark run to compare against")
+    parser.add_argument("-threshold",
+                        type=float,
+                        default=20,
+                        help="relative increase in percent of median time, memory or contexts built that is "
+                             "considered a regression")
+    parser.add_argument("-min_time",
+                        type=float,
+                        default=0.1,
+                        help="ignore increases of the median time smaller than this many seconds")
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = os.path.abspath(args.work_dir or tmp_dir)
+        os.makedirs(work_dir, exist_ok=True)
+
+        cases = []
+        if "models" in args.suites:
+            cases += collect_model_cases()
+        if "random" in args.suites:
+            cases += generate_random_cases(work_dir, args.random_sizes, args.random_ctls, args.seed)
+        if "pdmu" in args.suites:
+            cases += extract_pdmu_cases(work_dir, args.pdmu, args.full_pdmu)
+
+        baseline = {}
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)["cases"]
+
+        results = {}
+        for name, path_to_rsm, path_to_ctl in cases:
+            for heuristic in args.heuristics:
+                key = name + "|" + heuristic
+                results[key] = run_case(path_to_rsm, path_to_ctl, heuristic, args.repeat, work_dir, args.timeout)
+                print_row(key, results[key], baseline.get(key))
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(json.dumps({
+                "meta": {
+                    "python": platform.python_implementation() + " " + platform.python_version(),
+                    "platform": platform.platform(),
+                    "repeat": args.repeat,
+                    "seed": args.seed
+                },
+                "cases": results
+            }, indent=4))
+
+    if args.baseline:
+        regressions = compare(results, baseline, args.threshold, args.min_time)
+        if regressions:
+            print(str(len(regressions)) + " regressions compared to " + args.baseline + ":")
+            for r in regressions:
+                print("    " + r)
+            sys.exit(1)
+        print("No regressions compared to " + args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,9 @@
 import argparse
 import collections
 import sys
-sys.path.append("..")
+sys.path.append(".")
 try:
-    from src.model import rsm
+    from model import rsm
 except ImportError:
     print("This script has to be run from the src folder, e.g. like this:\n"
           "python3 etc/jimple_convert.py ../models/j2p.out")
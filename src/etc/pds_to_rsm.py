@@ -14,9 +14,9 @@ leading white spaces are allowed
 import sys
 import argparse
 import json
-sys.path.append("..")
+sys.path.append(".")
 try:
-    from src.model import rsm
+    from model import rsm
 except ImportError:
     print("This script has to be run from the src folder, e.g. like this:\n"
           "python3 etc/pds_to_rsm.py ../models/10.pds")
@@ -183,15 +183,15 @@ def write_rsm(path_to_file, machine, pretty=False):
             if isinstance(n, rsm.Node):
                 node_dict = component.nodes[n]
                 node_dict["name"] = n.name
-                node_dict["labels"] = list(node_dict["labels"])
+                node_dict["labels"] = sorted(node_dict["labels"])
                 component_dict["nodes"].append(node_dict)
 
         for b in component.boxes:
             box_dict = {
                 "name": b.name,
                 "component": b.component.name,
-                "call_nodes": [n.name for n in b.call_nodes],
-                "return_nodes": [n.name for n in b.return_nodes]
+                "call_nodes": [n.name for n in b.entry_nodes],
+                "return_nodes": [n.name for n in b.exit_nodes]
             }
             component_dict["boxes"].append(box_dict)
 
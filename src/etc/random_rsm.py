@@ -1,120 +1,209 @@
 """
-script to create a random RSM
+script to create a random RSM, or a family of random RSMs scaled along one parameter
 must be used from the src folder, e.g. like this:
-python3 etc/random_rsm.py 3 20 15 15 5 20 -label a 30 -label b 60 -out ../models/random.rsm
+python3 etc/random_rsm.py 3 20 15 15 5 20 -label a 30 -label b 60 -seed 42 -out ../models/random.rsm
+python3 etc/random_rsm.py 3 20 15 15 5 20 -label a 30 -seed 42 -sweep nodes 10 20 40 80 -out ../models/random.rsm
 for meaning of the numbers use
 python3 etc/random_rsm.py -h
+
+it can also be imported as a library (with src on the path), see generate_rsm and generate_family
 """
 
 import argparse
 import sys
-from random import random, randint
+from random import Random
 from pds_to_rsm import write_rsm
-sys.path.append("..")
+sys.path.append(".")
 try:
-    from src.model import rsm
+    from model import rsm
 except ImportError:
     print("This script has to be run from the src folder, e.g. like this:\n"
           "python3 etc/random_rsm.py 3 20 15 15 5 20 -label a 30 -label b 60 -out ../models/random.rsm")
     exit()
 
-parser = argparse.ArgumentParser(description="Create a random RSM")
-parser.add_argument("nr_components", help="number of components in the RSM")
-parser.add_argument("nr_nodes", help="number of nodes in each component (not including box nodes)")
-parser.add_argument("entry_pct", help="percentage of nodes that shall be entry nodes")
-parser.add_argument("exit_pct", help="percentage of non-entry nodes that shall be exit nodes")
-parser.add_argument("nr_boxes", help="number of boxes per component")
-parser.add_argument("transition_pct", help="percentage of possible outgoing transitions existing per node")
-parser.add_argument("-label", help="add a label to a certain percentage of nodes in each component."
-                                   "first argument is label name, second is percentage.",
-                    action="append",
-                    nargs=2)
-parser.add_argument("-out", help="output location of the RSM", default="random.rsm")
-
-args = parser.parse_args()
-nr_components = int(args.nr_components)
-nr_nodes = int(args.nr_nodes)
-entry_pct = int(args.entry_pct)
-exit_pct = int(args.exit_pct)
-nr_boxes = int(args.nr_boxes)
-transition_pct = int(args.transition_pct)
-labels = args.label
-out = args.out
-
-machine = rsm.RSM()
-
-components = [rsm.Component("c"+str(i)) for i in range(nr_components)]
-machine.components = components
-machine.initial_component = components[0]
-
-for i, c in enumerate(components):
-    for j in range(nr_nodes):
-        node = rsm.Node("n" + str(i) + "_" + str(j))
-        c.add_node(node)
-        if j == 0:
-            c.make_entry_node(node)
-        elif j == 1:
-            c.make_exit_node(node)
-        elif random() < entry_pct / 100:
-            c.make_entry_node(node)
-        elif random() < entry_pct / 100:
-            c.make_exit_node(node)
-        for lbl, pct in labels:
-            if random() < float(pct) / 100:
-                c.add_label(node, lbl)
-
-for i, c in enumerate(components):
-    for j in range(nr_boxes):
-        ref_index = randint(0, nr_components-1)
-        ref_component = machine.components[ref_index]
-        box = rsm.Box(ref_component, "b" + str(i) + "_" + str(j))
-        c.add_box(box)
-
-for c in components:
-
-    # we sort nodes to form a total order
-    # the box-nodes for each box will be adjacent in the order, i.e., act as one node
-    # transitions will only be allowed to go forward according to this order
-    sorted_nodes = []
-
-    for n in c.nodes:
-        # don't add box nodes for now
-        if isinstance(n, rsm.BoxNode):
-            continue
-        # don't add entry/exit nodes as they have to be first/last in ordering
-        if c.is_entry(n) or c.is_exit(n):
-            continue
-        # insert node at random spot
-        sorted_nodes.insert(randint(0, len(sorted_nodes)), n)
-
-    bn_insertions = []
-    for box in c.boxes:
-        bns = box.call_nodes + box.return_nodes
-        insertion_index = randint(0, len(sorted_nodes))
-        bn_insertions.append((insertion_index, bns))
-    # sort the insertion list by indices, s.t. we insert the box-node furthest back first to not mess up other indices
-    bn_insertions.sort(reverse=True, key=lambda x: x[0])
-    for index, box_nodes in bn_insertions:
-        for bn in box_nodes:
-            sorted_nodes.insert(index, bn)
-
-    # insert entry and exit nodes at the front/back
-    for n in c.nodes:
-        # don't add entry/exit nodes as they have to be first/last in ordering
-        if c.is_entry(n):
-            sorted_nodes.insert(0, n)
-        elif c.is_exit(n):
-            sorted_nodes.append(n)
-
-    for i, source in enumerate(sorted_nodes):
-        if c.is_exit(source) or (isinstance(source, rsm.BoxNode) and source.is_call_node):
+# parameters of generate_rsm a family can be scaled along, see generate_family
+AXES = {
+    "components": "nr_components",
+    "nodes": "nr_nodes",
+    "boxes": "nr_boxes",
+    "density": "transition_pct",
+    "depth": "call_depth"
+}
+
+
+def generate_rsm(nr_components, nr_nodes, entry_pct, exit_pct, nr_boxes, transition_pct, labels=(), seed=None,
+                 call_depth=None):
+    """
+    Create a random RSM. The transitions of each component are considered separately to either exist or not, i.e.,
+    connectedness is not guaranteed.
+
+    :param nr_components: number of components in the RSM
+    :param nr_nodes: number of nodes in each component (not including box nodes)
+    :param entry_pct: percentage of nodes that shall be entry nodes (each component has at least one)
+    :param exit_pct: percentage of non-entry nodes that shall be exit nodes (each component has at least one)
+    :param nr_boxes: number of boxes per component
+    :param transition_pct: percentage of possible outgoing transitions existing per node
+    :param labels: list of (label, percentage) pairs, the label is added to the given percentage of nodes
+    :param seed: seed of the random number generator, the same seed and parameters always yield the same RSM
+    :param call_depth: if None, boxes may reference any component, including recursive calls. Otherwise, the components
+    are split into call_depth + 1 levels, and boxes only reference components of the next level. Thus, the RSM is not
+    recursive and the call stack never exceeds call_depth boxes.
+    :return: the random RSM
+    """
+    rng = Random(seed)
+    machine = rsm.RSM()
+
+    components = [rsm.Component("c"+str(i)) for i in range(nr_components)]
+    machine.components = components
+    machine.initial_component = components[0]
+
+    for i, c in enumerate(components):
+        for j in range(nr_nodes):
+            node = rsm.Node("n" + str(i) + "_" + str(j))
+            c.add_node(node)
+            if j == 0:
+                c.make_entry_node(node)
+            elif j == 1:
+                c.make_exit_node(node)
+            elif rng.random() < entry_pct / 100:
+                c.make_entry_node(node)
+            elif rng.random() < exit_pct / 100:
+                c.make_exit_node(node)
+            for lbl, pct in labels:
+                if rng.random() < float(pct) / 100:
+                    c.add_label(node, lbl)
+
+    for i, c in enumerate(components):
+        if call_depth is None:
+            candidates = components
+        else:
+            # component i lies on level i * (call_depth + 1) // nr_components and may only call the next level
+            level = i * (call_depth + 1) // nr_components
+            candidates = [r for k, r in enumerate(components) if k * (call_depth + 1) // nr_components == level + 1]
+        if not candidates:
             continue
-        # only select targets from behind the source in the ordering
-        for target in sorted_nodes:  # [(i+1):]:
-            if not(c.is_entry(target) or isinstance(target, rsm.BoxNode) and target.is_return_node) \
-                    and random() < float(transition_pct / 100):
-                c.add_transition(source, target)
+        for j in range(nr_boxes):
+            ref_component = candidates[rng.randint(0, len(candidates)-1)]
+            box = rsm.Box(ref_component, "b" + str(i) + "_" + str(j))
+            c.add_box(box)
+
+    for c in components:
+
+        # we sort nodes to form a total order
+        # the box-nodes for each box will be adjacent in the order, i.e., act as one node
+        # transitions will only be allowed to go forward according to this order
+        sorted_nodes = []
+
+        for n in c.nodes:
+            # don't add box nodes for now
+            if isinstance(n, rsm.BoxNode):
+                continue
+            # don't add entry/exit nodes as they have to be first/last in ordering
+            if c.is_entry(n) or c.is_exit(n):
+                continue
+            # insert node at random spot
+            sorted_nodes.insert(rng.randint(0, len(sorted_nodes)), n)
+
+        bn_insertions = []
+        for box in c.boxes:
+            # use the port order of the box instead of the unordered sets of box nodes to stay reproducible
+            bns = [c.get_call_node(box, n) for n in box.entry_nodes] + \
+                  [c.get_return_node(box, n) for n in box.exit_nodes]
+            insertion_index = rng.randint(0, len(sorted_nodes))
+            bn_insertions.append((insertion_index, bns))
+        # sort the insertion list by indices, s.t. we insert the box-node furthest back first to not mess up indices
+        bn_insertions.sort(reverse=True, key=lambda x: x[0])
+        for index, box_nodes in bn_insertions:
+            for bn in box_nodes:
+                sorted_nodes.insert(index, bn)
+
+        # insert entry and exit nodes at the front/back
+        for n in c.nodes:
+            # don't add entry/exit nodes as they have to be first/last in ordering
+            if c.is_entry(n):
+                sorted_nodes.insert(0, n)
+            elif c.is_exit(n):
+                sorted_nodes.append(n)
+
+        for i, source in enumerate(sorted_nodes):
+            if c.is_exit(source) or (isinstance(source, rsm.BoxNode) and source.is_call_node):
+                continue
+            # only select targets from behind the source in the ordering
+            for target in sorted_nodes:  # [(i+1):]:
+                if not(c.is_entry(target) or isinstance(target, rsm.BoxNode) and target.is_return_node) \
+                        and rng.random() < float(transition_pct / 100):
+                    c.add_transition(source, target)
+
+    machine.initial_node = machine.initial_component.get_entry_nodes()[0]
+
+    return machine
+
+
+def generate_family(axis, values, seed=None, **parameters):
+    """
+    Create a family of random RSMs that only differ in one parameter.
+    All members are generated with the same seed, such that differences along the axis are not blurred by different
+    random choices more than necessary.
+
+    :param axis: one of the keys of AXES, i.e., components, nodes, boxes, density or depth
+    :param values: the values of the scaled parameter
+    :param seed: seed of the random number generator
+    :param parameters: the remaining (fixed) parameters of generate_rsm
+    :return: generator of (value, machine) pairs
+    """
+    if axis not in AXES:
+        raise ValueError("Invalid axis " + str(axis) + ", must be one of " + ", ".join(AXES))
+    for value in values:
+        member_parameters = dict(parameters)
+        member_parameters[AXES[axis]] = value
+        yield value, generate_rsm(seed=seed, **member_parameters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create a random RSM")
+    parser.add_argument("nr_components", help="number of components in the RSM", type=int)
+    parser.add_argument("nr_nodes", help="number of nodes in each component (not including box nodes)", type=int)
+    parser.add_argument("entry_pct", help="percentage of nodes that shall be entry nodes", type=int)
+    parser.add_argument("exit_pct", help="percentage of non-entry nodes that shall be exit nodes", type=int)
+    parser.add_argument("nr_boxes", help="number of boxes per component", type=int)
+    parser.add_argument("transition_pct", help="percentage of possible outgoing transitions existing per node",
+                        type=int)
+    parser.add_argument("-label", help="add a label to a certain percentage of nodes in each component."
+                                       "first argument is label name, second is percentage.",
+                        action="append",
+                        nargs=2)
+    parser.add_argument("-seed", help="seed for the random number generator, the same seed and parameters always "
+                                      "yield the same RSM", type=int)
+    parser.add_argument("-call_depth", help="generate a non-recursive RSM whose call stacks are at most this deep "
+                                            "(default: boxes may reference any component)", type=int)
+    parser.add_argument("-sweep", help="generate a family of RSMs scaled along one axis instead of a single RSM. "
+                                       "first argument is the axis (" + ", ".join(AXES) + "), followed by its values. "
+                                       "the value is appended to the output file name, e.g. random_10.rsm",
+                        nargs="+")
+    parser.add_argument("-out", help="output location of the RSM", default="random.rsm")
+
+    args = parser.parse_args()
+    parameters = {
+        "nr_components": args.nr_components,
+        "nr_nodes": args.nr_nodes,
+        "entry_pct": args.entry_pct,
+        "exit_pct": args.exit_pct,
+        "nr_boxes": args.nr_boxes,
+        "transition_pct": args.transition_pct,
+        "labels": args.label or [],
+        "call_depth": args.call_depth
+    }
+
+    if args.sweep is None:
+        write_rsm(args.out, generate_rsm(seed=args.seed, **parameters))
+        return
+
+    axis = args.sweep[0]
+    values = [int(v) for v in args.sweep[1:]]
+    out = args.out[:-4] if args.out.endswith(".rsm") else args.out
+    for value, machine in generate_family(axis, values, args.seed, **parameters):
+        write_rsm(out + "_" + str(value) + ".rsm", machine)
 
-machine.initial_node = machine.initial_component.get_entry_nodes()[0]
 
-write_rsm(out, machine)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+script to measure how the checker scales on families of random RSMs that grow along one parameter
+must be used from the src folder, e.g. like this:
+python3 etc/scaling.py nodes 10 20 40 80 160 -ctl ../models/random/30.ctl -out ../scaling_nodes.csv
+python3 etc/scaling.py depth 1 2 4 8 -components 16 -boxes 3 -heuristics getnext exhaustive
+for all options use
+python3 etc/scaling.py -h
+the resulting CSV contains one row per RSM, formula file and heuristic with time, memory and contexts built
+"""
+
+import argparse
+import csv
+import os
+import tempfile
+from benchmark import HEURISTICS, run_once
+from pds_to_rsm import write_rsm
+from random_rsm import AXES, generate_family
+
+COLUMNS = ["axis", "value", "sample", "seed", "ctl", "heuristic", "components", "nodes", "boxes", "density", "depth",
+           "states", "transitions", "status", "time", "contexts_built", "memory", "results"]
+
+
+def count_states(machine):
+    """
+    :return: the number of nodes (including box nodes) and transitions of the uncontextualized machine
+    """
+    states = sum(len(c.nodes) for c in machine.components)
+    transitions = sum(len(targets) for c in machine.components for targets in c.transitions.values())
+    return states, transitions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check families of random RSMs and write scaling curves as CSV")
+    parser.add_argument("axis", choices=list(AXES), help="parameter the family is scaled along")
+    parser.add_argument("values", nargs="+", type=int, help="values of the scaled parameter")
+    parser.add_argument("-components", type=int, default=5, help="number of components")
+    parser.add_argument("-nodes", type=int, default=15, help="number of nodes per component")
+    parser.add_argument("-entry_pct", type=int, default=5, help="percentage of entry nodes")
+    parser.add_argument("-exit_pct", type=int, default=5, help="percentage of exit nodes")
+    parser.add_argument("-boxes", type=int, default=2, help="number of boxes per component")
+    parser.add_argument("-density", type=int, default=20, help="percentage of possible transitions per node")
+    parser.add_argument("-depth", type=int, help="maximal call depth, yields non-recursive RSMs (default: recursive)")
+    parser.add_argument("-label",
+                        action="append",
+                        nargs=2,
+                        help="label name and percentage of nodes carrying it (default: a 40, b 60, c 50)")
+    parser.add_argument("-ctl",
+                        nargs="+",
+                        default=["../models/random/10.ctl", "../models/random/20.ctl", "../models/random/30.ctl"],
+                        help="CTL files each RSM is checked against")
+    parser.add_argument("-heuristics",
+                        nargs="+",
+                        choices=list(HEURISTICS),
+                        default=list(HEURISTICS),
+                        help="expansion heuristics to run (exhaustive is the exhaustive approach)")
+    parser.add_argument("-samples", type=int, default=3, help="number of random RSMs (with different seeds) per value")
+    parser.add_argument("-seed", type=int, default=0, help="seed of the first sample, the k-th sample uses seed + k")
+    parser.add_argument("-timeout",
+                        type=int,
+                        default=300,
+                        help="timeout in seconds for a single run, larger values are skipped after a timeout")
+    parser.add_argument("-work_dir", help="directory for generated RSMs and logs (default: temporary directory)")
+    parser.add_argument("-out", default="scaling.csv", help="output CSV file")
+
+    args = parser.parse_args()
+    parameters = {
+        "nr_components": args.components,
+        "nr_nodes": args.nodes,
+        "entry_pct": args.entry_pct,
+        "exit_pct": args.exit_pct,
+        "nr_boxes": args.boxes,
+        "transition_pct": args.density,
+        "labels": args.label or [["a", "40"], ["b", "60"], ["c", "50"]],
+        "call_depth": args.depth
+    }
+    ctls = [os.path.abspath(ctl) for ctl in args.ctl]
+    timed_out = set()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, open(args.out, 'w', newline='') as f:
+        work_dir = os.path.abspath(args.work_dir or tmp_dir)
+        os.makedirs(work_dir, exist_ok=True)
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+
+        for sample in range(args.samples):
+            seed = args.seed + sample
+            for value, machine in generate_family(args.axis, args.values, seed, **parameters):
+                states, transitions = count_states(machine)
+                path_to_rsm = os.path.join(work_dir, args.axis + "_" + str(value) + "_" + str(sample) + ".rsm")
+                write_rsm(path_to_rsm, machine)
+                member_parameters = dict(parameters)
+                member_parameters[AXES[args.axis]] = value
+
+                for path_to_ctl in ctls:
+                    for heuristic in args.heuristics:
+                        # larger members of the family will not finish either
+                        if (sample, path_to_ctl, heuristic) in timed_out:
+                            run = {"status": "skipped"}
+                        else:
+                            run = run_once(path_to_rsm, path_to_ctl, heuristic, seed, work_dir, args.timeout)
+                        if run["status"] == "timeout":
+                            timed_out.add((sample, path_to_ctl, heuristic))
+                        writer.writerow({
+                            "axis": args.axis,
+                            "value": value,
+                            "sample": sample,
+                            "seed": seed,
+                            "ctl": os.path.basename(path_to_ctl),
+                            "heuristic": heuristic,
+                            "components": member_parameters["nr_components"],
+                            "nodes": member_parameters["nr_nodes"],
+                            "boxes": member_parameters["nr_boxes"],
+                            "density": member_parameters["transition_pct"],
+                            "depth": member_parameters["call_depth"],
+                            "states": states,
+                            "transitions": transitions,
+                            "status": run["status"],
+                            "time": run.get("time"),
+                            "contexts_built": run.get("contexts_built"),
+                            "memory": run.get("memory"),
+                            "results": " ".join(str(r) for r in run.get("results", []))
+                        })
+                        f.flush()
+                        print(args.axis, value, "sample", sample, os.path.basename(path_to_ctl), heuristic,
+                              run["status"], format(run["time"], ".3f") + "s" if "time" in run else "")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,7 @@ Due to the recursive nature of RSMs it is best (and often required) to construct
 * define box mappings for contextualized components
 """
 
-from copy import copy
-from utils import get_context_encoding
+from collections import defaultdict
 from ctl_parser import get_subformulas
 from pyModelChecking import CTL
 
@@ -31,6 +30,14 @@ class RSM:
         the component containing the node where a path starts
     initial_node : Node
         the node in the initial component where paths start
+    box_mapping_version : int
+        counter that is increased whenever a box mapping or the initial component changes, used to invalidate the
+        contexts cached by box stacks
+    empty_box_stack : BoxStack
+        the empty box stack of the RSM, i.e., the root of the trie of all box stacks
+    exit_summaries : dict or None
+        the entry-to-exit summaries of the base components, see get_exit_summaries, None until they are needed. an RSM
+        with the same base components, e.g. parsed from the same file for the next formula, may take them over
 
     Methods
     -------
@@ -55,9 +62,26 @@ class RSM:
         the component must be the same object, however for the context its contents are checked
         return None if no such component was found
     remove_unreachable_components()
-        remove all contextualized components that are unreachable, i.e., there is no box referencing them
-    is_sequential()
-        check whether the RSM is sequential
+        remove all contextualized components that are unreachable, i.e., there is no box referencing them, and return
+        the removed components
+    is_recursive()
+        check whether some component of the RSM (indirectly) calls itself
+    get_call_graph()
+        return the call graph of the base components, i.e., which components are referenced by the boxes of a component
+    get_call_graph_sccs()
+        return the number of the strongly connected component of the call graph each base component belongs to, callees
+        having smaller numbers than their callers
+    get_evaluation_order()
+        group the contextualized components by the strongly connected component of the call graph their base component
+        belongs to, callees before callers
+    get_exit_summaries()
+        return for each base component and each of its entry nodes the names of the exit nodes reachable from it
+    mark_context_independent_nodes()
+        mark the nodes of the base components from which no exit node can be reached and share their interpretation
+        between all contexts of their component
+    contextualize_base_components()
+        replace all contextualized components by one component with the empty context per base component, e.g. after
+        the base components have been modified
     """
 
     def __init__(self):
@@ -66,6 +90,11 @@ class RSM:
         self.contextualized_components = set()
         self.initial_component = None
         self.initial_node = None
+        self.box_mapping_version = 0
+        self.empty_box_stack = BoxStack(self)
+        # strongly connected component number of each base component, computed on first use
+        self._call_graph_sccs = None
+        self.exit_summaries = None
 
     def __str__(self, include_labels=False):
         out = ["\nInitial node: " + str(self.initial_node) + " in " + str(self.initial_component)]
@@ -93,8 +122,7 @@ class RSM:
     def initialize_single(self, ctl, name_appendix="_init"):
         exit_nodes = self.initial_component.base_component.get_exit_nodes()
         init_context = {ex: {f: val for f, val in ctx.items()} for ex, ctx in self.initial_component.context.items()}
-        init_interpretation = {n: {f: val for f, val in i.items()}
-                               for n, i in self.initial_component.interpretation.items()}
+        init_interpretation = {ex: self.initial_component.interpretation[ex].copy() for ex in exit_nodes}
 
         # compute initial context
         try:
@@ -118,6 +146,7 @@ class RSM:
         new_initial_component = self.initial_component.get_extended_component(name_appendix, init_context)
         self.contextualized_components.add(new_initial_component)
         self.initial_component = new_initial_component
+        self.box_mapping_version += 1
 
     def initialize(self, ctl):
         subformulas = get_subformulas(ctl)
@@ -156,6 +185,7 @@ class RSM:
         new_initial_component = self.initial_component.get_extended_component("_init", init_context)
         self.contextualized_components.add(new_initial_component)
         self.initial_component = new_initial_component
+        self.box_mapping_version += 1
 
     def add_base_component(self, c):
         self.base_components.add(c)
@@ -181,7 +211,7 @@ class RSM:
                 if len(mapping) != len(ctx[ex]):
                     context_matches_in_all_nodes = False
                     break
-                if any(value != ctx[ex][ctl] for ctl, value in mapping.items()):
+                if any(value != ctx[ex].get(ctl) for ctl, value in mapping.items()):
                     context_matches_in_all_nodes = False
                     break
             if context_matches_in_all_nodes:
@@ -190,25 +220,251 @@ class RSM:
 
     def remove_unreachable_components(self):
         # remove unreachable components
-        reach = []
+        reach = {self.initial_component}
         next_reach = [self.initial_component]
         while next_reach:
-            for c in next_reach:
-                reach.append(c)
             new_reach = []
             for component in next_reach:
                 for b, target in component.box_mapping.items():
-                    if target not in reach and target not in new_reach:
+                    if target not in reach:
+                        reach.add(target)
                         new_reach.append(target)
             next_reach = new_reach
 
-        components = copy(self.contextualized_components)
-        for component in components:
-            if component not in reach:
-                self.remove_contextualized_component(component)
+        removed = [component for component in self.contextualized_components if component not in reach]
+        for component in removed:
+            self.remove_contextualized_component(component)
+        return removed
+
+    def is_recursive(self):
+        call_graph = self.get_call_graph()
+        sccs = self.get_call_graph_sccs()
+        return any(c in callees for c, callees in call_graph.items()) or len(set(sccs.values())) < len(sccs)
+
+    def get_call_graph(self):
+        return {c: [box.component for box in c.boxes] for c in self.base_components}
+
+    def get_call_graph_sccs(self):
+        # the base components do not change while checking, so their call graph is only analyzed once
+        if self._call_graph_sccs is None:
+            call_graph = self.get_call_graph()
+            self._call_graph_sccs = strongly_connected_components(call_graph, call_graph)
+        return self._call_graph_sccs
+
+    def get_evaluation_order(self):
+        sccs = self.get_call_graph_sccs()
+        groups = defaultdict(set)
+        for c in self.contextualized_components:
+            groups[sccs[c.base_component]].add(c)
+        # boxes only lead to components with smaller numbers
+        return [groups[scc] for scc in sorted(groups)]
+
+    def get_exit_summaries(self):
+        """
+        Compute for each base component and each of its entry nodes the names of the exit nodes that can be reached
+        from it, where a box leads from its call nodes to the return nodes given by the summaries of the referenced
+        component. As for the box successors of call nodes, paths start in the successors of the entry node. The
+        summaries only depend on the base components, so they are cached in exit_summaries. The base components are
+        processed callees first and recursive ones until nothing changes.
+
+        :return: dictionary mapping component names to dictionaries mapping entry node names to sets of exit node names
+        """
+        if self.exit_summaries is not None:
+            return self.exit_summaries
+
+        sccs = self.get_call_graph_sccs()
+        summaries = {c.name: {e.name: set() for e in c.get_entry_nodes()} for c in self.base_components}
+        changed = True
+        while changed:
+            changed = False
+            for component in sorted(self.base_components, key=lambda c: sccs[c]):
+                for entry, exits in summaries[component.name].items():
+                    stack = list(component.transitions[component.get_node_by_name(entry)])
+                    reach = set(stack)
+                    while stack:
+                        node = stack.pop()
+                        successors = component.transitions[node]
+                        if component.is_exit(node):
+                            if node.name not in exits:
+                                exits.add(node.name)
+                                changed = True
+                        elif isinstance(node, BoxNode) and node.is_call_node:
+                            successors = successors + component.get_summary_successors(node, summaries)
+                        for s in successors:
+                            if s not in reach:
+                                reach.add(s)
+                                stack.append(s)
+
+        self.exit_summaries = {name: {e: frozenset(x) for e, x in s.items()} for name, s in summaries.items()}
+        return self.exit_summaries
+
+    def mark_context_independent_nodes(self):
+        # the values of all formulas in a node from which no exit node can be reached do not depend on the context, so
+        # the contexts of a component share the interpretation of such nodes and only evaluate them once
+        summaries = self.get_exit_summaries()
+        for component in self.base_components:
+            component.context_independent_nodes = component.get_context_independent_nodes(summaries)
+        shared = {}
+        for c in self.contextualized_components:
+            for node in c.base_component.context_independent_nodes:
+                node_interpretation = shared.setdefault((c.base_component, node), c.interpretation[node])
+                if c.interpretation[node] is not node_interpretation:
+                    node_interpretation.update(c.interpretation[node])
+                    c.interpretation[node] = node_interpretation
+
+    def contextualize_base_components(self):
+        if isinstance(self.initial_component, ContextualizedComponent):
+            self.initial_component = self.initial_component.base_component
+        self.contextualized_components = set()
+        empty_components = {}
+        for component in self.base_components:
+            # the new contexts do not share any interpretation yet
+            component.context_independent_nodes = set()
+            contextualized_component =\
+                ContextualizedComponent(self, component, "", component.generate_empty_context())
+            self.add_contextualized_component(contextualized_component)
+            empty_components[component] = contextualized_component
+            if self.initial_component == component:
+                self.initial_component = contextualized_component
+
+        for component in self.contextualized_components:
+            for box in component.base_component.boxes:
+                component.box_mapping[box] = empty_components[box.component]
+        self.box_mapping_version += 1
+
+
+class BoxStack:
+    """
+    a class to represent box stacks as persistent linked lists, i.e., a box stack consists of its topmost box and the
+    box stack below it. all box stacks of an RSM form a trie rooted at its empty box stack, pushing the same box onto
+    the same box stack always yields the same object. thus, pushing and popping boxes never copies a stack, and box
+    stacks can be hashed and compared by identity.
+
+    Attributes
+    ----------
+
+    machine : RSM
+        the RSM on which the box stack is defined
+    parent : BoxStack
+        the box stack below the topmost box, None for the empty box stack
+    box : Box
+        the topmost box, None for the empty box stack
+    depth : int
+        the number of boxes on the stack
+
+    Methods
+    -------
+
+    push(box)
+        return the box stack with box on top of this one
+    pop()
+        return the box stack without the topmost box
+    context()
+        return the contextualized component execution ends up in if the boxes are entered from the initial component
+        bottom up. the result is cached until the box mappings of the RSM change, see RSM.box_mapping_version
+    """
+
+    __slots__ = ("machine", "parent", "box", "depth", "_children", "_context", "_version")
+
+    def __init__(self, machine, parent=None, box=None):
+        self.machine = machine
+        self.parent = parent
+        self.box = box
+        self.depth = 0 if parent is None else parent.depth + 1
+        self._children = {}
+        self._context = None
+        self._version = None
+
+    def push(self, box):
+        child = self._children.get(box)
+        if child is None:
+            child = BoxStack(self.machine, self, box)
+            self._children[box] = child
+        return child
+
+    def pop(self):
+        if self.parent is None:
+            raise ValueError("Cannot pop from the empty box stack")
+        return self.parent
+
+    def context(self):
+        version = self.machine.box_mapping_version
+        if self._version == version:
+            return self._context
+
+        # go down to the topmost box stack whose cached context is still valid (or the empty box stack) ...
+        outdated = []
+        stack = self
+        while stack._version != version and stack.parent is not None:
+            outdated.append(stack)
+            stack = stack.parent
+        if stack._version != version:
+            stack._context = self.machine.initial_component
+            stack._version = version
+
+        # ... and follow the box mappings back up from there
+        component = stack._context
+        for stack in reversed(outdated):
+            component = component.box_mapping[stack.box]
+            stack._context = component
+            stack._version = version
+        return component
+
+    def __len__(self):
+        return self.depth
+
+    def __iter__(self):
+        # from the bottom to the top of the stack
+        boxes = []
+        stack = self
+        while stack.parent is not None:
+            boxes.append(stack.box)
+            stack = stack.parent
+        return reversed(boxes)
+
+
+class NodeInterpretation(dict):
+    """
+    a class to represent the interpretation of a node in a contextualized component, i.e., a dict { CTL : bool } of the
+    formulas known in the node. The values of propositional formulas do not depend on the context, so they are not
+    stored in it but looked up in the propositional values of the base component, which all its contexts share. Indexing
+    and get return them as well, while membership tests only cover the stored formulas, so the value of a formula that
+    may be propositional is tested via get
+
+    Attributes
+    ----------
 
-    def is_sequential(self):
-        return all(c.component.is_sequential() for c in self.base_components)
+    propositional_values : dict { CTL : dict { (Box)Node : bool } }
+        the propositional values of the base component, see Component.get_propositional_values
+    node : Node or BoxNode
+        the node that is interpreted
+
+    Methods
+    -------
+
+    copy()
+        return a new interpretation of the node with the same values
+    """
+
+    __slots__ = ("propositional_values", "node")
+
+    def __init__(self, propositional_values, node, values=()):
+        super().__init__(values)
+        self.propositional_values = propositional_values
+        self.node = node
+
+    def __missing__(self, ctl):
+        return self.propositional_values[ctl][self.node]
+
+    def get(self, ctl, default=None):
+        if dict.__contains__(self, ctl):
+            return dict.__getitem__(self, ctl)
+        if ctl in self.propositional_values:
+            return self.propositional_values[ctl][self.node]
+        return default
+
+    def copy(self):
+        return NodeInterpretation(self.propositional_values, self.node, self)
 
 
 class ContextualizedComponent:
@@ -224,25 +480,32 @@ class ContextualizedComponent:
         The context of this component
     box_mapping : dict { Box : ContextualizedComponent }
         box reference function
-    interpretation : dict { node : dict { CTL : bool } }
+    interpretation : dict { node : NodeInterpretation }
         The ternary interpretation of CTL formulas over the component. Unknown is represented by None.
+        The interpretations of the nodes may be shared with extended components (copy-on-write) and, in context
+        independent nodes, with all contexts of the base component, so they must only be modified via set_truth_value
 
     Methods
     -------
 
     get_truth_value(node, ctl)
         Return whether CTL holds in node
+    set_truth_value(node, ctl, value)
+        Set whether CTL holds in node, copying the interpretation of the node first if it is shared
     get_extended_component(new_name_appendix, new_context)
         create a new component that is structurally identical to this one but has refined context information
         this is preferable over creating the component from scratch since it directly asserts known parts of the
         interpretation and the box mapping
+    get_box_context(box)
+        collect the truth values of all existential formulas in the return nodes of the box as a context for the
+        referenced component
     contextualize_box(box)
         unpack a box. collects the truth values of all formulas in the return nodes of the box and rewires the box to
         refer to a component with refined context (after potentially creating it first)
 
     """
 
-    def __init__(self, parent_rsm, base_component, name_appendix, context):
+    def __init__(self, parent_rsm, base_component, name_appendix, context, extended_component=None):
         self.parent_rsm = parent_rsm
         self.name = base_component.name + name_appendix
         self.base_component = base_component
@@ -250,10 +513,23 @@ class ContextualizedComponent:
         # this means everything breaks as soon as a context is modified, however currently contexts are never modified.
         # make the context immutable so that i dont unintentionally break it in the future.
         self.context = context
-        self.interpretation = {n: dict() for n in base_component.nodes}
+        if extended_component is None:
+            self.interpretation = {n: NodeInterpretation(base_component.propositional_values, n)
+                                   for n in base_component.nodes}
+            self.box_mapping = dict()
+            # nodes whose interpretation dict is not shared with another component
+            self._owned_nodes = set(base_component.nodes)
+        else:
+            # everything known in the extended component is known here as well, so its interpretation dicts are shared
+            # until either component modifies them
+            self.interpretation = dict(extended_component.interpretation)
+            self.box_mapping = dict(extended_component.box_mapping)
+            self._owned_nodes = set()
+            extended_component._owned_nodes = set()
         for ex, ctx in context.items():
-            self.interpretation[ex] = {ctl: val for ctl, val in ctx.items()}
-        self.box_mapping = dict()
+            self.interpretation[ex] = self.interpretation[ex].copy()
+            self.interpretation[ex].update(ctx)
+            self._owned_nodes.add(ex)
 
     def get_truth_value(self, node, ctl):
         try:
@@ -261,6 +537,14 @@ class ContextualizedComponent:
         except KeyError:
             return None
 
+    def set_truth_value(self, node, ctl, value):
+        if node not in self._owned_nodes:
+            # the values in context independent nodes are valid in all contexts, so their interpretation stays shared
+            if node not in self.base_component.context_independent_nodes:
+                self.interpretation[node] = self.interpretation[node].copy()
+            self._owned_nodes.add(node)
+        self.interpretation[node][ctl] = value
+
     def get_extended_component(self, new_name_appendix, new_context):
         # sanity check for extension
         try:
@@ -271,29 +555,11 @@ class ContextualizedComponent:
         except KeyError:
             raise ValueError(str(new_context) + "is not an extension of " + str(self.context))
 
-        # create new component
-        extended_component =\
-            ContextualizedComponent(self.parent_rsm, self.base_component, new_name_appendix, new_context)
-
-        # copy known stuff
-        for n, i in self.interpretation.items():
-            for ctl, v in i.items():
-                extended_component.interpretation[n][ctl] = v
-        for b, c in self.box_mapping.items():
-            extended_component.box_mapping[b] = c
+        # create new component, sharing the known interpretation and the box mapping
+        return ContextualizedComponent(self.parent_rsm, self.base_component, new_name_appendix, new_context, self)
 
-        # incorporate context information into interpretation
-        for n, i in new_context.items():
-            for ctl, v in i.items():
-                extended_component.interpretation[n][ctl] = v
-
-        return extended_component
-
-    def contextualize_box(self, box):
-        ref_component = self.box_mapping[box]
+    def get_box_context(self, box):
         formulas = set()
-
-        # build new context
         context = dict()
         for rn in box.return_nodes:
             context[rn.node] = dict()
@@ -302,6 +568,13 @@ class ContextualizedComponent:
                     continue
                 context[rn.node][ctl] = value
                 formulas.add(ctl)
+        return context, formulas
+
+    def contextualize_box(self, box):
+        ref_component = self.box_mapping[box]
+
+        # build new context
+        context, formulas = self.get_box_context(box)
 
         # search if component exists
         new_component = self.parent_rsm.get_contextualized_component(ref_component.base_component, context)
@@ -316,7 +589,9 @@ class ContextualizedComponent:
             self.parent_rsm.contextualized_components.add(new_component)
 
         # update box mapping
-        self.box_mapping[box] = new_component
+        if self.box_mapping[box] is not new_component:
+            self.box_mapping[box] = new_component
+            self.parent_rsm.box_mapping_version += 1
 
         return context_existed
 
@@ -349,6 +624,16 @@ class Component:
             where X is a non-exit node or a BoxNode
             where Y is a non-entry node or a BoxNode
         dictionary containing all transitions of a component
+    propositional_values : dict { CTL : dict { (Box)Node : bool } }
+        values of the propositional formulas evaluated so far, computed once for all contexts of the component, whose
+        interpretations look them up instead of storing them (see NodeInterpretation)
+    context_independent_nodes : set
+        the nodes other than box nodes from which no exit node can be reached. the values of all formulas in them are
+        the same in every context, so their interpretation is shared by all contexts of the component. empty until
+        marked by RSM.mark_context_independent_nodes
+    structural_hash : int or None
+        hash of the canonical form of the component, equal for components that only differ in the names of their nodes
+        and boxes, see deduplication.merge_isomorphic_components. None if it was not computed
 
     Methods
     -------
@@ -367,6 +652,9 @@ class Component:
         declare a node as exit node
     add_node(node)
         adds a Node or BoxNode object to the component
+    remove_node(node)
+        removes a Node object along with its outgoing transitions from the component, transitions to it must have been
+        removed before
     add_label(node, label)
         adds a label to a node
     add_box(box)
@@ -397,8 +685,13 @@ class Component:
         return the list of labels of a node
     has_label(node, label)
         return whether the node has the label
-    is_sequential()
-        check whether the component has a sequential ordering w.r.t. the transitions
+    get_propositional_values(ctl)
+        return the values of a propositional formula (over atomic propositions only) in all nodes, which do not depend
+        on the context. the values are computed once for all contexts of the component
+    get_summary_successors(call_node, exit_summaries)
+        return the return nodes of the box of a call node that correspond to the exits reachable from the entry node
+    get_context_independent_nodes(exit_summaries)
+        return the nodes other than box nodes from which no exit node can be reached
     """
 
     def __init__(self, name=""):
@@ -413,6 +706,9 @@ class Component:
         self.call_node_name_dict = {}
         self.return_node_name_dict = {}
         self.transitions = {}
+        self.propositional_values = {}
+        self.context_independent_nodes = set()
+        self.structural_hash = None
 
     def __str__(self):
         return "component " + str(self.name)
@@ -447,6 +743,14 @@ class Component:
         self.transitions[node] = []
         self.node_name_dict[node.name] = node
 
+    def remove_node(self, node):
+        if isinstance(node, BoxNode):
+            raise ValueError("Can't remove box node " + str(node) + ", remove its box instead")
+        del self.nodes[node]
+        del self.transitions[node]
+        del self.node_name_dict[node.name]
+        node.parent_component = None
+
     def add_label(self, node, label):
         self.nodes[node]["labels"].add(label)
 
@@ -554,42 +858,49 @@ class Component:
     def has_label(self, node, label):
         return label in self.get_labels(node)
 
-    def generate_empty_context(self):
-        return {ex: dict() for ex in self.get_exit_nodes()}
-
-    def is_sequential(self):
-
-        def detect_cycle(node, visited, stack):
-            # returns True if you can reach a box node in stack from node. ignores visited nodes.
-
-            visited.add(node)
-            if isinstance(node, BoxNode):
-                stack.add(node)
-
-            successors = node.parent_component.transitions[node]
-            box_successors = []
+    def get_propositional_values(self, ctl):
+        if ctl not in self.propositional_values:
+            if isinstance(ctl, CTL.Bool):
+                values = {n: str(ctl) == "true" for n in self.nodes}
+            elif isinstance(ctl, CTL.AtomicProposition):
+                values = {n: self.has_label(n, str(ctl)) for n in self.nodes}
+            elif isinstance(ctl, CTL.Not):
+                sub = self.get_propositional_values(ctl.subformula(0))
+                values = {n: not v for n, v in sub.items()}
+            elif isinstance(ctl, CTL.Or) or isinstance(ctl, CTL.And):
+                subs = [self.get_propositional_values(sub) for sub in ctl.subformulas()]
+                combine = any if isinstance(ctl, CTL.Or) else all
+                values = {n: combine(sub[n] for sub in subs) for n in self.nodes}
+            else:
+                raise ValueError("Can't evaluate temporal operators propositionally")
+            self.propositional_values[ctl] = values
+        return self.propositional_values[ctl]
+
+    def get_summary_successors(self, call_node, exit_summaries):
+        # boxes need not have a return node for every exit of their component
+        exits = exit_summaries[call_node.box.component.name].get(call_node.node.name, ())
+        return [r for r in (self.return_node_name_dict.get((call_node.box.name, x)) for x in exits) if r is not None]
+
+    def get_context_independent_nodes(self, exit_summaries):
+        # backward search from the exit nodes, boxes lead from call nodes to return nodes according to the summaries
+        predecessors = defaultdict(list)
+        for node, targets in self.transitions.items():
             if isinstance(node, BoxNode) and node.is_call_node:
-                box_successors = node.box.return_nodes
+                targets = targets + self.get_summary_successors(node, exit_summaries)
+            for target in targets:
+                predecessors[target].append(node)
+        reach = set(self.get_exit_nodes())
+        stack = list(reach)
+        while stack:
+            for predecessor in predecessors[stack.pop()]:
+                if predecessor not in reach:
+                    reach.add(predecessor)
+                    stack.append(predecessor)
+        # the values in box nodes make up the contexts of the referenced components, so they are kept per context
+        return {n for n in self.nodes if n not in reach and not isinstance(n, BoxNode)}
 
-            for succ in successors + box_successors:
-                if succ not in visited:
-                    if detect_cycle(succ, visited, stack):
-                        return True
-                elif succ in stack:
-                    return True
-
-            if isinstance(node, BoxNode):
-                stack.remove(node)
-            return False
-
-        v = set()
-        s = set()
-
-        for bn in self.box_nodes:
-            if bn not in v:
-                if detect_cycle(bn, v, s):
-                    return False
-            return True
+    def generate_empty_context(self):
+        return {ex: dict() for ex in self.get_exit_nodes()}
 
 
 class Box:
@@ -704,3 +1015,85 @@ class BoxNode:
     def __str__(self):
         return "box-node " + str(self.name) + " (" + ("call, " if self.is_call_node else "") + \
                ("return, " if self.is_return_node else "") + str(self.node) + ", " + str(self.box) + ")"
+
+
+def get_context_encoding(formulas, context, base_component):
+    """
+    Get the encoding of a component's context wrt a ctl as a ternary string (using 0, 1 and ?)
+    """
+
+    ctl_str = ""
+    tmp_ctl_str = ""
+    enc = ""
+
+    sorted_exit_nodes = list(base_component.get_exit_nodes())
+    sorted_exit_nodes.sort(key=lambda x: x.name)
+
+    for node in sorted_exit_nodes:
+        for ctl in formulas:
+            if not ctl_str:
+                tmp_ctl_str += str(ctl).replace(" ", "") + "/"
+            if ctl not in context[node]:
+                enc += "?"
+            elif context[node][ctl] is True:
+                enc += "1"
+            else:
+                enc += "0"
+        if not ctl_str:
+            ctl_str = tmp_ctl_str
+        enc += "/"
+    return "_" + ctl_str + enc[:-1]
+
+
+def strongly_connected_components(nodes, edges):
+    """
+    Compute the strongly connected components of a graph with Tarjan's algorithm, using an explicit stack instead of
+    recursion such that large graphs do not exceed the recursion limit.
+
+    :param nodes: iterable of all nodes of the graph
+    :param edges: dictionary mapping each node to the list of its successors
+    :return: dictionary mapping each node to the number of its strongly connected component. Components are numbered
+    in reverse topological order, i.e., edges between different components always lead to a smaller number.
+    """
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    component_of = {}
+    num_components = 0
+
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(edges[root]))]
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in index:
+                    # descend into successor, continue with the remaining successors of node afterwards
+                    index[successor] = low[successor] = len(index)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(edges[successor])))
+                    break
+                elif successor in on_stack:
+                    low[node] = min(low[node], index[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    # node is the root of a component, which consists of all nodes above it on the stack
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component_of[member] = num_components
+                        if member == node:
+                            break
+                    num_components += 1
+
+    return component_of
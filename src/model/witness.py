@@ -2,22 +2,58 @@
 Representation of witnesses, giving reason for why a formula holds
 """
 
-from utils import *
+import json
+from collections import Counter, deque
+from pyModelChecking import CTL
+from utils import is_propositional
+from model import rsm
+from model.rsm import strongly_connected_components
 
 
 class Witness:
     """
-    a reason why ctl holds or does not hold in node with a given box stack
+    a reason why ctl holds or does not hold in node with a given box stack (a BoxStack of the machine)
+    witnesses are generated by generate_witness, which shares equal sub-witnesses, i.e., the reasons form a DAG
     """
 
     def __init__(self, machine, box_stack, node, ctl, expected_value):
         self.machine = machine
         self.box_stack = box_stack
-        self.component = box_stack_to_context(machine, box_stack)
+        self.component = box_stack.context()
         self.node = node
         self.ctl = ctl
         self.expected_value = expected_value
         self.reasons = []
+        # number of the witness in the DAG, assigned by generate_witness
+        self.index = None
+
+    def reason_specs(self):
+        """
+        :return: list of (box_stack, node, ctl, expected_value) describing the witnesses this witness relies on
+        """
+        return []
+
+    def successors(self, box_stack, component, node):
+        """
+        :return: list of (box_stack, component, node) for all successors of node, entering the box at call nodes and
+        returning to the calling component at exit nodes (if the box stack is not empty)
+        """
+        result = [(box_stack, component, s) for s in component.base_component.transitions[node]]
+        if isinstance(node, rsm.BoxNode) and node.is_call_node:
+            ref_component = component.box_mapping[node.box]
+            inner_box_stack = box_stack.push(node.box)
+            result += [(inner_box_stack, ref_component, s)
+                       for s in ref_component.base_component.transitions[node.node]]
+        elif isinstance(node, rsm.Node) and component.base_component.is_exit(node) and box_stack:
+            outer_box_stack = box_stack.pop()
+            caller = outer_box_stack.context()
+            return_node = caller.base_component.get_return_node(box_stack.box, node)
+            result += [(outer_box_stack, caller, s) for s in caller.base_component.transitions[return_node]]
+        return result
+
+    def summary(self):
+        return str(self.ctl) + (" holds" if self.expected_value else " does not hold") + " in " + \
+            state_str(self.box_stack, self.node)
 
 
 class LocalWitness(Witness):
@@ -36,11 +72,10 @@ class NegationWitness(Witness):
 
     def __init__(self, machine, box_stack, node, ctl, expected_value):
         super().__init__(machine, box_stack, node, ctl, expected_value)
-        self.reasons = self.find_reasons()
 
-    def find_reasons(self):
+    def reason_specs(self):
         sub = self.ctl.subformula(0)
-        return [generate_witness(self.machine, self.box_stack, self.node, sub, not self.expected_value)]
+        return [(self.box_stack, self.node, sub, not self.expected_value)]
 
     def __str__(self):
         sub = self.ctl.subformula(0)
@@ -56,29 +91,24 @@ class DisjunctionWitness(Witness):
 
     def __init__(self, machine, box_stack, node, ctl, expected_value):
         super().__init__(machine, box_stack, node, ctl, expected_value)
-        self.reasons = self.find_reasons()
-
-    def find_reasons(self):
+        # a disjunct that holds in node, if the disjunction holds
+        self.disjunct = None
         if self.expected_value:
             for sub in self.ctl.subformulas():
-                if sub not in self.component.interpretation[self.node] or \
-                        self.component.interpretation[self.node] is False:
-                    continue
-                return [generate_witness(self.machine, self.box_stack, self.node, sub, self.expected_value)]
+                if self.component.interpretation[self.node].get(sub) is True:
+                    self.disjunct = sub
+                    break
+
+    def reason_specs(self):
+        if self.expected_value:
+            return [(self.box_stack, self.node, self.disjunct, True)]
         else:
-            reasons = []
-            for sub in self.ctl.subformulas():
-                reasons.append(generate_witness(self.machine, self.box_stack, self.node, sub, self.expected_value))
-            return reasons
+            return [(self.box_stack, self.node, sub, False) for sub in self.ctl.subformulas()]
 
     def __str__(self):
         if self.expected_value:
-            for sub in self.ctl.subformulas():
-                if sub not in self.component.interpretation[self.node] or \
-                        self.component.interpretation[self.node] is False:
-                    continue
-                return str(self.ctl) + " holds in " + state_str(self.box_stack, self.node) + " because " + \
-                    str(sub) + " holds"
+            return str(self.ctl) + " holds in " + state_str(self.box_stack, self.node) + " because " + \
+                str(self.disjunct) + " holds"
         else:
             return str(self.ctl) + " does not hold in " + state_str(self.box_stack, self.node) + \
                 " because none of the disjuncts hold"
@@ -88,53 +118,32 @@ class NextWitness(Witness):
 
     def __init__(self, machine, box_stack, node, ctl, expected_value):
         super().__init__(machine, box_stack, node, ctl, expected_value)
-        self.reasons = self.find_reasons()
-
-    def find_reasons(self):
         sub = self.ctl.subformula(0).subformula(0)
-        successors = self.component.base_component.transitions[self.node]
+        successors = self.successors(self.box_stack, self.component, self.node)
+        # exit nodes of the initial component stutter (see RSM.initialize), i.e., such a state is its own successor
+        self.stutters = not successors and not self.box_stack and self.component.base_component.is_exit(self.node)
+        if self.stutters:
+            successors = [(self.box_stack, self.component, self.node)]
         if self.expected_value:
-            for s in successors:
-                if sub not in self.component.interpretation[s] or self.component.interpretation[s][sub] is False:
-                    continue
-                return [generate_witness(self.machine, self.box_stack, s, sub, self.expected_value)]
-            if isinstance(self.node, rsm.BoxNode):
-                next_box_stack = self.box_stack + self.node.box
-                next_component = self.component.box_mapping[self.node.box]
-                successors = next_component.base_component.transitions[self.node.node]
-                for s in successors:
-                    if sub not in self.component.interpretation[s] or self.component.interpretation[s][sub] is False:
-                        continue
-                    return [generate_witness(self.machine, next_box_stack, s, sub, self.expected_value)]
+            # one successor in which the subformula holds suffices
+            self.next_states = [(box_stack, s) for box_stack, component, s in successors
+                                if component.interpretation[s].get(sub) is True][:1]
         else:
-            reasons = []
-            for s in successors:
-                reasons.append(generate_witness(self.machine, self.box_stack, s, sub, self.expected_value))
-            if isinstance(self.node, rsm.BoxNode):
-                next_box_stack = self.box_stack + self.node.box
-                next_component = self.component.box_mapping[self.node.box]
-                successors = next_component.base_component.transitions[self.node.node]
-                for s in successors:
-                    reasons.append(generate_witness(self.machine, next_box_stack, s, sub, not self.expected_value))
+            self.next_states = [(box_stack, s) for box_stack, component, s in successors]
+
+    def reason_specs(self):
+        sub = self.ctl.subformula(0).subformula(0)
+        return [(box_stack, s, sub, self.expected_value) for box_stack, s in self.next_states]
 
     def __str__(self):
         sub = self.ctl.subformula(0).subformula(0)
-        successors = self.component.base_component.transitions[self.node]
+        stutter_note = ", which is its own successor as an exit node of the initial component" if self.stutters else ""
         if self.expected_value:
-            for s in successors:
-                if sub not in self.component.interpretation[s] or self.component.interpretation[s][sub] is False:
-                    continue
-                return str(self.ctl) + " holds in " + state_str(self.box_stack, self.node) + " because " + \
-                    str(sub) + " holds in " + state_str(self.box_stack, s)
-            if isinstance(self.node, rsm.BoxNode):
-                next_box_stack = self.box_stack + self.node.box
-                next_component = self.component.box_mapping[self.node.box]
-                successors = next_component.base_component.transitions[self.node.node]
-                for s in successors:
-                    if sub not in self.component.interpretation[s] or self.component.interpretation[s][sub] is False:
-                        continue
-                    return str(self.ctl) + " holds in " + state_str(self.box_stack, self.node) + " because " + \
-                        str(sub) + " holds in " + state_str(s, next_box_stack)
+            return str(self.ctl) + " holds in " + state_str(self.box_stack, self.node) + " because " + \
+                str(sub) + " holds in " + state_str(*self.next_states[0]) + stutter_note
+        elif self.stutters:
+            return str(self.ctl) + " does not hold in " + state_str(self.box_stack, self.node) + " because " + \
+                str(sub) + " does not hold in " + state_str(self.box_stack, self.node) + stutter_note
         else:
             return str(self.ctl) + " does not hold in " + state_str(self.box_stack, self.node) + " because " + \
                 str(sub) + " does not hold in any successor"
@@ -144,185 +153,179 @@ class UntilWitness(Witness):
 
     def __init__(self, machine, box_stack, node, ctl, expected_value):
         super().__init__(machine, box_stack, node, ctl, expected_value)
-        self.path = self.find_path([(self.box_stack, self.node)], self.component)
-        self.reasons = self.find_reasons()
+        self.path = self.find_path() if self.expected_value else None
 
-    def find_reasons(self):
-        if self.expected_value:
-            sub1 = self.ctl.subformula(0).subformula(0)
-            sub2 = self.ctl.subformula(0).subformula(1)
-            sub1_path = self.path[:-1]
-            sub2_box_stack, sub2_node = self.path[-1]
-            reasons = [generate_witness(self.machine, box_stack, node, sub1, True) for (box_stack, node) in sub1_path]
-            reasons.append(generate_witness(self.machine, sub2_box_stack, sub2_node, sub2, True))
-            return reasons
-        else:
+    def reason_specs(self):
+        if self.path is None:
             return []
-
-    def find_path(self, path, component, visited=None):
-        if self.expected_value is False:
-            return None
-        if visited is None:
-            visited = set()
+        sub1 = self.ctl.subformula(0).subformula(0)
         sub2 = self.ctl.subformula(0).subformula(1)
-        box_stack, node = path[-1]
-        visited.add((component, node))
-        # if phi_2 holds, we have found the complete witness path
-        if sub2 in component.interpretation[node] and component.interpretation[node][sub2] is True:
-            return path
-        # otherwise, phi_1 must hold, and the until formula must hold in some successor
-        successors = component.base_component.transitions[node]
-        for s in successors:
-            # ignore successors in which the until formula is unknown or false
-            if self.ctl not in component.interpretation[s] or component.interpretation[s][self.ctl] is False:
-                continue
-            if (component, s) not in visited:
-                path.append((box_stack, s))
-                full_path = self.find_path(path, component, visited)
-                if full_path is not None:
-                    return full_path
-                path.pop()
-        # entering a box
-        if isinstance(node, rsm.BoxNode) and node.is_call_node:
-            component = component.box_mapping[node.box]
-            successors = component.base_component.transitions[node.node]
-            for s in successors:
-                # ignore successors in which ctl is unknown or false
-                if self.ctl not in component.interpretation[s] or component.interpretation[s][self.ctl] is False:
-                    continue
-                if (component, s) not in visited:
-                    path.append((box_stack + [node.box], s))
-                    full_path = self.find_path(path, component, visited)
-                    if full_path is not None:
-                        return full_path
-                    path.pop()
-        # leaving a box
-        elif isinstance(node, rsm.Node) and component.base_component.is_exit(node):
-            # for the case where we reach an exit node in the initial component in which sub2 does not hold
-            if not box_stack:
-                return None
-            last_box = box_stack[-1]
-            component = box_stack_to_context(self.machine, box_stack[:-1])
-            node = component.base_component.get_return_node(last_box, node)
-            successors = component.base_component.transitions[node]
-            for s in successors:
-                # ignore successors in which ctl is unknown or false
-                if self.ctl not in component.interpretation[s] or component.interpretation[s][self.ctl] is False:
+        sub1_path = self.path[:-1]
+        sub2_box_stack, sub2_node = self.path[-1]
+        specs = [(box_stack, node, sub1, True) for (box_stack, node) in sub1_path]
+        specs.append((sub2_box_stack, sub2_node, sub2, True))
+        return specs
+
+    def find_path(self):
+        """
+        Breadth-first search for a shortest path along which the until formula holds, starting in the state of the
+        witness and ending in the first state in which phi_2 holds. Boxes are entered and left along the way.
+
+        :return: the path as list of (box_stack, node), or None if there is no such path
+        """
+        sub2 = self.ctl.subformula(0).subformula(1)
+        start = (self.component, self.node)
+        box_stacks = {start: self.box_stack}
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            state = queue.popleft()
+            component, node = state
+            # if phi_2 holds, we have found the complete witness path
+            if component.interpretation[node].get(sub2) is True:
+                return trace_path(state, parents, box_stacks)
+            # otherwise, phi_1 holds, and the until formula must hold in some successor
+            for box_stack, successor_component, successor in self.successors(box_stacks[state], component, node):
+                successor_state = (successor_component, successor)
+                # ignore visited successors and successors in which the until formula is unknown or false
+                if successor_state in parents or \
+                        successor_component.interpretation[successor].get(self.ctl) is not True:
                     continue
-                if (component, s) not in visited:
-                    path.append((box_stack[:-1], s))
-                    full_path = self.find_path(path, component, visited)
-                    if full_path is not None:
-                        return full_path
-                    path.pop()
+                parents[successor_state] = state
+                box_stacks[successor_state] = box_stack
+                queue.append(successor_state)
         return None
 
     def __str__(self):
         sub1 = self.ctl.subformula(0).subformula(0)
         sub2 = self.ctl.subformula(0).subformula(1)
-        if self.expected_value:
-            sub1_path = self.path[:-1]
-            sub2_box_stack, sub2_node = self.path[-1]
-            return str(self.ctl) + " holds in " + state_str(self.box_stack, self.node) + " because " + str(sub1) + \
-                " holds along the path " + " -> ".join(state_str(box_stack, node) for box_stack, node in sub1_path) + \
-                " and " + str(sub2) + " holds in " + state_str(sub2_box_stack, sub2_node)
-        else:
+        if not self.expected_value:
             return str(self.ctl) + " does not hold in " + state_str(self.box_stack, self.node) + \
                    " but cannot give a witness for the non-existence of a path."
+        if self.path is None:
+            return str(self.ctl) + " holds in " + state_str(self.box_stack, self.node) + \
+                   " but no witness path could be found."
+        sub1_path = self.path[:-1]
+        sub2_box_stack, sub2_node = self.path[-1]
+        if not sub1_path:
+            return str(self.ctl) + " holds in " + state_str(self.box_stack, self.node) + " because " + str(sub2) + \
+                " holds"
+        return str(self.ctl) + " holds in " + state_str(self.box_stack, self.node) + " because " + str(sub1) + \
+            " holds along the path " + " -> ".join(state_str(box_stack, node) for box_stack, node in sub1_path) + \
+            " and " + str(sub2) + " holds in " + state_str(sub2_box_stack, sub2_node)
 
 
 class AlwaysWitness(Witness):
 
     def __init__(self, machine, box_stack, node, ctl, expected_value):
         super().__init__(machine, box_stack, node, ctl, expected_value)
-        self.cycle, self.cycle_index = self.find_cycle([(self.box_stack, self.node)], [(self.component, self.node)])
-        self.reasons = self.find_reasons()
-
-    def find_reasons(self):
+        self.cycle, self.cycle_index = None, None
         if self.expected_value:
-            sub = self.ctl.subformula(0).subformula(0)
-            return [generate_witness(self.machine, box_stack, node, sub, True) for (box_stack, node) in self.cycle]
-        else:
-            return []
+            self.cycle, self.cycle_index = self.find_cycle()
 
-    def find_cycle(self, bs_path, comp_path):
-        if self.expected_value is False:
-            return None
-        box_stack, node = bs_path[-1]
-        component, node = comp_path[-1]
-        # if we visited the node already we found a cycle
-        if (component, node) in comp_path[:-1]:
-            idx = comp_path.index((component, node))
-            return bs_path, idx
-        # otherwise, the always formula must hold in some successor
-        successors = component.base_component.transitions[node]
-        for s in successors:
-            # ignore successors in which the always formula is unknown or false
-            if self.ctl not in component.interpretation[s] or component.interpretation[s][self.ctl] is False:
-                continue
-            bs_path.append((box_stack, s))
-            comp_path.append((component, s))
-            full_cycle = self.find_cycle(bs_path, comp_path)
-            if full_cycle is not None:
-                return full_cycle
-            bs_path.pop()
-            comp_path.pop()
-        # entering a box
-        if isinstance(node, rsm.BoxNode) and node.is_call_node:
-            component = component.box_mapping[node.box]
-            successors = component.base_component.transitions[node.node]
-            for s in successors:
+    def reason_specs(self):
+        if self.cycle is None:
+            return []
+        sub = self.ctl.subformula(0).subformula(0)
+        return [(box_stack, node, sub, True) for (box_stack, node) in self.cycle]
+
+    def find_cycle(self):
+        """
+        Search for a shortest lasso along which the always formula holds: a shortest path to the nearest state lying
+        on a cycle, followed by a shortest cycle back to that state. If the path reaches a state without successors,
+        i.e., a deadlock or an exit node of the initial component, before any cycle, it ends there instead.
+
+        :return: (path, cycle_index), where path is a list of (box_stack, node) and the cycle starts at cycle_index and
+        ends with the last element of the path. cycle_index is None if the path ends in a state without successors.
+        (None, None) if no such path exists.
+        """
+        # breadth-first search of all reachable states in which the always formula holds
+        start = (self.component, self.node)
+        box_stacks = {start: self.box_stack}
+        parents = {start: None}
+        edges = {}
+        order = [start]
+        for state in order:
+            edges[state] = []
+            for box_stack, successor_component, successor in self.successors(box_stacks[state], *state):
+                successor_state = (successor_component, successor)
                 # ignore successors in which the always formula is unknown or false
-                if self.ctl not in component.interpretation[s] or component.interpretation[s][self.ctl] is False:
+                if successor_component.interpretation[successor].get(self.ctl) is not True:
                     continue
-                bs_path.append((box_stack + [node.box], s))
-                comp_path.append((component, s))
-                full_cycle = self.find_cycle(bs_path, comp_path)
-                if full_cycle is not None:
-                    return full_cycle
-                bs_path.pop()
-                comp_path.pop()
-        # leaving a box
-        elif isinstance(node, rsm.Node) and component.base_component.is_exit(node):
-            # for the case where we reach an exit node in the initial component in sub holds
-            if not box_stack:
-                idx = len(bs_path)
-                bs_path.append((box_stack, node))
-                return bs_path, idx
-            last_box = box_stack[-1]
-            component = box_stack_to_context(self.machine, box_stack[:-1])
-            node = component.base_component.get_return_node(last_box, node)
-            successors = component.base_component.transitions[node]
-            for s in successors:
-                # ignore successors in which ctl is unknown or false
-                if self.ctl not in component.interpretation[s] or component.interpretation[s][self.ctl] is False:
+                edges[state].append(successor_state)
+                if successor_state not in parents:
+                    parents[successor_state] = state
+                    box_stacks[successor_state] = box_stack
+                    order.append(successor_state)
+
+        # states on a cycle are the ones in non-trivial strongly connected components
+        component_of = strongly_connected_components(order, edges)
+        component_sizes = Counter(component_of.values())
+
+        # the order of the breadth-first search is ordered by distance from the start
+        for state in order:
+            if not edges[state]:
+                return trace_path(state, parents, box_stacks), None
+            if component_sizes[component_of[state]] > 1 or state in edges[state]:
+                path = trace_path(state, parents, box_stacks)
+                cycle = self.find_shortest_cycle(state, box_stacks[state], edges, component_of)
+                return path[:-1] + cycle, len(path) - 1
+        return None, None
+
+    def find_shortest_cycle(self, start, start_box_stack, edges, component_of):
+        """
+        Breadth-first search for a shortest cycle from start back to start within its strongly connected component.
+
+        :return: the cycle as list of (box_stack, node), starting and ending with start
+        """
+        box_stacks = {start: start_box_stack}
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            state = queue.popleft()
+            for box_stack, successor_component, successor in self.successors(box_stacks[state], *state):
+                successor_state = (successor_component, successor)
+                if successor_state == start:
+                    # the box stack may differ when closing the cycle, so we append the last step explicitly
+                    return trace_path(state, parents, box_stacks) + [(box_stack, successor)]
+                if successor_state in parents or successor_state not in edges[state] or \
+                        component_of[successor_state] != component_of[start]:
                     continue
-                bs_path.append((box_stack[:-1], s))
-                comp_path.append((component, s))
-                full_cycle = self.find_cycle(bs_path, comp_path)
-                if full_cycle is not None:
-                    return full_cycle
-                bs_path.pop()
-                comp_path.pop()
-        return None
+                parents[successor_state] = state
+                box_stacks[successor_state] = box_stack
+                queue.append(successor_state)
+        raise ValueError("Could not close the cycle through " + state_str(start_box_stack, start[1]))
 
     def __str__(self):
         sub = self.ctl.subformula(0).subformula(0)
-        if self.expected_value:
-            ctx_note = " (the cyclic node is reached with two different box stacks [" + \
-                       state_str(*(self.cycle[self.cycle_index])) + " and " + state_str(*(self.cycle[-1])) + \
-                       "], however both box stacks produce the same context, so it is indeed a cycle)"
-            return str(self.ctl) + " holds in " + state_str(self.box_stack, self.node) + " because " + str(sub) + \
-                " holds along the path " + " -> ".join(("[CYCLE START]" if i == self.cycle_index else "") +
-                                                       state_str(box_stack, node)
-                                                       for i, (box_stack, node) in enumerate(self.cycle)) + \
-                (ctx_note if self.cycle[self.cycle_index][0] != self.cycle[-1][0] else "")
-        else:
+        if not self.expected_value:
             return str(self.ctl) + " does not hold in " + state_str(self.box_stack, self.node) + \
                    " but cannot give a witness for the non-existence of a path."
+        if self.cycle is None:
+            return str(self.ctl) + " holds in " + state_str(self.box_stack, self.node) + \
+                   " but no witness path could be found."
+        path_str = " -> ".join(("[CYCLE START]" if i == self.cycle_index else "") + state_str(box_stack, node)
+                               for i, (box_stack, node) in enumerate(self.cycle))
+        if self.cycle_index is None:
+            box_stack, node = self.cycle[-1]
+            end = "an exit node of the initial component" if not box_stack and \
+                box_stack.context().base_component.is_exit(node) else "a deadlock"
+            return str(self.ctl) + " holds in " + state_str(self.box_stack, self.node) + " because " + str(sub) + \
+                " holds along the path " + path_str + ", which ends in " + end
+        ctx_note = " (the cyclic node is reached with two different box stacks [" + \
+                   state_str(*(self.cycle[self.cycle_index])) + " and " + state_str(*(self.cycle[-1])) + \
+                   "], however both box stacks produce the same context, so it is indeed a cycle)"
+        return str(self.ctl) + " holds in " + state_str(self.box_stack, self.node) + " because " + str(sub) + \
+            " holds along the path " + path_str + \
+            (ctx_note if self.cycle[self.cycle_index][0] != self.cycle[-1][0] else "")
 
 
-def generate_witness(machine, box_stack, node, ctl, expected_value):
+def create_witness(machine, box_stack, node, ctl, expected_value):
+    """
+    Create the witness for ctl having expected_value in node with the given box stack, without generating its reasons.
+
+    :return: the witness, an instance of the Witness subclass handling the outermost operator of ctl
+    """
     if is_propositional(ctl):
         return LocalWitness(machine, box_stack, node, ctl, expected_value)
     if isinstance(ctl, CTL.Not):
@@ -337,25 +340,130 @@ def generate_witness(machine, box_stack, node, ctl, expected_value):
             return UntilWitness(machine, box_stack, node, ctl, expected_value)
         if isinstance(path_formula, CTL.G):
             return AlwaysWitness(machine, box_stack, node, ctl, expected_value)
+    raise ValueError("Cannot generate a witness for " + str(ctl))
+
+
+def witness_key(machine, box_stack, node, ctl, expected_value):
+    """
+    :return: the key under which witnesses are shared, i.e., (contextualized component, node, formula, expected value),
+    since the reasons of a witness only depend on the context and not on the concrete box stack
+    """
+    return box_stack.context(), node, ctl, expected_value
+
+
+def generate_witness(machine, box_stack, node, ctl, expected_value, memo=None):
+    """
+    Generate the witness for ctl having expected_value in node with the given box stack.
+    Sub-witnesses are memoized by witness_key. Hence, each of them is generated only once and shared by all witnesses
+    relying on it, i.e., the witnesses form a DAG.
+
+    :param memo: dictionary of already generated witnesses, shared between the recursive calls
+    :return: the witness
+    """
+    if memo is None:
+        memo = {}
+    key = witness_key(machine, box_stack, node, ctl, expected_value)
+    if key in memo:
+        return memo[key]
 
+    witness = create_witness(machine, box_stack, node, ctl, expected_value)
 
-def is_propositional(ctl):
-    if isinstance(ctl, CTL.AtomicProposition) or isinstance(ctl, CTL.Bool):
-        return True
-    if isinstance(ctl, CTL.E) or isinstance(ctl, CTL.A):
-        return False
-    return all(is_propositional(sub) for sub in ctl.subformulas())
+    # register the witness before generating its reasons, such that reasons referring back to it are shared as well
+    witness.index = len(memo)
+    memo[key] = witness
+    witness.reasons = [generate_witness(machine, bs, n, f, v, memo) for bs, n, f, v in witness.reason_specs()]
+    return witness
 
 
-def recursive_str(witness, depth=0, max_depth=float('Inf')):
+def iterate_witnesses(machine, box_stack, node, ctl, expected_value):
+    """
+    Traverse the witness DAG for ctl having expected_value in node without keeping the witnesses in memory.
+    Each witness is numbered when it is first referenced, so it can be yielded together with the numbers of its reasons
+    right after it was created. Only the numbers of the witnesses are remembered (by witness_key), not the witnesses.
+
+    :return: generator of (witness, list of numbers of its reasons), the root witness having number 0
+    """
+    indices = {witness_key(machine, box_stack, node, ctl, expected_value): 0}
+    stack = [(0, (box_stack, node, ctl, expected_value))]
+    while stack:
+        index, spec = stack.pop()
+        witness = create_witness(machine, *spec)
+        witness.index = index
+        reason_indices = []
+        new_reasons = []
+        for reason_spec in witness.reason_specs():
+            key = witness_key(machine, *reason_spec)
+            if key not in indices:
+                indices[key] = len(indices)
+                new_reasons.append((indices[key], reason_spec))
+            reason_indices.append(indices[key])
+        # push in reverse order, such that the reasons are visited in order
+        stack += reversed(new_reasons)
+        yield witness, reason_indices
+
+
+def recursive_str(witness, depth=0, max_depth=float('Inf'), printed=None):
+    """
+    :return: list of lines describing the witness and its reasons, indented by depth. Each witness of the DAG is
+    described once along with its number, later occurrences only refer back to that number.
+    """
     if depth > max_depth:
-        return ""
-    out = ["\t" * depth + str(witness)]
+        return []
+    if printed is None:
+        printed = set()
+    if witness.index in printed:
+        return ["\t" * depth + "see #" + str(witness.index) + ": " + witness.summary()]
+    printed.add(witness.index)
+    out = ["\t" * depth + "#" + str(witness.index) + " " + str(witness)]
     for reason in witness.reasons:
-        out += recursive_str(reason, depth+1)
+        out += recursive_str(reason, depth+1, max_depth, printed)
     return out
 
 
+def trace_path(state, parents, box_stacks):
+    """
+    Follow the parent pointers of a breadth-first search back from state.
+
+    :param state: the last (component, node) of the path
+    :param parents: dictionary mapping each visited (component, node) to its predecessor, None for the start
+    :param box_stacks: dictionary mapping each visited (component, node) to the box stack it was reached with
+    :return: the path as list of (box_stack, node), from the start of the search to state
+    """
+    path = []
+    while state is not None:
+        path.append((box_stacks[state], state[1]))
+        state = parents[state]
+    path.reverse()
+    return path
+
+
+def write_witness_jsonl(f, machine, box_stack, node, ctl, expected_value, formula_index=None):
+    """
+    Write the witness DAG for ctl having expected_value in node to the file f in JSON Lines format while it is
+    traversed, i.e., one JSON object per witness with its number, the kind of witness, the formula, its value, the
+    state (node, contextualized component and box stack), a description and the numbers of its reasons.
+
+    :param formula_index: optional number of the checked formula added to each line, to tell witnesses of several
+    formulas apart
+    """
+    for witness, reason_indices in iterate_witnesses(machine, box_stack, node, ctl, expected_value):
+        witness_dict = {
+            "id": witness.index,
+            "kind": type(witness).__name__,
+            "formula": str(witness.ctl),
+            "value": witness.expected_value,
+            "node": witness.node.name,
+            "component": witness.component.name,
+            "box_stack": [b.name for b in witness.box_stack],
+            "description": str(witness),
+            "reasons": reason_indices
+        }
+        if formula_index is not None:
+            witness_dict["formula_index"] = formula_index
+        f.write(json.dumps(witness_dict))
+        f.write("\n")
+
+
 def box_stack_str(box_stack):
     return "[" + ", ".join(b.name for b in box_stack) + "]"
 
@@ -0,0 +1,211 @@
+""" Race several checking strategies on the same formula in separate processes and take the first answer
+"""
+
+import io
+import logging
+import multiprocessing
+import queue
+import random
+import traceback
+import budget
+import stats
+from checker import ExpansionHeuristics, check_exhaustive, check_lazy, record_context_counts, known_fraction, \
+    remove_unreachable_components
+from reduction import reduce_rsm
+from sequential_checker import check_sequential
+from prestar_checker import check_prestar
+from model.witness import generate_witness, recursive_str, write_witness_jsonl
+
+logger = logging.getLogger(__name__)
+
+# strategies raced if none are given, see parse_strategy
+DEFAULT_STRATEGIES = ["getnext", "all", "priority", "exhaustive", "random@1", "random@2", "getnext@1"]
+
+# seconds between checks whether a strategy died without reporting its result
+POLL_INTERVAL = 0.5
+
+
+class Strategy:
+    """
+    a class to represent one way of checking a formula
+
+    Attributes
+    ----------
+
+    name : str
+        the specification the strategy was parsed from, e.g. random@1
+    approach : str
+        one of "lazy", "exhaustive", "sequential" or "prestar"
+    expansion_heuristic : ExpansionHeuristics or None
+        the expansion heuristic of the lazy approach
+    seed : int or None
+        seed of the random choices, if set the nondeterministic choices of GetNextExpansion are randomized as well
+    """
+
+    def __init__(self, name, approach, expansion_heuristic=None, seed=None):
+        self.name = name
+        self.approach = approach
+        self.expansion_heuristic = expansion_heuristic
+        self.seed = seed
+
+
+def parse_strategy(spec):
+    """
+    Parse a strategy of the form <name>[@<seed>], where name is an expansion heuristic (getnext, random, all or
+    priority), exhaustive, sequential or prestar.
+
+    :param spec: the specification of the strategy
+    :return: the Strategy
+    """
+    name, _, seed = spec.partition("@")
+    try:
+        seed = int(seed) if seed else None
+    except ValueError:
+        raise ValueError("Invalid seed " + seed + " in strategy " + spec)
+    if name in ("exhaustive", "sequential", "prestar"):
+        return Strategy(spec, name, seed=seed)
+    try:
+        return Strategy(spec, "lazy", ExpansionHeuristics[name.upper()], seed)
+    except KeyError:
+        raise ValueError("Invalid strategy " + spec + ", must be one of exhaustive, sequential, prestar, " +
+                         ", ".join(h.name.lower() for h in ExpansionHeuristics) + ", optionally followed by @<seed>")
+
+
+def run_strategy(strategy, machine, ctl, index, limits, witness_format, results, reduce=False,
+                 randomize_nondeterminism=False):
+    """
+    Check ctl with the given strategy and put the outcome into the results queue. This is run in a forked process, so
+    the machine is a private copy that may be modified.
+
+    :param strategy: the Strategy to use
+    :param machine: the parsed RSM
+    :param ctl: the formula to check
+    :param index: the index of the formula in its CTL file
+    :param limits: (max_time, max_memory, deadline) of the budget, see budget.start
+    :param witness_format: None to not generate a witness, otherwise "text" or "jsonl"
+    :param results: the multiprocessing queue for the outcome
+    :param reduce: whether the RSM is reduced w.r.t. ctl before checking it, see reduce_rsm
+    :param randomize_nondeterminism: whether the nondeterministic choices of GetNextExpansion are randomized even if
+    the strategy has no seed
+    """
+    # the log of the winner is written by the parent process
+    logging.disable(logging.CRITICAL)
+    statistics = stats.reset()
+    if strategy.seed is not None:
+        random.seed(strategy.seed)
+    outcome = {"strategy": strategy.name}
+    budget.start(*limits)
+    try:
+        if reduce:
+            with statistics.phase("reduction"):
+                num_nodes, num_reduced_nodes = reduce_rsm(machine, ctl)
+            statistics.info["reduction_ratio"] = num_reduced_nodes / num_nodes
+            remove_unreachable_components(machine)
+        with statistics.phase("checking"):
+            if strategy.approach == "sequential":
+                check_sequential(machine, ctl)
+            elif strategy.approach == "prestar":
+                check_prestar(machine, ctl)
+            elif strategy.approach == "exhaustive":
+                check_exhaustive(machine, ctl)
+            else:
+                check_lazy(machine, ctl, strategy.expansion_heuristic,
+                           strategy.seed is not None or randomize_nondeterminism)
+        outcome["result"] = machine.initial_component.interpretation[machine.initial_node][ctl]
+        outcome["exceeded"] = None
+    except budget.BudgetExceeded as e:
+        outcome["result"] = "unknown"
+        outcome["exceeded"] = e.reason
+        if strategy.approach in ("lazy", "exhaustive"):
+            record_context_counts()
+        statistics.info["known_fraction"] = known_fraction(machine, ctl)
+    except Exception:
+        results.put({"strategy": strategy.name, "error": traceback.format_exc().strip().splitlines()[-1]})
+        return
+    budget.stop()
+
+    memory = stats.peak_memory()
+    if memory is not None:
+        statistics.peak("memory", memory)
+    outcome["statistics"] = statistics.to_dict()
+    outcome["initial_component"] = machine.initial_component.name
+    outcome["components"] = len(machine.contextualized_components)
+    outcome["states"] = sum(len(c.base_component.nodes) for c in machine.contextualized_components)
+
+    if witness_format is not None and outcome["exceeded"] is None:
+        f = io.StringIO()
+        if witness_format == "jsonl":
+            write_witness_jsonl(f, machine, machine.empty_box_stack, machine.initial_node, ctl, outcome["result"],
+                                index)
+        else:
+            witness = generate_witness(machine, machine.empty_box_stack, machine.initial_node, ctl, outcome["result"])
+            for line in recursive_str(witness):
+                f.write(line)
+                f.write("\n")
+        outcome["witness"] = f.getvalue()
+
+    results.put(outcome)
+
+
+def race(machine, ctl, index, strategies, limits, witness_format=None):
+    """
+    Check ctl with all strategies in parallel, one forked process each. As soon as one strategy determines the value
+    of ctl, the others are killed.
+
+    :param machine: the parsed RSM, it is not modified
+    :param ctl: the formula to check
+    :param index: the index of the formula in its CTL file
+    :param strategies: list of Strategy
+    :param limits: (max_time, max_memory, deadline) of the budget of each strategy, see budget.start
+    :param witness_format: None to not generate a witness, otherwise "text" or "jsonl"
+    :return: the outcome of the winning strategy (or of the last one if none determined ctl) as put into the queue by
+    run_strategy, extended by "outcomes", which maps the name of each strategy to won, killed, timeout, memout or error
+    """
+    # forking shares the parsed RSM with all strategies and does not re-run the main script in the processes
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = {}
+    for strategy in strategies:
+        process = context.Process(target=run_strategy,
+                                  args=(strategy, machine, ctl, index, limits, witness_format, results),
+                                  daemon=True)
+        process.start()
+        processes[strategy.name] = process
+
+    outcomes = {}
+    winner = None
+    last = None
+    while winner is None and len(outcomes) < len(processes):
+        try:
+            outcome = results.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            # a strategy that was killed, e.g. by the operating system, cannot report its outcome
+            for name, process in processes.items():
+                if name not in outcomes and not process.is_alive() and results.empty():
+                    outcomes[name] = "error"
+                    logger.info("    Strategy " + name + " died with exit code " + str(process.exitcode))
+            continue
+        name = outcome["strategy"]
+        if "error" in outcome:
+            outcomes[name] = "error"
+            logger.info("    Strategy " + name + " failed: " + outcome["error"])
+        elif outcome["exceeded"] is not None:
+            outcomes[name] = outcome["exceeded"]
+            last = outcome
+        else:
+            outcomes[name] = "won"
+            winner = outcome
+
+    for name, process in processes.items():
+        if process.is_alive():
+            process.terminate()
+            outcomes.setdefault(name, "killed")
+        process.join()
+    results.close()
+
+    if winner is not None:
+        logger.info("    Strategy " + winner["strategy"] + " won the portfolio after " +
+                    format(winner["statistics"]["phases"]["checking"]["time"], ".3f") + " seconds of checking")
+    outcome = winner or last or {"strategy": None, "result": "unknown", "exceeded": "error", "statistics": None}
+    outcome["outcomes"] = outcomes
+    return outcome
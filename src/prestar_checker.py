@@ -0,0 +1,351 @@
+"""
+Exact checking of RSMs, also with recursion, by pre* saturation on the pushdown system encoding the RSM
+"""
+
+from pyModelChecking import CTL
+from sequential_checker import SequentialChecker
+from model.rsm import strongly_connected_components
+from model import rsm
+import budget
+import stats
+
+# the accepting sink state of the P-automata, a head leads to it if all configurations with this head satisfy the
+# formula, whatever the stack below it
+ACCEPT = "accept"
+
+
+class Saturation:
+    """
+    a class to hold the P-automaton of an EU or EG formula while it is saturated, see PrestarChecker
+
+    heads are pairs of a frame (by number) and a node that is not an exit node of the component of the frame
+
+    Attributes
+    ----------
+
+    targets : dict { int : dict { node : set } }
+        for each frame and node, the states the automaton reaches from the head: ACCEPT or the exit nodes x of the
+        component, standing for the control states q_x
+    sub_values : dict { int : tuple(dict { node : bool }) }
+        the values of the subformulas (sub1 and sub2 for EU, sub for EG) in the nodes of each frame
+    callees : dict { int : dict { Box : int } }
+        the frame each box of a frame leads to
+    dependents : dict { (int, node) : list[(int, node)] }
+        heads whose targets include those of the given head, by rules that do not push
+    pushers : dict { (int, node) : list[(int, node)] }
+        heads of call nodes whose rules push the given head
+    worklist : list[((int, node), target)]
+        targets added to heads but not yet propagated
+    """
+
+    def __init__(self):
+        self.targets = {}
+        self.sub_values = {}
+        self.callees = {}
+        self.dependents = {}
+        self.pushers = {}
+        self.worklist = []
+
+    def add(self, head, target):
+        targets = self.targets[head[0]][head[1]]
+        if target in targets or ACCEPT in targets:
+            return
+        if target is ACCEPT:
+            # the sink subsumes all other targets
+            targets.clear()
+        targets.add(target)
+        self.worklist.append((head, target))
+
+    def depend(self, head, other):
+        """
+        Let the targets of head include those of other, now and later on.
+        """
+        self.dependents.setdefault(other, []).append(head)
+        for target in list(self.targets[other[0]][other[1]]):
+            self.add(head, target)
+
+
+class PrestarChecker(SequentialChecker):
+    """
+    a class to check a CTL formula on an RSM, possibly with recursion, by automata-theoretic pre* saturation as for
+    pushdown systems (as in Schwoon's thesis and the PuMoC tool)
+
+    the RSM is read as a pushdown system whose control state is p inside a component or q_x right after leaving it
+    through exit node x, and whose stack holds the current node on top of the boxes entered so far. transitions to
+    exit nodes pop, call nodes push the successors of the entry node in the callee on top of the box, and the head
+    <q_x, b> continues in the return node (b, x). the exit nodes of the initial component are never left. sets of
+    configurations are regular and given by P-automata.
+
+    the truth values of the subformulas in a configuration only depend on its head and the context of the current
+    component, i.e., the values in the return nodes below. annotating the stack symbols with the contexts (the
+    reduction of regular to simple valuations by Esparza, Kucera and Schwoon) makes the valuations simple, so the
+    P-automaton of an EU or EG formula is obtained by saturating the heads of the annotated system, i.e., the nodes of
+    the frames (base component, context w.r.t. the lower existential subformulas) reachable from the checked frame.
+    its states are the control states and an accepting sink: from a head, it reaches the sink if all configurations
+    with this head satisfy the formula, and q_x if those satisfy it whose continuation after popping through exit node
+    x does. the latter is given by the context of the formula itself, so the values of the formula in a component with
+    a complete context are read off the automaton, while the callees are evaluated as in SequentialChecker. EX only
+    needs one step of pre, which is the same as in SequentialChecker.
+
+    EU formulas are saturated as pre* restricted to the heads satisfying sub1, starting from the heads satisfying
+    sub2. EG formulas are saturated as pre* of the pops restricted to the heads satisfying sub, then the heads that
+    reach a cycle (or a node without successors) in the head reachability graph accept. its edges skip boxes the
+    callee returns from along such paths. the fixpoints are exact, also for recursive RSMs, and no ternary logic is
+    involved.
+
+    Attributes
+    ----------
+
+    saturations : dict { CTL : Saturation }
+        the P-automaton of each EU and EG formula, extended by the frames explored so far
+    frames : dict { (Component, frozenset) : int }
+        the number of each frame
+    frame_keys : list[(Component, frozenset)]
+        the frame of each number
+    exit_nodes : dict { Component : set(node) }
+        the exit nodes of each base component
+
+    Methods
+    -------
+
+    saturate(f, component, context)
+        extend the P-automaton of f by the frames reachable from the given one and return its number
+    """
+
+    def __init__(self, machine, ctl):
+        super().__init__(machine, ctl)
+        self.saturations = {}
+        self.frames = {}
+        self.frame_keys = []
+        self.exit_nodes = {}
+
+    def get_exit_nodes(self, component):
+        exit_nodes = self.exit_nodes.get(component)
+        if exit_nodes is None:
+            exit_nodes = self.exit_nodes[component] = set(component.get_exit_nodes())
+        return exit_nodes
+
+    def get_frame(self, component, context):
+        frame = self.frames.get((component, context))
+        if frame is None:
+            frame = self.frames[(component, context)] = len(self.frame_keys)
+            self.frame_keys.append((component, context))
+        return frame
+
+    def lower_callee_context(self, f, component, context, box):
+        """
+        :return: the context of the component referenced by box w.r.t. the existential subformulas of f except f
+        """
+        items = []
+        for ex in box.exit_nodes:
+            return_node = component.get_return_node(box, ex)
+            for sub in self.existential_subformulas[f]:
+                if sub is not f:
+                    items.append(((ex, sub), self.evaluate_subformula(sub, component, context)[return_node]))
+        return frozenset(items)
+
+    def evaluate_until(self, f, component, context):
+        frame = self.saturate(f, component, frozenset(item for item in context if item[0][1] is not f))
+        saturation = self.saturations[f]
+        # the stutter values are sub2 for EU and sub for EG
+        values = self.exit_values(f, component, context, saturation.sub_values[frame][-1])
+        exits = dict(values)
+        for n, targets in saturation.targets[frame].items():
+            values[n] = any(t is ACCEPT or exits[t] for t in targets)
+        return values
+
+    evaluate_always = evaluate_until
+
+    def saturate(self, f, component, context):
+        """
+        Extend the P-automaton of the EU or EG formula f by the heads of the frames reachable from the given one that
+        are not yet part of it. The frames explored before only lead to each other, so their targets are final.
+
+        :param context: the context w.r.t. the existential subformulas of f except f
+        :return: the number of the frame
+        """
+        saturation = self.saturations.get(f)
+        if saturation is None:
+            saturation = self.saturations[f] = Saturation()
+        root = self.get_frame(component, context)
+        if root in saturation.targets:
+            return root
+
+        path_formula = f.subformula(0)
+        new_frames = [root]
+        saturation.targets[root] = {}
+        for frame in new_frames:
+            component, context = self.frame_keys[frame]
+            exit_nodes = self.get_exit_nodes(component)
+            saturation.targets[frame] = {n: set() for n in component.nodes if n not in exit_nodes}
+            saturation.sub_values[frame] = tuple(self.evaluate_subformula(sub, component, context)
+                                                 for sub in path_formula.subformulas())
+            saturation.callees[frame] = {}
+            for box in component.boxes:
+                callee = self.get_frame(box.component, self.lower_callee_context(f, component, context, box))
+                saturation.callees[frame][box] = callee
+                if callee not in saturation.targets:
+                    saturation.targets[callee] = {}
+                    new_frames.append(callee)
+            budget.check()
+        stats.current().count("saturated_frames", len(new_frames))
+
+        is_until = isinstance(path_formula, CTL.U)
+        for frame in new_frames:
+            component, _ = self.frame_keys[frame]
+            exit_nodes = self.get_exit_nodes(component)
+            # the rules of EU formulas are restricted to sub1, those of EG formulas to sub
+            allowed = saturation.sub_values[frame][0]
+            for n in saturation.targets[frame]:
+                if is_until and saturation.sub_values[frame][1][n]:
+                    saturation.add((frame, n), ACCEPT)
+                elif allowed[n]:
+                    for t in component.transitions[n]:
+                        if t in exit_nodes:
+                            saturation.add((frame, n), t)
+                        else:
+                            saturation.depend((frame, n), (frame, t))
+                    if isinstance(n, rsm.BoxNode) and n.is_call_node:
+                        self.add_call_rules(saturation, frame, n)
+            self.propagate(saturation)
+
+        if not is_until:
+            self.add_repeating_heads(saturation, new_frames)
+        return root
+
+    def add_call_rules(self, saturation, frame, call_node):
+        """
+        Add the rules of a call node, which push the successors of the entry node on top of the box.
+        """
+        callee = call_node.box.component
+        callee_frame = saturation.callees[frame][call_node.box]
+        callee_exits = self.get_exit_nodes(callee)
+        for s in callee.transitions[call_node.node]:
+            if s in callee_exits:
+                # the callee is left right away
+                self.pop_to(saturation, (frame, call_node), s, callee_frame)
+            else:
+                saturation.pushers.setdefault((callee_frame, s), []).append((frame, call_node))
+                for target in list(saturation.targets[callee_frame][s]):
+                    self.pop_to(saturation, (frame, call_node), target, callee_frame)
+
+    def pop_to(self, saturation, head, target, callee_frame):
+        """
+        Let the head of a call node reach what the return node of its box through the exit node target reaches (or
+        ACCEPT if target is ACCEPT).
+        """
+        if target is ACCEPT:
+            saturation.add(head, ACCEPT)
+            return
+        frame, call_node = head
+        return_node = self.frame_keys[frame][0].return_node_dict.get((call_node.box, target))
+        if return_node is not None:
+            saturation.depend(head, (frame, return_node))
+        elif saturation.sub_values[callee_frame][-1][target]:
+            # the box has no return node for the exit node, so the path stays there forever
+            saturation.add(head, ACCEPT)
+
+    def propagate(self, saturation):
+        worklist = saturation.worklist
+        while worklist:
+            head, target = worklist.pop()
+            for dependent in saturation.dependents.get(head, ()):
+                saturation.add(dependent, target)
+            for pusher in saturation.pushers.get(head, ()):
+                self.pop_to(saturation, pusher, target, head[0])
+
+    def add_repeating_heads(self, saturation, new_frames):
+        """
+        Let the heads of new frames accept that satisfy sub of an EG formula and reach a cycle or a node without
+        successors via such heads, without popping. The edges of the head reachability graph lead to the successors
+        in the same frame and in the callees and, if the callee is left through exit node x, to the return node of x.
+        """
+        edges = {}
+        repeating = []
+        new_frame_set = set(new_frames)
+        for frame in new_frames:
+            component, _ = self.frame_keys[frame]
+            exit_nodes = self.get_exit_nodes(component)
+            values = saturation.sub_values[frame][0]
+            targets = saturation.targets[frame]
+            for n in targets:
+                if not values[n]:
+                    continue
+                head = (frame, n)
+                successors = [(frame, t) for t in component.transitions[n] if t not in exit_nodes]
+                has_successors = len(component.transitions[n]) > 0
+                if isinstance(n, rsm.BoxNode) and n.is_call_node:
+                    box = n.box
+                    callee_frame = saturation.callees[frame][box]
+                    callee_exits = self.get_exit_nodes(box.component)
+                    callee_transitions = box.component.transitions[n.node]
+                    has_successors = has_successors or len(callee_transitions) > 0
+                    returns = []
+                    for s in callee_transitions:
+                        if s in callee_exits:
+                            returns.append(s)
+                        else:
+                            successors.append((callee_frame, s))
+                            returns.extend(t for t in saturation.targets[callee_frame][s] if t is not ACCEPT)
+                    for ex in returns:
+                        return_node = component.return_node_dict.get((box, ex))
+                        if return_node is not None:
+                            successors.append((frame, return_node))
+                edges[head] = []
+                if ACCEPT in targets[n] or not has_successors:
+                    repeating.append(head)
+                for successor in successors:
+                    successor_frame, successor_node = successor
+                    if not saturation.sub_values[successor_frame][0][successor_node]:
+                        continue
+                    if successor_frame in new_frame_set:
+                        edges[head].append(successor)
+                    elif ACCEPT in saturation.targets[successor_frame][successor_node]:
+                        # the heads of frames saturated before are final
+                        repeating.append(head)
+            budget.check()
+
+        sccs = strongly_connected_components(edges, edges)
+        scc_sizes = {}
+        for scc in sccs.values():
+            scc_sizes[scc] = scc_sizes.get(scc, 0) + 1
+        predecessors = {head: [] for head in edges}
+        for head, successors in edges.items():
+            if scc_sizes[sccs[head]] > 1 or head in successors:
+                repeating.append(head)
+            for successor in successors:
+                predecessors[successor].append(head)
+
+        accepting = set(repeating)
+        stack = list(repeating)
+        while stack:
+            head = stack.pop()
+            for p in predecessors[head]:
+                if p not in accepting:
+                    accepting.add(p)
+                    stack.append(p)
+        for frame, n in accepting:
+            saturation.targets[frame][n] = {ACCEPT}
+
+
+def check_prestar(machine, ctl):
+    """
+    Check ctl on an RSM exactly by pre* saturation on the pushdown system encoding the RSM, see PrestarChecker. Unlike
+    the sequential approach, the RSM may be recursive. Afterwards, the machine consists of the contextualized
+    components reachable from the initial component, with all subformulas known in all nodes, such that witnesses can
+    be generated as for the other approaches.
+
+    :param machine: the RSM to check against
+    :param ctl: the ctl to check
+    :return: the truth value of ctl in the initial node
+    """
+    statistics = stats.current()
+    prestar_checker = PrestarChecker(machine, ctl)
+    with statistics.phase("saturate"):
+        result = prestar_checker.check()
+    with statistics.phase("contextualize"):
+        prestar_checker.contextualize()
+    statistics.counters["summaries"] = len(prestar_checker.values)
+    statistics.peak("contextualized_components", len(machine.contextualized_components))
+    statistics.peak("contextualized_nodes", sum(len(c.base_component.nodes) for c in machine.contextualized_components))
+    return result
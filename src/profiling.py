@@ -0,0 +1,98 @@
+""" Profiler hooks that can be switched on from the command line
+"""
+
+import cProfile
+import linecache
+import tracemalloc
+
+
+class CpuProfiler:
+    """
+    a class wrapping cProfile to profile the check of a single formula
+
+    Methods
+    -------
+
+    start()
+        start collecting timing information
+    stop(path_to_file)
+        stop collecting and dump the collected statistics to a .pstats file
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self, path_to_file):
+        self.profile.disable()
+        self.profile.dump_stats(path_to_file)
+
+
+class MemoryProfiler:
+    """
+    a class using tracemalloc snapshots to find the code locations allocating memory during lazy iterations
+
+    Attributes
+    ----------
+
+    top : int
+        number of allocation sites to report
+    sites : dict { (str, int) : [int, int] }
+        accumulated size and number of allocated blocks per source location (file, line) over all iterations
+
+    Methods
+    -------
+
+    start()
+        start tracing memory allocations
+    stop()
+        stop tracing memory allocations
+    start_iteration()
+        take a snapshot at the start of an iteration
+    end_iteration()
+        take a snapshot at the end of an iteration and attribute the difference to the allocating source lines
+    report()
+        return the top allocation sites as a list of dictionaries
+    """
+
+    def __init__(self, top=10):
+        self.top = top
+        self.sites = {}
+        self._snapshot = None
+        self._filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__),
+                         tracemalloc.Filter(False, linecache.__file__)]
+
+    def start(self):
+        self.sites = {}
+        tracemalloc.start()
+
+    def stop(self):
+        self._snapshot = None
+        tracemalloc.stop()
+
+    def start_iteration(self):
+        self._snapshot = tracemalloc.take_snapshot().filter_traces(self._filters)
+
+    def end_iteration(self):
+        if self._snapshot is None:
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces(self._filters)
+        for diff in snapshot.compare_to(self._snapshot, "lineno"):
+            if diff.size_diff <= 0:
+                continue
+            frame = diff.traceback[0]
+            site = self.sites.setdefault((frame.filename, frame.lineno), [0, 0])
+            site[0] += diff.size_diff
+            site[1] += diff.count_diff
+        self._snapshot = None
+
+    def report(self):
+        top_sites = sorted(self.sites.items(), key=lambda x: x[1][0], reverse=True)[:self.top]
+        return [{"file": filename,
+                 "line": lineno,
+                 "code": linecache.getline(filename, lineno).strip(),
+                 "size": size,
+                 "blocks": blocks}
+                for (filename, lineno), (size, blocks) in top_sites]
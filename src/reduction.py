@@ -0,0 +1,175 @@
+""" Reduce the base components of an RSM w.r.t. the atomic propositions of a formula before checking it
+"""
+
+from pyModelChecking import CTL
+from ctl_parser import get_subformulas
+from model import rsm
+
+
+def relevant_labels(ctl):
+    """
+    :param ctl: CTL formula
+    :return: the set of the names of the atomic propositions occurring in ctl
+    """
+    return {str(f) for fs in get_subformulas(ctl).values() for f in fs if isinstance(f, CTL.AtomicProposition)}
+
+
+def uses_next(ctl):
+    """
+    :param ctl: CTL formula
+    :return: whether ctl contains an EX subformula
+    """
+    return any(isinstance(f, CTL.E) and isinstance(f.subformula(0), CTL.X)
+               for fs in get_subformulas(ctl).values() for f in fs)
+
+
+def is_port(machine, component, node):
+    """
+    :return: whether node must be kept as it is, i.e., is an entry, exit or box node or the initial node
+    """
+    return isinstance(node, rsm.BoxNode) or component.is_entry(node) or component.is_exit(node) or \
+        node is machine.initial_node
+
+
+def remove_unreachable_nodes(machine, component):
+    """
+    Remove the nodes of a base component that cannot be reached from its entry nodes (or the initial node). Paths may
+    pass through boxes, i.e., from their call nodes to their return nodes. Entry, exit and box nodes are kept.
+
+    :return: the number of removed nodes
+    """
+    roots = [n for n in component.nodes if component.is_entry(n) or n is machine.initial_node]
+    reach = set(roots)
+    stack = list(roots)
+    while stack:
+        node = stack.pop()
+        successors = list(component.transitions[node])
+        if isinstance(node, rsm.BoxNode) and node.is_call_node:
+            successors += node.box.return_nodes
+        for s in successors:
+            if s not in reach:
+                reach.add(s)
+                stack.append(s)
+
+    removed = {n for n in component.nodes if n not in reach and not is_port(machine, component, n)}
+    if removed:
+        # return nodes of unreachable boxes are kept, so they may still lead to removed nodes
+        for node in component.nodes:
+            component.transitions[node] = [t for t in component.transitions[node] if t not in removed]
+        for node in removed:
+            component.remove_node(node)
+    return len(removed)
+
+
+def redirect_transitions(component, representatives):
+    """
+    Redirect all transitions of a base component to the representatives of their targets and remove the nodes that are
+    represented by another node.
+
+    :param component: the base component
+    :param representatives: dictionary mapping the nodes to remove to the node representing them
+    """
+    for node in component.nodes:
+        targets = []
+        for t in component.transitions[node]:
+            t = representatives.get(t, t)
+            if t not in targets:
+                targets.append(t)
+        component.transitions[node] = targets
+    for node in representatives:
+        component.remove_node(node)
+
+
+def collapse_chains(machine, component, labels):
+    """
+    Merge each node with a single successor into the successor if both carry the same relevant labels. The resulting
+    paths only differ in stuttering, so this is only sound for formulas without EX.
+
+    :param machine: the RSM
+    :param component: the base component
+    :param labels: the relevant labels
+    :return: the number of removed nodes
+    """
+    representatives = {}
+    for node in component.nodes:
+        if is_port(machine, component, node) or len(component.transitions[node]) != 1:
+            continue
+        successor = component.transitions[node][0]
+        # follow chains of already merged nodes
+        while successor in representatives:
+            successor = representatives[successor]
+        if successor is node or component.get_labels(node) & labels != component.get_labels(successor) & labels:
+            continue
+        representatives[node] = successor
+        # nodes merged into this one before now end up in its successor
+        for merged, representative in representatives.items():
+            if representative is node:
+                representatives[merged] = successor
+    redirect_transitions(component, representatives)
+    return len(representatives)
+
+
+def merge_bisimilar_nodes(machine, component, labels):
+    """
+    Compute the bisimulation quotient of a base component w.r.t. the relevant labels by partition refinement, where
+    entry, exit and box nodes (and the initial node) are kept apart from all other nodes. Bisimilar nodes satisfy the
+    same CTL formulas over the relevant labels (in all contexts), so all but one node of each class are removed.
+
+    :param machine: the RSM
+    :param component: the base component
+    :param labels: the relevant labels
+    :return: the number of removed nodes
+    """
+    blocks = {}
+    for node in component.nodes:
+        key = node if is_port(machine, component, node) else frozenset(component.get_labels(node) & labels)
+        blocks[node] = blocks.setdefault(key, len(blocks))
+    num_blocks = len(set(blocks.values()))
+
+    while True:
+        signatures = {}
+        refined = {}
+        for node in component.nodes:
+            if is_port(machine, component, node):
+                signature = node
+            else:
+                signature = (blocks[node], frozenset(blocks[t] for t in component.transitions[node]))
+            refined[node] = signatures.setdefault(signature, len(signatures))
+        blocks = refined
+        if len(signatures) == num_blocks:
+            break
+        num_blocks = len(signatures)
+
+    representatives = {}
+    first = {}
+    for node in component.nodes:
+        representative = first.setdefault(blocks[node], node)
+        if representative is not node:
+            representatives[node] = representative
+    redirect_transitions(component, representatives)
+    return len(representatives)
+
+
+def reduce_rsm(machine, ctl):
+    """
+    Reduce the base components of a freshly parsed RSM w.r.t. ctl: remove unreachable nodes, collapse chains of nodes
+    with the same relevant labels (if ctl contains no EX) and merge bisimilar nodes. Entry, exit and box nodes as well
+    as the initial node are kept, so the boxes and the value of ctl in the initial node are not affected. The
+    contextualized components are recreated with the empty context.
+
+    :param machine: the RSM as returned by parse_rsm
+    :param ctl: the formula that is checked next
+    :return: the number of nodes (including box nodes) before and after the reduction
+    """
+    labels = relevant_labels(ctl)
+    stutter_invariant = not uses_next(ctl)
+    num_nodes = sum(len(c.nodes) for c in machine.base_components)
+    for component in machine.base_components:
+        remove_unreachable_nodes(machine, component)
+        if stutter_invariant:
+            collapse_chains(machine, component, labels)
+        merge_bisimilar_nodes(machine, component, labels)
+        component.propositional_values = {}
+    machine.exit_summaries = None
+    machine.contextualize_base_components()
+    return num_nodes, sum(len(c.nodes) for c in machine.base_components)
@@ -90,17 +90,6 @@ def parse_rsm(path_to_file):
                     component.add_transition(source, target)
 
         # add empty context to everything
-        for component in machine.base_components:
-            contextualized_component =\
-                rsm.ContextualizedComponent(machine, component, "", component.generate_empty_context())
-            machine.add_contextualized_component(contextualized_component)
-            if machine.initial_component == component:
-                machine.initial_component = contextualized_component
-
-        for component in machine.contextualized_components:
-            for box in component.base_component.boxes:
-                ref = box.component
-                contextualized_ref = machine.get_contextualized_component(ref, ref.generate_empty_context())
-                component.box_mapping[box] = contextualized_ref
+        machine.contextualize_base_components()
 
         return machine
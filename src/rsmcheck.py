@@ -1,41 +1,25 @@
 """ Main script to check an RSM against a CTL formula
 """
 
-from rsm_parser import *
-from ctl_parser import *
-from checker import *
-from model.witness import *
+from rsm_parser import parse_rsm
+from ctl_parser import parse_ctl
+from checker import ExpansionHeuristics, check_exhaustive, check_lazy, known_fraction, record_context_counts, \
+    remove_unreachable_components
+from model.witness import generate_witness, recursive_str, write_witness_jsonl
+from sequential_checker import check_sequential
+from prestar_checker import check_prestar
+from reduction import reduce_rsm
+from deduplication import merge_isomorphic_components
+import budget
+import checker
+import portfolio
+import profiling
+import stats
 import argparse
 import logging
+import random
 import time
 
-# imports for memout/timeout
-import signal 
-try:
-    import resource
-except ModuleNotFoundError:
-    print("The module 'resource' was not found. Either you have not installed it, or you are running a non-UNIX system."
-          " In either case the program will be executed, however memory limits will not be available.")
-
-
-# limits memory consumption to [maxsize] in Bytes
-def limit_memory(maxsize):
-    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
-    resource.setrlimit(resource.RLIMIT_AS, (maxsize, maxsize))
-
-
-# limits memory consumption to [maxtime] in seconds
-def time_exceeded(signo, frame):
-    logging.info("timeout")
-    raise SystemExit(1)
-
-
-def limit_time(maxtime):
-    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
-    resource.setrlimit(resource.RLIMIT_CPU, (maxtime, hard))
-    signal.signal(signal.SIGXCPU, time_exceeded)
-
-
 parser = argparse.ArgumentParser(description="Check an RSM against a CTL")
 parser.add_argument("path_to_rsm", help="input .rsm file")
 parser.add_argument("path_to_ctl", help="input .ctl file")
@@ -48,134 +32,399 @@ parser.add_argument("-overwrite",
 parser.add_argument("-exhaustive",
                     action="store_true",
                     help="use exhaustive checking approach")
+parser.add_argument("-prestar",
+                    action="store_true",
+                    help="check exactly by pre* saturation on the pushdown system encoding the RSM, also for RSMs "
+                         "with recursion")
+parser.add_argument("-no_sequential",
+                    action="store_true",
+                    help="use the lazy or exhaustive approach also for RSMs without recursion, which are otherwise "
+                         "checked exactly component by component")
 parser.add_argument("-expansion_heuristic",
                     default="getnext",
                     help="Choose an expansion heuristic for lazy checking from the following list\n"
                          "* getnext: as in GetNextExpansion in the paper, search for a box."
                          "\tAlso enables faster cycle detection\n"
                          "* random: choose a random contextualizable box\n"
-                         "* all: contextualize all boxes (i.e., exhaustive with ternery checking")
-parser.add_argument("-maxmem", 
+                         "* all: contextualize all boxes (i.e., exhaustive with ternery checking\n"
+                         "* priority: contextualize the contextualizable box with the lowest score, see "
+                         "-priority_weights")
+parser.add_argument("-priority_weights",
+                    nargs="+",
+                    metavar="SIGNAL=WEIGHT",
+                    help="weights of the signals boxes are scored by in the priority heuristic, a lower score is "
+                         "better (default: " + " ".join(k + "=" + str(v) for k, v in checker.priority_weights.items()) +
+                         ")\n"
+                         "* size: size of the referenced component relative to the largest component\n"
+                         "* build: 1 if a new context has to be built, 0 if the box can be relabeled\n"
+                         "* known: fraction of the existential subformulas already known in the call nodes\n"
+                         "* depth: number of boxes between the initial component and the box")
+parser.add_argument("-demand",
+                    action="store_true",
+                    help="only evaluate the subformulas in the states that can influence the value of the formula in "
+                         "the initial node (lazy approach only)")
+parser.add_argument("-deduplicate",
+                    action="store_true",
+                    help="merge components that only differ in the names of their nodes and boxes when loading the "
+                         "RSM, such that the boxes referencing them share contexts")
+parser.add_argument("-reduce",
+                    action="store_true",
+                    help="reduce the RSM w.r.t. the atomic propositions of each formula before checking it, i.e., "
+                         "remove unreachable nodes, collapse chains of nodes with the same labels (for formulas "
+                         "without EX) and merge bisimilar nodes")
+parser.add_argument("-maxmem",
                     default=0,
-                    help="maximal amount of MB before memout (default: 0 = no limit)")
-parser.add_argument("-maxtime", 
+                    help="maximal amount of MB before memout of a formula (default: 0 = no limit)")
+parser.add_argument("-maxtime",
                     default=0,
-                    help="maximal time in minutes before timeout (default: 0 = no limit)")
+                    help="maximal wall-clock time in minutes for checking a single formula before timeout, the "
+                         "formula is then reported as unknown and the next formula is checked (default: 0 = no limit)")
+parser.add_argument("-maxtime_total",
+                    default=0,
+                    help="maximal wall-clock time in minutes for checking all formulas, formulas that are not "
+                         "finished in time are reported as unknown (default: 0 = no limit)")
 parser.add_argument("-witness",
                     action="store_true",
                     help="generate witness paths for the computed results")
 parser.add_argument("-witness_file",
                     default="witness.log",
                     help="witness file name")
+parser.add_argument("-witness_format",
+                    choices=["text", "jsonl"],
+                    default="text",
+                    help="format of the witness file\n"
+                         "* text: indented description of the witness and its reasons\n"
+                         "* jsonl: one JSON object per witness with the ids of its reasons, written while the witness "
+                         "is generated")
+parser.add_argument("-stats",
+                    action="store_true",
+                    help="write a JSON report with phase timings and counters for each formula")
+parser.add_argument("-stats_file",
+                    default="stats.jsonl",
+                    help="statistics file name, one JSON report per line")
+parser.add_argument("-profile",
+                    choices=["cpu", "mem"],
+                    help="profile the check of each formula\n"
+                         "* cpu: run cProfile and dump a .pstats file per formula\n"
+                         "* mem: trace allocations during each lazy iteration and log the top allocation sites")
+parser.add_argument("-profile_file",
+                    default="profile",
+                    help="prefix of the .pstats files written in cpu profiling mode")
 parser.add_argument("-randomize_nondeterminism",
                     action="store_true",
                     help="randomize nondeterministic choices in GetNextExpansion when deciding in which disjunct (for "
                          "local formulas) or successor (for existential formulas) to continue the search")
+parser.add_argument("-portfolio",
+                    nargs="*",
+                    metavar="STRATEGY",
+                    help="race several strategies on each formula in parallel processes and take the first answer. "
+                         "a strategy is an expansion heuristic, exhaustive, sequential or prestar, optionally followed "
+                         "by @<seed> to seed its random choices and randomize nondeterministic choices (default: " +
+                         " ".join(portfolio.DEFAULT_STRATEGIES) + ", plus sequential for RSMs without recursion)")
+parser.add_argument("-seed",
+                    type=int,
+                    help="seed for the random choices of the random expansion heuristic and randomized nondeterminism")
 
-args = parser.parse_args()
-path_to_rsm = args.path_to_rsm
-path_to_ctl = args.path_to_ctl
-logfile = args.logfile
-do_overwrite = args.overwrite
-do_exhaustive = args.exhaustive
-expansion_heuristic = args.expansion_heuristic
-do_witnesses = args.witness
-witness_file = args.witness_file
-randomize_nondeterminism = args.randomize_nondeterminism
-maxmem = int(args.maxmem)
-maxtime = int(args.maxtime)
-
-if do_overwrite:
-    logging.basicConfig(filename=logfile, level=logging.DEBUG, format='%(asctime)s %(message)s', filemode="w")
-else:
-    logging.basicConfig(filename=logfile, level=logging.DEBUG, format='%(asctime)s %(message)s')
-
-logging.info("---------------------------------")
-logging.info("--- STARTING TO CHECK NEW RSM ---")
-logging.info("---------------------------------")
-logging.info(path_to_rsm + " " + path_to_ctl)
-print("Checking RSM " + path_to_rsm + " against properties " + path_to_ctl)
-logging.info("using " + ("exhaustive" if do_exhaustive else "lazy") + " approach")
-
-num_true = 0
-num_false = 0
-
-total_start_time = time.process_time()
-
-if maxmem > 0:
-    limit_memory(maxmem)
-if maxtime > 0:
-    limit_time(maxtime * 60)
-
-index = 0
-
-for ctl in parse_ctl(path_to_ctl):
-    index += 1
-    print("checking CTL", index)
-    logging.info("--- STARTING TO CHECK NEW FORMULA ---")
-
-    start_parsing_time = time.process_time()
-    machine = parse_rsm(path_to_rsm)
-
-    num_comp = len(machine.contextualized_components)
-    machine.remove_unreachable_components()
-
-    logging.debug(f"Uncontextualized RSM has {str(num_comp)} components (of which"
-                  f"{str(num_comp-len(machine.contextualized_components))} are unreachable) and"
-                  f"{str(sum(len(c.base_component.nodes) for c in machine.contextualized_components))} nodes")
-
-    start_checking_time = time.process_time()
-
-    if do_exhaustive:
-        check_exhaustive(machine, ctl)
-    else:
+
+def main():
+    args = parser.parse_args()
+    path_to_rsm = args.path_to_rsm
+    path_to_ctl = args.path_to_ctl
+    logfile = args.logfile
+    do_overwrite = args.overwrite
+    do_exhaustive = args.exhaustive
+    do_prestar = args.prestar
+    do_sequential = not args.no_sequential
+    expansion_heuristic = args.expansion_heuristic
+    do_witnesses = args.witness
+    witness_file = args.witness_file
+    witness_format = args.witness_format
+    do_stats = args.stats
+    stats_file = args.stats_file
+    profile_mode = args.profile
+    profile_file = args.profile_file
+    randomize_nondeterminism = args.randomize_nondeterminism
+    do_demand = args.demand
+    do_reduce = args.reduce
+    do_deduplicate = args.deduplicate
+    maxmem = float(args.maxmem)
+    maxtime = float(args.maxtime)
+    maxtime_total = float(args.maxtime_total)
+    strategies = None
+
+    if args.portfolio is not None:
+        if profile_mode is not None:
+            parser.error("-profile cannot be combined with -portfolio")
+        try:
+            strategies = [portfolio.parse_strategy(spec) for spec in args.portfolio]
+        except ValueError as e:
+            parser.error(str(e))
+
+    if do_prestar and do_exhaustive:
+        parser.error("-prestar cannot be combined with -exhaustive")
+    if do_demand and do_witnesses:
+        parser.error("-demand cannot be combined with -witness")
+    if do_reduce and do_witnesses:
+        parser.error("-reduce cannot be combined with -witness")
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    # witnesses explain the values of all subformulas, so none of them may be dropped
+    checker.retire_subformulas = not do_witnesses
+    checker.demand_driven = do_demand
+
+    for weight in args.priority_weights or []:
+        signal, _, value = weight.partition("=")
+        if signal not in checker.priority_weights:
+            parser.error("unknown signal " + signal + " in -priority_weights, must be one of " +
+                         ", ".join(checker.priority_weights))
         try:
-            eh = ExpansionHeuristics[expansion_heuristic.upper()]
+            checker.priority_weights[signal] = float(value)
         except ValueError:
-            raise ValueError(f"Invalid expansion heuristic: {expansion_heuristic}")
-        check_lazy(machine, ctl, eh, randomize_nondeterminism)
+            parser.error("invalid weight " + value + " for signal " + signal + " in -priority_weights")
 
-    result = machine.initial_component.interpretation[machine.initial_node][ctl]
+    if do_overwrite:
+        logging.basicConfig(filename=logfile, level=logging.DEBUG, format='%(asctime)s %(message)s', filemode="w")
+    else:
+        logging.basicConfig(filename=logfile, level=logging.DEBUG, format='%(asctime)s %(message)s')
 
-    if result is True:
-        num_true += 1
+    logging.info("---------------------------------")
+    logging.info("--- STARTING TO CHECK NEW RSM ---")
+    logging.info("---------------------------------")
+    logging.info(path_to_rsm + " " + path_to_ctl)
+    print("Checking RSM " + path_to_rsm + " against properties " + path_to_ctl)
+    if do_prestar:
+        logging.info("using pre* saturation approach")
     else:
-        num_false += 1
-
-    with open('short_log.log', 'a') as f:
-        path_to_rsm = args.path_to_rsm
-        slash_index = path_to_rsm.rfind("/")
-        point_index = path_to_rsm.rfind(".")
-        rsm_name = path_to_rsm[slash_index+1:point_index]
-        f.write(rsm_name)
-        f.write("\t")
-        path_to_ctl = args.path_to_ctl
-        slash_index = path_to_ctl.rfind("/")
-        point_index = path_to_ctl.rfind(".")
-        ctl_name = path_to_ctl[slash_index+1:point_index]
-        f.write(ctl_name + "/" + str(index))
-        f.write("\t")
-        f.write(str(time.process_time() - start_checking_time))
-        f.write("\n")
-
-    logging.debug("    Final unpacked RSM has " + str(len(machine.contextualized_components)) + " components " +
-                  "with a total of " + str(sum(len(c.base_component.nodes) for c in machine.contextualized_components))
-                  + " states")
-    logging.info(str(result) + ": " + str(ctl) + " does" +
-                 (" not" if result is False else "") + " hold in " +
-                 str(machine.initial_node.base_name) + " (component " + str(machine.initial_component.name) + ")")
-    print(str(result) + ": " + str(ctl) + " does" +
-          (" not" if result is False else "") + " hold in " +
-          str(machine.initial_node.base_name) + " (component " + str(machine.initial_component.name) + ")")
-    logging.info("    Parsing took " + str(start_checking_time - start_parsing_time) + " seconds")
-    logging.info("    Checking took " + str(time.process_time() - start_checking_time) + " seconds")
-
-    if do_witnesses:
-        witness = generate_witness(machine, [], machine.initial_node, ctl, result)
-        with open(witness_file, 'a') as f:
-            for line in recursive_str(witness):
-                f.write(line)
+        logging.info("using " + ("exhaustive" if do_exhaustive else "lazy") + " approach" +
+                     (" for recursive RSMs" if do_sequential else ""))
+
+    num_true = 0
+    num_false = 0
+    num_unknown = 0
+
+    total_start_time = time.process_time()
+
+    if maxmem > 0 and stats.current_memory() is None:
+        print("The memory consumption cannot be determined on this system, so the memory limit will not be enforced.")
+    total_deadline = time.monotonic() + maxtime_total * 60 if maxtime_total > 0 else None
+
+    index = 0
+    exit_summaries = None
+
+    for ctl in parse_ctl(path_to_ctl):
+        index += 1
+        print("checking CTL", index)
+        logging.info("--- STARTING TO CHECK NEW FORMULA ---")
+
+        statistics = stats.reset()
+
+        start_parsing_time = time.process_time()
+        with statistics.phase("parsing"):
+            machine = parse_rsm(path_to_rsm)
+            if do_deduplicate:
+                num_merged = merge_isomorphic_components(machine)
+                statistics.count("merged_components", num_merged)
+                logging.info("    Merged " + str(num_merged) + " isomorphic components, " +
+                             str(len(machine.base_components)) + " components remain")
+
+        if do_reduce:
+            with statistics.phase("reduction"):
+                num_nodes, num_reduced_nodes = reduce_rsm(machine, ctl)
+            statistics.info["reduction_ratio"] = num_reduced_nodes / num_nodes
+            logging.info("    Reduced RSM from " + str(num_nodes) + " to " + str(num_reduced_nodes) + " nodes (" +
+                         format(100 * num_reduced_nodes / num_nodes, ".1f") + "%)")
+
+        num_comp = len(machine.contextualized_components)
+        remove_unreachable_components(machine)
+        if exit_summaries is not None:
+            machine.exit_summaries = exit_summaries
+
+        logging.debug(f"Uncontextualized RSM has {str(num_comp)} components (of which"
+                      f"{str(num_comp-len(machine.contextualized_components))} are unreachable) and"
+                      f"{str(sum(len(c.base_component.nodes) for c in machine.contextualized_components))} nodes")
+
+        # RSMs without recursion are checked exactly by the sequential checker
+        use_sequential = do_sequential and not do_prestar and not machine.is_recursive()
+        approach = "prestar" if do_prestar else "sequential" if use_sequential else "exhaustive" if do_exhaustive \
+            else "lazy"
+        if strategies is not None:
+            approach = "portfolio"
+        if use_sequential:
+            logging.debug("RSM has no recursion, using sequential approach")
+
+        start_checking_time = time.process_time()
+
+        if profile_mode == "cpu":
+            cpu_profiler = profiling.CpuProfiler()
+            cpu_profiler.start()
+        elif profile_mode == "mem":
+            checker.memory_profiler = profiling.MemoryProfiler()
+            checker.memory_profiler.start()
+
+        # the budget of a single formula ends at the end of the global budget at the latest
+        budget.start(maxtime * 60, maxmem * 2**20, total_deadline)
+        exceeded = None
+        initial_component_name = None
+        witness_text = None
+
+        with statistics.phase("checking"):
+            try:
+                if strategies is not None:
+                    formula_strategies = strategies or [portfolio.parse_strategy(spec) for spec in
+                                                        (["sequential"] if use_sequential else []) +
+                                                        portfolio.DEFAULT_STRATEGIES]
+                    # the sequential approach is only exact for RSMs without recursion
+                    if machine.is_recursive():
+                        formula_strategies = [s for s in formula_strategies if s.approach != "sequential"]
+                    outcome = portfolio.race(machine, ctl, index, formula_strategies,
+                                             (maxtime * 60, maxmem * 2**20, total_deadline),
+                                             witness_format if do_witnesses else None)
+                    if outcome["statistics"] is not None:
+                        statistics.counters.update(outcome["statistics"]["counters"])
+                        statistics.peaks.update(outcome["statistics"]["peaks"])
+                        statistics.info.update(outcome["statistics"]["info"])
+                    statistics.info["portfolio_winner"] = outcome["strategy"] if outcome["exceeded"] is None else None
+                    statistics.info["portfolio_outcomes"] = outcome["outcomes"]
+                    initial_component_name = outcome.get("initial_component")
+                    witness_text = outcome.get("witness")
+                    if outcome["exceeded"] is not None:
+                        raise budget.BudgetExceeded(outcome["exceeded"])
+                elif do_prestar:
+                    check_prestar(machine, ctl)
+                elif use_sequential:
+                    check_sequential(machine, ctl)
+                elif do_exhaustive:
+                    check_exhaustive(machine, ctl)
+                else:
+                    try:
+                        eh = ExpansionHeuristics[expansion_heuristic.upper()]
+                    except ValueError:
+                        raise ValueError(f"Invalid expansion heuristic: {expansion_heuristic}")
+                    check_lazy(machine, ctl, eh, randomize_nondeterminism)
+            except budget.BudgetExceeded as e:
+                exceeded = e.reason
+
+        budget.stop()
+        if not do_reduce:
+            # the reduction depends on the formula, otherwise all formulas are checked on the same base components
+            exit_summaries = machine.exit_summaries
+
+        if profile_mode == "cpu":
+            cpu_profiler.stop(profile_file + "_" + str(index) + ".pstats")
+            logging.info("    CPU profile written to " + profile_file + "_" + str(index) + ".pstats")
+        elif profile_mode == "mem":
+            memory_report = checker.memory_profiler.report()
+            checker.memory_profiler.stop()
+            checker.memory_profiler = None
+            statistics.info["memory_profile"] = memory_report
+            logging.info("    Top allocation sites during lazy iterations:")
+            for site in memory_report:
+                logging.info("        " + str(site["size"]) + " B in " + str(site["blocks"]) + " blocks at " +
+                             site["file"] + ":" + str(site["line"]) + " (" + site["code"] + ")")
+
+        if strategies is not None:
+            result = outcome["result"]
+            if exceeded is not None:
+                statistics.info.setdefault("known_fraction", 0.0)
+        elif exceeded is None:
+            result = machine.initial_component.interpretation[machine.initial_node][ctl]
+        else:
+            # keep the partial statistics of the aborted check
+            result = "unknown"
+            if approach in ("lazy", "exhaustive"):
+                record_context_counts()
+            statistics.info["known_fraction"] = known_fraction(machine, ctl)
+        if initial_component_name is None:
+            initial_component_name = machine.initial_component.name
+
+        memory = stats.peak_memory()
+        if memory is not None:
+            statistics.peak("memory", memory)
+
+        if result is True:
+            num_true += 1
+        elif result is False:
+            num_false += 1
+        else:
+            num_unknown += 1
+
+        with open('short_log.log', 'a') as f:
+            path_to_rsm = args.path_to_rsm
+            slash_index = path_to_rsm.rfind("/")
+            point_index = path_to_rsm.rfind(".")
+            rsm_name = path_to_rsm[slash_index+1:point_index]
+            f.write(rsm_name)
+            f.write("\t")
+            path_to_ctl = args.path_to_ctl
+            slash_index = path_to_ctl.rfind("/")
+            point_index = path_to_ctl.rfind(".")
+            ctl_name = path_to_ctl[slash_index+1:point_index]
+            f.write(ctl_name + "/" + str(index))
+            f.write("\t")
+            f.write(str(time.process_time() - start_checking_time))
+            f.write("\n")
+
+        if strategies is None:
+            logging.debug("    Final unpacked RSM has " + str(len(machine.contextualized_components)) + " components " +
+                          "with a total of " +
+                          str(sum(len(c.base_component.nodes) for c in machine.contextualized_components)) + " states")
+        elif "components" in outcome:
+            logging.debug("    Final unpacked RSM has " + str(outcome["components"]) + " components with a total of " +
+                          str(outcome["states"]) + " states")
+        if exceeded is None:
+            message = str(result) + ": " + str(ctl) + " does" + (" not" if result is False else "") + " hold in " + \
+                      str(machine.initial_node.base_name) + " (component " + str(initial_component_name) + ")"
+        else:
+            message = "unknown/" + exceeded + ": " + str(ctl) + " could not be determined in " + \
+                      str(machine.initial_node.base_name) + " (component " + str(initial_component_name) + \
+                      ") within the budget, " + format(100 * statistics.info["known_fraction"], ".1f") + \
+                      "% of the subformulas are known after " + \
+                      str(statistics.counters.get("lazy_iterations",
+                                                  statistics.counters.get("exhaustive_iterations", 0))) + \
+                      " iterations and " + str(statistics.counters.get("contexts_built", 0)) + " contexts built"
+        logging.info(message)
+        print(message)
+        logging.info("    Parsing took " + str(start_checking_time - start_parsing_time) + " seconds")
+        logging.info("    Checking took " + str(time.process_time() - start_checking_time) + " seconds")
+
+        if do_stats:
+            statistics.info.update({
+                "rsm": args.path_to_rsm,
+                "ctl": args.path_to_ctl,
+                "index": index,
+                "formula": str(ctl),
+                "result": result,
+                "exceeded": exceeded,
+                "approach": approach,
+                "expansion_heuristic": expansion_heuristic if approach == "lazy" else None,
+                "randomize_nondeterminism": randomize_nondeterminism,
+                "demand_driven": do_demand,
+                "priority_weights": checker.priority_weights if approach == "lazy" and expansion_heuristic == "priority"
+                else None
+            })
+            with open(stats_file, 'a') as f:
+                f.write(statistics.to_json())
                 f.write("\n")
 
-logging.info("Took a total of " + str(time.process_time() - total_start_time) + " seconds")
-logging.info("Found " + str(num_true) + " true formulas and " + str(num_false) + " false formulas.")
+        if do_witnesses and exceeded is None:
+            with open(witness_file, 'a') as f:
+                if strategies is not None:
+                    # the witness was generated by the winning strategy
+                    f.write(witness_text)
+                elif witness_format == "jsonl":
+                    write_witness_jsonl(f, machine, machine.empty_box_stack, machine.initial_node, ctl, result, index)
+                else:
+                    witness = generate_witness(machine, machine.empty_box_stack, machine.initial_node, ctl, result)
+                    for line in recursive_str(witness):
+                        f.write(line)
+                        f.write("\n")
+
+    logging.info("Took a total of " + str(time.process_time() - total_start_time) + " seconds")
+    logging.info("Found " + str(num_true) + " true formulas, " + str(num_false) + " false formulas and " +
+                 str(num_unknown) + " unknown formulas.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Exact checking of RSMs without recursion by evaluating each component once per context it is called with
+"""
+
+from collections import deque
+from pyModelChecking import CTL
+from ctl_parser import get_subformulas
+from model.rsm import ContextualizedComponent, get_context_encoding
+import budget
+import stats
+
+
+class SequentialChecker:
+    """
+    a class to check a CTL formula on an RSM without recursion, i.e., whose call graph is acyclic
+
+    the truth values of a formula in a component only depend on the component and its context, i.e., the values of
+    the existential subformulas in the exit nodes. since no component (indirectly) calls itself, the values of a
+    formula in a component with a given context can be computed exactly by querying the callees with the contexts
+    induced by the return nodes of their boxes, bottom-up along the call graph. the results are memoized, so each
+    component is evaluated once per formula and context that is actually needed. no ternary logic is involved, the
+    fixpoints of EU and EG formulas are computed within a component, with the callees of its boxes being iterated from
+    below (EU) or above (EG) until their contexts are stable.
+
+    contexts are represented as frozensets of ((exit node, formula), value) items and are restricted to the
+    existential subformulas of the evaluated formula. exit nodes without value in the context (e.g. the exit nodes of
+    the initial component) are treated as if the path stayed there forever.
+
+    Attributes
+    ----------
+
+    machine : RSM
+        the RSM to check
+    ctl : CTL
+        the formula to check
+    existential_subformulas : dict { CTL : frozenset(CTL) }
+        the existential subformulas (including the formula itself if it is existential) of each subformula
+    values : dict { (CTL, Component, frozenset) : dict { node : bool } }
+        truth values of a formula in the nodes of a base component with a given context
+    predecessors : dict { Component : dict { node : list[node] } }
+        predecessors of each node in a base component
+
+    Methods
+    -------
+
+    check()
+        compute the values of the formula in the initial component and return the value in the initial node
+    evaluate(f, component, context)
+        return the truth values of f in the nodes of the base component with the given context
+    contextualize()
+        replace the contextualized components of the machine by one component per base component and (complete)
+        context that is reachable from the initial component, with the computed interpretations
+    """
+
+    def __init__(self, machine, ctl):
+        self.machine = machine
+        self.ctl = ctl
+        self.existential_subformulas = {}
+        self.values = {}
+        self.predecessors = {}
+        subformulas = get_subformulas(ctl)
+        for depth in range(max(subformulas.keys()) + 1):
+            for f in subformulas[depth]:
+                existential = {f} if isinstance(f, CTL.E) else set()
+                if not isinstance(f, CTL.AtomicProposition) and not isinstance(f, CTL.Bool):
+                    path_formula = f.subformula(0) if isinstance(f, CTL.E) or isinstance(f, CTL.A) else f
+                    for sub in path_formula.subformulas():
+                        existential |= self.existential_subformulas[sub]
+                self.existential_subformulas[f] = frozenset(existential)
+        # distinct (base component, context) pairs evaluated so far
+        self._instances = set()
+
+    def check(self):
+        return self.evaluate(self.ctl, self.machine.initial_component.base_component, frozenset())[
+            self.machine.initial_node]
+
+    def evaluate(self, f, component, context):
+        key = (f, component, context)
+        values = self.values.get(key)
+        if values is None:
+            budget.check()
+            if (component, context) not in self._instances:
+                self._instances.add((component, context))
+                stats.current().count("contexts_built")
+            if isinstance(f, CTL.Bool):
+                values = {n: str(f) == "true" for n in component.nodes}
+            elif isinstance(f, CTL.AtomicProposition):
+                values = {n: component.has_label(n, str(f)) for n in component.nodes}
+            elif isinstance(f, CTL.Not):
+                sub = self.evaluate_subformula(f.subformula(0), component, context)
+                values = {n: not v for n, v in sub.items()}
+            elif isinstance(f, CTL.Or) or isinstance(f, CTL.And):
+                subs = [self.evaluate_subformula(sub, component, context) for sub in f.subformulas()]
+                combine = any if isinstance(f, CTL.Or) else all
+                values = {n: combine(sub[n] for sub in subs) for n in component.nodes}
+            elif isinstance(f, CTL.E) and isinstance(f.subformula(0), CTL.X):
+                values = self.evaluate_next(f, component, context)
+            elif isinstance(f, CTL.E) and isinstance(f.subformula(0), CTL.U):
+                values = self.evaluate_until(f, component, context)
+            elif isinstance(f, CTL.E) and isinstance(f.subformula(0), CTL.G):
+                values = self.evaluate_always(f, component, context)
+            else:
+                raise ValueError("Can only check CTL in existential normal form (not, or, and, EX, EU, EG), got " +
+                                 str(f))
+            self.values[key] = values
+        return values
+
+    def evaluate_subformula(self, sub, component, context):
+        return self.evaluate(sub, component, self.restrict(context, sub))
+
+    def restrict(self, context, f):
+        existential = self.existential_subformulas[f]
+        return frozenset(item for item in context if item[0][1] in existential)
+
+    def callee_context(self, f, component, context, box, values=None):
+        """
+        :param values: the current values of f in component, if f itself is still being computed
+        :return: the context of the component referenced by box w.r.t. f, induced by the values in the return nodes
+        """
+        items = []
+        for ex in box.exit_nodes:
+            return_node = component.get_return_node(box, ex)
+            for sub in self.existential_subformulas[f]:
+                if sub is f and values is not None:
+                    value = values[return_node]
+                else:
+                    value = self.evaluate_subformula(sub, component, context)[return_node]
+                items.append(((ex, sub), value))
+        return frozenset(items)
+
+    def get_predecessors(self, component):
+        predecessors = self.predecessors.get(component)
+        if predecessors is None:
+            predecessors = {n: [] for n in component.nodes}
+            for source, targets in component.transitions.items():
+                for target in targets:
+                    predecessors[target].append(source)
+            self.predecessors[component] = predecessors
+        return predecessors
+
+    def exit_values(self, f, component, context, stutter_values):
+        """
+        :return: the values of f in the exit nodes, taken from the context or, for exit nodes without context, from
+        stutter_values (the value if the path stays in the exit node forever)
+        """
+        context_values = dict(context)
+        return {ex: context_values.get((ex, f), stutter_values[ex]) for ex in component.get_exit_nodes()}
+
+    def evaluate_next(self, f, component, context):
+        sub = f.subformula(0).subformula(0)
+        sub_values = self.evaluate_subformula(sub, component, context)
+        values = self.exit_values(f, component, context, sub_values)
+        for n in component.nodes:
+            if n not in values:
+                values[n] = any(sub_values[s] for s in component.transitions[n])
+        for box in component.boxes:
+            callee = box.component
+            callee_values = self.evaluate(sub, callee, self.callee_context(sub, component, context, box))
+            for call_node in box.call_nodes:
+                if not values[call_node]:
+                    values[call_node] = any(callee_values[s] for s in callee.transitions[call_node.node])
+        return values
+
+    def evaluate_until(self, f, component, context):
+        path_formula = f.subformula(0)
+        sub1_values = self.evaluate_subformula(path_formula.subformula(0), component, context)
+        sub2_values = self.evaluate_subformula(path_formula.subformula(1), component, context)
+        exits = self.exit_values(f, component, context, sub2_values)
+        predecessors = self.get_predecessors(component)
+
+        values = {n: exits[n] if n in exits else sub2_values[n] for n in component.nodes}
+
+        def propagate(nodes):
+            # least fixpoint: add all nodes satisfying sub1 that reach nodes via sub1 nodes
+            queue = deque(nodes)
+            while queue:
+                node = queue.popleft()
+                for p in predecessors[node]:
+                    if not values[p] and p not in exits and sub1_values[p]:
+                        values[p] = True
+                        queue.append(p)
+
+        propagate(n for n, v in values.items() if v)
+
+        # start with the values in the callees for the contexts under-approximated so far and iterate until the
+        # contexts are stable, since the values can only grow, this yields the least fixpoint
+        callee_contexts = {}
+        while True:
+            new_nodes = []
+            for box in component.boxes:
+                callee_context = self.callee_context(f, component, context, box, values)
+                if callee_contexts.get(box) == callee_context:
+                    continue
+                callee_contexts[box] = callee_context
+                callee = box.component
+                callee_values = self.evaluate(f, callee, callee_context)
+                for call_node in box.call_nodes:
+                    if not values[call_node] and sub1_values[call_node] and \
+                            any(callee_values[s] for s in callee.transitions[call_node.node]):
+                        values[call_node] = True
+                        new_nodes.append(call_node)
+            if not new_nodes:
+                return values
+            propagate(new_nodes)
+
+    def evaluate_always(self, f, component, context):
+        sub_values = self.evaluate_subformula(f.subformula(0).subformula(0), component, context)
+        exits = self.exit_values(f, component, context, sub_values)
+        predecessors = self.get_predecessors(component)
+
+        values = {n: exits[n] if n in exits else sub_values[n] for n in component.nodes}
+
+        # start by assuming all successors in callees to satisfy f, i.e., an over-approximation
+        callee_successors = {}
+        callee_satisfying = {}
+        for box in component.boxes:
+            for call_node in box.call_nodes:
+                callee_successors[call_node] = box.component.transitions[call_node.node]
+                callee_satisfying[call_node] = len(callee_successors[call_node])
+
+        # number of satisfying successors of each satisfying node, nodes without successors are kept (implicit self
+        # loop) as well as exit nodes, whose value is given by the context
+        satisfying_successors = {}
+        to_remove = []
+        for n, v in values.items():
+            if not v or n in exits:
+                continue
+            successors = component.transitions[n]
+            satisfying_successors[n] = sum(1 for s in successors if values[s]) + callee_satisfying.get(n, 0)
+            if satisfying_successors[n] == 0 and len(successors) + len(callee_successors.get(n, [])) > 0:
+                to_remove.append(n)
+
+        def remove(nodes):
+            # greatest fixpoint: remove nodes without satisfying successors
+            stack = list(nodes)
+            for node in stack:
+                values[node] = False
+            while stack:
+                node = stack.pop()
+                for p in predecessors[node]:
+                    if values[p] and p not in exits:
+                        satisfying_successors[p] -= 1
+                        if satisfying_successors[p] == 0:
+                            values[p] = False
+                            stack.append(p)
+
+        remove(to_remove)
+
+        # refine the assumption on the callees with the contexts over-approximated so far until the contexts are
+        # stable, since the values can only shrink, this yields the greatest fixpoint
+        callee_contexts = {}
+        while True:
+            to_remove = []
+            for box in component.boxes:
+                callee_context = self.callee_context(f, component, context, box, values)
+                if callee_contexts.get(box) == callee_context:
+                    continue
+                callee_contexts[box] = callee_context
+                callee = box.component
+                callee_values = self.evaluate(f, callee, callee_context)
+                for call_node in box.call_nodes:
+                    satisfying = sum(1 for s in callee_successors[call_node] if callee_values[s])
+                    if values[call_node] and satisfying < callee_satisfying[call_node]:
+                        satisfying_successors[call_node] -= callee_satisfying[call_node] - satisfying
+                        if satisfying_successors[call_node] == 0:
+                            to_remove.append(call_node)
+                    callee_satisfying[call_node] = satisfying
+            if not to_remove:
+                return values
+            remove(to_remove)
+
+    def contextualize(self):
+        existential = [f for f in self.existential_subformulas if isinstance(f, CTL.E)]
+        formulas = list(self.existential_subformulas)
+        initial_base_component = self.machine.initial_component.base_component
+        initial_key = (initial_base_component, frozenset())
+        components = {}
+        to_build = [initial_key]
+        while to_build:
+            base_component, context = to_build.pop()
+            interpretations = {f: self.evaluate_subformula(f, base_component, context) for f in formulas}
+
+            # the exit nodes of the initial component have no context, their values are made explicit
+            context_values = dict(context)
+            explicit_context = {ex: dict() for ex in base_component.get_exit_nodes()}
+            for ex in explicit_context:
+                for f in existential:
+                    if (ex, f) in context_values or not context:
+                        explicit_context[ex][f] = interpretations[f][ex]
+
+            if (base_component, context) == initial_key:
+                name_appendix = "_init"
+            else:
+                name_appendix = get_context_encoding(existential, explicit_context, base_component)
+            component = ContextualizedComponent(self.machine, base_component, name_appendix, explicit_context)
+            for f, values in interpretations.items():
+                for n, v in values.items():
+                    component.set_truth_value(n, f, v)
+            components[(base_component, context)] = component
+
+            for box in base_component.boxes:
+                callee_key = (box.component, self.callee_context_all(existential, base_component, context, box))
+                if callee_key not in components and callee_key not in to_build:
+                    to_build.append(callee_key)
+
+        # connect the boxes once all components exist
+        for (base_component, context), component in components.items():
+            for box in base_component.boxes:
+                callee_context = self.callee_context_all(existential, base_component, context, box)
+                component.box_mapping[box] = components[(box.component, callee_context)]
+
+        self.machine.contextualized_components = set(components.values())
+        self.machine.initial_component = components[initial_key]
+        self.machine.box_mapping_version += 1
+
+    def callee_context_all(self, existential, component, context, box):
+        """
+        :return: the context of the component referenced by box w.r.t. all existential subformulas
+        """
+        items = []
+        for ex in box.exit_nodes:
+            return_node = component.get_return_node(box, ex)
+            for f in existential:
+                items.append(((ex, f), self.evaluate_subformula(f, component, context)[return_node]))
+        return frozenset(items)
+
+
+def check_sequential(machine, ctl):
+    """
+    Check ctl on an RSM without recursion (see RSM.is_recursive) exactly, without lazy or exhaustive contextualization.
+    Afterwards, the machine consists of the contextualized components reachable from the initial component, with all
+    subformulas known in all nodes, such that witnesses can be generated as for the other approaches.
+
+    :param machine: the RSM to check against, must not be recursive
+    :param ctl: the ctl to check
+    :return: the truth value of ctl in the initial node
+    """
+    statistics = stats.current()
+    sequential_checker = SequentialChecker(machine, ctl)
+    with statistics.phase("summarize"):
+        result = sequential_checker.check()
+    with statistics.phase("contextualize"):
+        sequential_checker.contextualize()
+    statistics.counters["summaries"] = len(sequential_checker.values)
+    statistics.peak("contextualized_components", len(machine.contextualized_components))
+    statistics.peak("contextualized_nodes", sum(len(c.base_component.nodes) for c in machine.contextualized_components))
+    return result
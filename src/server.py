@@ -0,0 +1,356 @@
+""" Daemon that keeps parsed RSMs in memory and checks the formulas of JSON requests in worker processes, see client.py
+"""
+
+from collections import OrderedDict
+from rsm_parser import parse_rsm
+from ctl_parser import parse_ctl, parse_ctl_formula
+from checker import remove_unreachable_components
+from deduplication import merge_isomorphic_components
+from client import DEFAULT_SOCKET
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+import checker
+import portfolio
+
+logger = logging.getLogger(__name__)
+
+# maximal number of parsed RSMs kept in memory
+cache_size = 8
+
+# fields of a request, see CheckServer
+REQUEST_FIELDS = ("model", "hash", "ctl", "formulas", "strategy", "sequential", "deduplicate", "reduce", "demand",
+                  "priority_weights", "randomize_nondeterminism", "witness_format", "maxtime", "maxmem",
+                  "maxtime_total", "id")
+
+
+class ResultPipe:
+    """
+    the write end of a pipe with the put method of a queue, such that portfolio.run_strategy can report the outcome of
+    a worker process through it
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def put(self, outcome):
+        self.connection.send(outcome)
+
+
+class ModelCache:
+    """
+    a class to keep the most recently used parsed RSMs in memory, identified by the SHA-256 hash of their file content,
+    followed by :deduplicated if their isomorphic components were merged
+
+    the cached RSMs are never checked themselves, each formula is checked in a forked worker process on a private copy
+
+    Attributes
+    ----------
+
+    models : OrderedDict { str : RSM }
+        the parsed RSMs by hash, the least recently used first
+    size : int
+        the maximal number of cached RSMs
+    hits : int
+        number of requests whose RSM was cached
+    misses : int
+        number of requests whose RSM had to be parsed
+
+    Methods
+    -------
+
+    load(path, deduplicate)
+        return the hash and the parsed RSM of the file, parsing it if its content is not cached
+    lookup(key)
+        return the cached RSM with the given hash
+    """
+
+    def __init__(self, size):
+        self.models = OrderedDict()
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, path, deduplicate=False):
+        with open(path, "rb") as f:
+            key = hashlib.sha256(f.read()).hexdigest()
+        if deduplicate:
+            key += ":deduplicated"
+        if key in self.models:
+            return key, self.lookup(key)
+        self.misses += 1
+        machine = parse_rsm(path)
+        if deduplicate:
+            merge_isomorphic_components(machine)
+        remove_unreachable_components(machine)
+        self.models[key] = machine
+        if len(self.models) > self.size:
+            evicted, _ = self.models.popitem(last=False)
+            logger.info("Evicted RSM " + evicted + " from the cache")
+        logger.info("Parsed " + path + " as RSM " + key)
+        return key, machine
+
+    def lookup(self, key):
+        machine = self.models.get(key)
+        if machine is None:
+            raise KeyError("RSM " + key + " is not cached, send its path instead")
+        self.hits += 1
+        self.models.move_to_end(key)
+        return machine
+
+
+class CheckServer:
+    """
+    a class to answer requests of clients, one JSON object per line in both directions
+
+    a request consists of
+    * model: path of the .rsm file or hash: the hash of an RSM as replied to an earlier request
+    * ctl: path of a .ctl file or formulas: list of CTL formulas in the syntax of .ctl files
+    * strategy: a strategy as for -portfolio, see portfolio.parse_strategy (default: getnext)
+    * sequential: whether RSMs without recursion are checked by the sequential approach unless the strategy is prestar
+      (default: true)
+    * deduplicate, reduce, demand, randomize_nondeterminism: the options of the same name of rsmcheck.py (default:
+      false), deduplicate is only used together with model
+    * priority_weights: object mapping signals of the priority heuristic to their weights as for -priority_weights
+      (default: {})
+    * witness_format: text or jsonl to generate the witness of each formula as for -witness_format (default: null = no
+      witnesses), cannot be combined with demand or reduce
+    * maxtime, maxmem, maxtime_total: the budgets as for rsmcheck.py in minutes and MB (default: 0 = no limit)
+    * id: optional, copied to all replies
+
+    the server first replies with the hash of the RSM and the number of formulas, then with one object per formula as
+    soon as its check finished (index, formula, result, exceeded, initial node and component, statistics, the witness
+    if requested and error if the worker failed), and finally with done. if the request is invalid, e.g. because of an
+    unknown field, the only reply contains the error.
+
+    Attributes
+    ----------
+
+    cache : ModelCache
+        the parsed RSMs
+    workers : asyncio.Semaphore
+        limits the number of worker processes running at the same time, over all requests
+
+    Methods
+    -------
+
+    handle_connection(reader, writer)
+        answer the requests of a client until it closes the connection
+    handle_request(request, writer)
+        check the formulas of a request and send the replies
+    check(machine, ctl, index, strategy, limits, options)
+        check a formula in a forked worker process and return its outcome
+    """
+
+    def __init__(self, num_workers, num_models):
+        self.cache = ModelCache(num_models)
+        self.workers = asyncio.Semaphore(num_workers)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("the request must be a JSON object")
+                except ValueError as e:
+                    await send(writer, {"error": "Invalid request: " + str(e)})
+                    continue
+                await self.handle_request(request, writer)
+        except ConnectionError:
+            logger.info("Client disconnected")
+        finally:
+            writer.close()
+
+    async def handle_request(self, request, writer):
+        reply = {"id": request["id"]} if "id" in request else {}
+        start_time = time.monotonic()
+        try:
+            unknown = [field for field in request if field not in REQUEST_FIELDS]
+            if unknown:
+                raise ValueError("Unknown fields " + ", ".join(unknown) + " in the request")
+            options = parse_options(request)
+            if "model" in request:
+                key, machine = self.cache.load(request["model"], bool(request.get("deduplicate", False)))
+            else:
+                key = request["hash"]
+                machine = self.cache.lookup(key)
+            if "ctl" in request:
+                formulas = list(parse_ctl(request["ctl"]))
+            else:
+                formulas = [parse_ctl_formula(f) for f in request["formulas"]]
+            strategy = portfolio.parse_strategy(request.get("strategy", "getnext"))
+            if request.get("sequential", True) and strategy.approach != "prestar" and not machine.is_recursive():
+                strategy = portfolio.parse_strategy("sequential")
+            elif strategy.approach == "sequential" and machine.is_recursive():
+                raise ValueError("The sequential approach cannot check RSMs with recursion")
+            maxtime = float(request.get("maxtime", 0))
+            maxmem = float(request.get("maxmem", 0))
+            maxtime_total = float(request.get("maxtime_total", 0))
+        except Exception as e:
+            # the request cannot be answered, but the server keeps running
+            await send(writer, dict(reply, error=str(e) or type(e).__name__))
+            return
+        deadline = start_time + maxtime_total * 60 if maxtime_total > 0 else None
+        limits = (maxtime * 60, maxmem * 2**20, deadline)
+        logger.info("Checking " + str(len(formulas)) + " formulas on RSM " + key + " with strategy " + strategy.name)
+        await send(writer, dict(reply, hash=key, formulas=len(formulas)))
+
+        tasks = [asyncio.ensure_future(self.check(machine, ctl, i + 1, strategy, limits, options))
+                 for i, ctl in enumerate(formulas)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                outcome = await task
+                ctl = formulas[outcome["index"] - 1]
+                await send(writer, dict(reply, index=outcome["index"], formula=str(ctl),
+                                        result=outcome.get("result", "unknown"),
+                                        exceeded=outcome.get("exceeded", "error" if "error" in outcome else None),
+                                        initial_node=machine.initial_node.base_name,
+                                        initial_component=outcome.get("initial_component"),
+                                        strategy=strategy.name, statistics=outcome.get("statistics"),
+                                        **{field: outcome[field] for field in ("witness", "error")
+                                           if field in outcome}))
+        finally:
+            # e.g. if the client disconnected, the remaining workers are killed
+            for task in tasks:
+                task.cancel()
+        logger.info("Finished the request on RSM " + key + " after " +
+                    format(time.monotonic() - start_time, ".3f") + " seconds")
+        await send(writer, dict(reply, done=True))
+
+    async def check(self, machine, ctl, index, strategy, limits, options):
+        async with self.workers:
+            # forking shares the parsed RSM with the worker, which checks a private copy of it
+            context = multiprocessing.get_context("fork")
+            reader, writer = context.Pipe(duplex=False)
+            process = context.Process(target=run_worker,
+                                      args=(strategy, machine, ctl, index, limits, options, ResultPipe(writer)),
+                                      daemon=True)
+            process.start()
+            writer.close()
+            loop = asyncio.get_running_loop()
+            readable = loop.create_future()
+            loop.add_reader(reader.fileno(), lambda: readable.done() or readable.set_result(None))
+            try:
+                await readable
+                try:
+                    outcome = reader.recv()
+                except EOFError:
+                    # the worker died without reporting, e.g. killed by the operating system
+                    outcome = None
+            finally:
+                loop.remove_reader(reader.fileno())
+                reader.close()
+                if process.is_alive() and not readable.done():
+                    process.terminate()
+                process.join()
+        if outcome is None:
+            outcome = {"strategy": strategy.name, "error": "worker died with exit code " + str(process.exitcode)}
+        outcome["index"] = index
+        return outcome
+
+
+def parse_options(request):
+    """
+    :param request: the request of a client, see CheckServer
+    :return: dictionary of the options of the checker for all formulas of the request, see run_worker
+    """
+    options = {field: request.get(field, False) for field in ("reduce", "demand", "randomize_nondeterminism")}
+    for field, value in options.items():
+        if not isinstance(value, bool):
+            raise ValueError(field + " must be true or false")
+    options["witness_format"] = request.get("witness_format")
+    if options["witness_format"] not in (None, "text", "jsonl"):
+        raise ValueError("Invalid witness format " + str(options["witness_format"]) + ", must be text or jsonl")
+    if options["witness_format"] is not None and options["demand"]:
+        raise ValueError("demand cannot be combined with witnesses")
+    if options["witness_format"] is not None and options["reduce"]:
+        raise ValueError("reduce cannot be combined with witnesses")
+    priority_weights = request.get("priority_weights", {})
+    if not isinstance(priority_weights, dict):
+        raise ValueError("priority_weights must map signals to weights")
+    for signal, weight in priority_weights.items():
+        if signal not in checker.priority_weights:
+            raise ValueError("Unknown signal " + signal + " in priority_weights, must be one of " +
+                             ", ".join(checker.priority_weights))
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)):
+            raise ValueError("Invalid weight " + json.dumps(weight) + " for signal " + signal + " in priority_weights")
+    options["priority_weights"] = priority_weights
+    return options
+
+
+def run_worker(strategy, machine, ctl, index, limits, options, results):
+    """
+    Configure the checker of a forked worker process as rsmcheck.py does for the given options and check ctl, see
+    portfolio.run_strategy. The settings are module globals, so they only affect the worker.
+
+    :param options: the options of the request as returned by parse_options
+    """
+    # witnesses explain the values of all subformulas, so none of them may be dropped
+    checker.retire_subformulas = options["witness_format"] is None
+    checker.demand_driven = options["demand"]
+    checker.priority_weights.update(options["priority_weights"])
+    portfolio.run_strategy(strategy, machine, ctl, index, limits, options["witness_format"], results,
+                           options["reduce"], options["randomize_nondeterminism"])
+
+
+async def send(writer, reply):
+    writer.write(json.dumps(reply).encode() + b"\n")
+    await writer.drain()
+
+
+async def serve(socket_path, port, num_workers, num_models):
+    server = CheckServer(num_workers, num_models)
+    if port is not None:
+        listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", port)
+        address = "127.0.0.1:" + str(port)
+    else:
+        if os.path.exists(socket_path):
+            # left over from a server that was killed
+            os.remove(socket_path)
+        listener = await asyncio.start_unix_server(server.handle_connection, socket_path)
+        address = socket_path
+    logger.info("Listening on " + address + " with " + str(num_workers) + " workers")
+    print("Listening on " + address)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep RSMs in memory and check formulas for clients, see client.py")
+    parser.add_argument("-socket",
+                        default=DEFAULT_SOCKET,
+                        help="Unix socket to listen on (default: " + DEFAULT_SOCKET + ")")
+    parser.add_argument("-port",
+                        type=int,
+                        help="listen on this TCP port of localhost instead of a Unix socket")
+    parser.add_argument("-workers",
+                        type=int,
+                        default=os.cpu_count() or 1,
+                        help="maximal number of formulas checked at the same time, each in its own process (default: "
+                             "number of CPUs)")
+    parser.add_argument("-cache_size",
+                        type=int,
+                        default=cache_size,
+                        help="maximal number of parsed RSMs kept in memory (default: " + str(cache_size) + ")")
+    parser.add_argument("-log", "--logfile",
+                        default="server.log",
+                        help="logfile name")
+    args = parser.parse_args()
+    logging.basicConfig(filename=args.logfile, level=logging.INFO, format='%(asctime)s %(message)s')
+    try:
+        asyncio.run(serve(args.socket, args.port, args.workers, args.cache_size))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
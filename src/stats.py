@@ -0,0 +1,155 @@
+""" Collection of statistics gathered while checking a single formula
+"""
+
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ModuleNotFoundError:
+    resource = None
+
+
+class Statistics:
+    """
+    a class to collect timings and counters of a single model checking run in a machine-readable way
+
+    Attributes
+    ----------
+
+    phases : dict { str : dict { "time" : float, "calls" : int, "max" : float } }
+        accumulated wall-clock time (in seconds), number of calls and longest single call per phase
+    counters : dict { str : int }
+        event counters, e.g. fixpoint rounds or lazy iterations
+    peaks : dict { str : int }
+        maximal observed value of a quantity, e.g. the number of contextualized nodes
+    info : dict { str : object }
+        additional (JSON serializable) information on the run, e.g. the checked formula and the result
+
+    Methods
+    -------
+
+    start(phase)
+        start timing a phase
+    stop(phase)
+        stop timing a phase and add the elapsed time to it
+    phase(name)
+        context manager timing the enclosed block as the given phase
+    count(name, amount)
+        increase a counter by amount
+    peak(name, value)
+        update the peak value of a quantity
+    to_dict()
+        return all statistics as a JSON serializable dictionary
+    to_json()
+        return all statistics as a single line JSON string
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+        self.peaks = {}
+        self.info = {}
+        self._running = {}
+
+    def start(self, phase):
+        self._running[phase] = time.perf_counter()
+
+    def stop(self, phase):
+        elapsed = time.perf_counter() - self._running.pop(phase)
+        if phase not in self.phases:
+            self.phases[phase] = {"time": 0.0, "calls": 0, "max": 0.0}
+        entry = self.phases[phase]
+        entry["time"] += elapsed
+        entry["calls"] += 1
+        if elapsed > entry["max"]:
+            entry["max"] = elapsed
+        return elapsed
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def peak(self, name, value):
+        if value > self.peaks.get(name, value - 1):
+            self.peaks[name] = value
+
+    def get_time(self, phase):
+        return self.phases[phase]["time"] if phase in self.phases else 0.0
+
+    def to_dict(self):
+        return {
+            "info": self.info,
+            "phases": self.phases,
+            "counters": self.counters,
+            "peaks": self.peaks
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), default=str)
+
+
+class _Phase:
+    """
+    context manager returned by Statistics.phase
+    """
+
+    def __init__(self, statistics, name):
+        self.statistics = statistics
+        self.name = name
+
+    def __enter__(self):
+        self.statistics.start(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.statistics.stop(self.name)
+        return False
+
+
+_current = Statistics()
+
+
+def current():
+    """
+    :return: the statistics object of the run that is currently being checked
+    """
+    return _current
+
+
+def reset():
+    """
+    Start collecting statistics for a new run.
+
+    :return: the fresh statistics object
+    """
+    global _current
+    _current = Statistics()
+    return _current
+
+
+def peak_memory():
+    """
+    :return: the peak resident set size of this process in bytes, or None if it cannot be determined on this system
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS and in kilobytes on Linux
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def current_memory():
+    """
+    :return: the current resident set size of this process in bytes, or the peak resident set size if the current one
+    cannot be determined on this system, or None if neither can be determined
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return peak_memory()
@@ -1,8 +1,18 @@
 """ Collection of useful functions
 """
 
+import random
+from collections import defaultdict
 from pyModelChecking import CTL
+from ctl_parser import get_subformulas
 from model import rsm
+import budget
+import stats
+
+# optional function called as on_box_value_determined(component, node) whenever the value of an existential formula
+# is determined in a return node or an exit node, check_lazy uses it to keep its index of contextualizable boxes up to
+# date
+on_box_value_determined = None
 
 
 # Exception class for nested break statements
@@ -10,6 +20,55 @@ class Found(Exception):
     pass
 
 
+class IndexedSet:
+    """
+    a set that also allows choosing a random element in constant time. the elements are kept in a list, along with
+    the position of each element in the list. removing an element moves the last element to its position.
+    """
+
+    def __init__(self, items=()):
+        self.items = []
+        self.positions = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if item not in self.positions:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def discard(self, item):
+        position = self.positions.pop(item, None)
+        if position is None:
+            return
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+
+    def choice(self):
+        return random.choice(self.items)
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def set_existential_value(component, node, ctl, value):
+    """
+    Set the value of an existential formula in a node and notify on_box_value_determined for return and exit nodes.
+    """
+    component.set_truth_value(node, ctl, value)
+    if on_box_value_determined is not None:
+        if isinstance(node, rsm.BoxNode) and node.is_return_node or component.base_component.is_exit(node):
+            on_box_value_determined(component, node)
+
+
 def check_locally(node, component, ctl):
     """
     Simple procedure to deduce local properties, i.e. AP, Not, And, Or formulas by looking at formulas
@@ -26,60 +85,115 @@ def check_locally(node, component, ctl):
 
     if isinstance(ctl, CTL.Bool):
         if str(ctl) == "true":
-            node_interpretation[ctl] = True
+            component.set_truth_value(node, ctl, True)
         else:
-            node_interpretation[ctl] = False
+            component.set_truth_value(node, ctl, False)
         return True
 
     if isinstance(ctl, CTL.AtomicProposition):
         ap = str(ctl)
-        node_interpretation[ctl] = component.base_component.has_label(node, ap)
+        component.set_truth_value(node, ctl, component.base_component.has_label(node, ap))
         return True
 
     if isinstance(ctl, CTL.E) or isinstance(ctl, CTL.A):
         raise ValueError("Can't check temporal operators locally")
 
     if isinstance(ctl, CTL.Not):
-        if ctl.subformula(0) not in node_interpretation:
+        value = node_interpretation.get(ctl.subformula(0))
+        if value is None:
             return False
-        node_interpretation[ctl] = not node_interpretation[ctl.subformula(0)]
+        component.set_truth_value(node, ctl, not value)
         return True
 
     if isinstance(ctl, CTL.And):
         has_unknown = False
         for sub in ctl.subformulas():
-            if sub not in node_interpretation:
+            value = node_interpretation.get(sub)
+            if value is None:
                 has_unknown = True
                 continue
-            if not node_interpretation[sub]:
-                node_interpretation[ctl] = False
+            if not value:
+                component.set_truth_value(node, ctl, False)
                 return True
         if not has_unknown:
-            node_interpretation[ctl] = True
+            component.set_truth_value(node, ctl, True)
             return True
         return False
 
     if isinstance(ctl, CTL.Or):
         has_unknown = False
         for sub in ctl.subformulas():
-            if sub not in node_interpretation:
+            value = node_interpretation.get(sub)
+            if value is None:
                 has_unknown = True
                 continue
-            if node_interpretation[sub]:
-                node_interpretation[ctl] = True
+            if value:
+                component.set_truth_value(node, ctl, True)
                 return True
         if not has_unknown:
-            node_interpretation[ctl] = False
+            component.set_truth_value(node, ctl, False)
             return True
         return False
 
 
-def check_next(machine, ctl):
+def interpretation_items(component, nodes=None):
+    """
+    :param component: a contextualized component
+    :param nodes: dictionary mapping contextualized components to the set of their nodes to evaluate, None for all nodes
+    :return: the (node, node interpretation) pairs of the nodes of component to evaluate
+    """
+    if nodes is None:
+        return component.interpretation.items()
+    return [(node, component.interpretation[node]) for node in nodes.get(component, ())]
+
+
+def is_propositional(ctl):
+    if isinstance(ctl, CTL.AtomicProposition) or isinstance(ctl, CTL.Bool):
+        return True
+    if isinstance(ctl, CTL.E) or isinstance(ctl, CTL.A):
+        return False
+    return all(is_propositional(sub) for sub in ctl.subformulas())
+
+
+def check_local_formula(machine, ctl, components=None, nodes=None):
+    """
+    Deduce a local property, i.e. an AP, Not, And or Or formula, in all nodes of the given components as far as
+    possible. Propositional formulas do not depend on the context, so their values are computed only once per base
+    component, where the interpretations of all its contexts look them up (see NodeInterpretation).
+
+    :param machine: the RSM
+    :param ctl: the local formula
+    :param components: the contextualized components to check ctl in, all contextualized components by default
+    :param nodes: the nodes to check ctl in per contextualized component, default: all nodes (see demanded_nodes)
+    :return: whether ctl is known in all nodes of the components (to check)
+    """
+    if components is None:
+        components = machine.contextualized_components
+
+    if is_propositional(ctl):
+        for base_component in {c.base_component for c in components}:
+            base_component.get_propositional_values(ctl)
+        return True
+
+    known_in_all_nodes = True
+    for c in components:
+        for node, node_interpretation in interpretation_items(c, nodes):
+            # once determined, the value does not change anymore
+            if ctl in node_interpretation:
+                continue
+            if not check_locally(node, c, ctl):
+                known_in_all_nodes = False
+    return known_in_all_nodes
+
+
+def check_next(machine, ctl, components=None, nodes=None):
     """
     For an EX type CTL, figure out its value in the machine's nodes
 
     :param machine: The machine to check
     :param ctl: The CTL to check against
+    :param components: set of contextualized components to evaluate, default: all of the machine
+    :param nodes: the nodes to evaluate per contextualized component, default: all nodes (see demanded_nodes)
     :raises: ValueError: if wrong CTL type is given
     :return: True iff a target node was successfully computed
     """
@@ -90,61 +204,94 @@ def check_next(machine, ctl):
     if not isinstance(ctl, CTL.E) and not isinstance(path_formula, CTL.X):
         raise ValueError("CTL for context completion must be of form EX")
 
-    for c in machine.contextualized_components:
-        for node in c.base_component.nodes:
+    if components is None:
+        components = machine.contextualized_components
+
+    statistics = stats.current()
+    statistics.start("EX")
+
+    for c in components:
+        component_nodes = c.base_component.nodes if nodes is None else nodes.get(c, ())
+        statistics.count("nodes_visited", len(component_nodes))
+        for node in component_nodes:
             # for exit node it can only be deduced via context
             if c.base_component.is_exit(node):
-                if ctl in c.context[node]:
-                    c.interpretation[node][ctl] = c.context[node][ctl]
+                if ctl in c.context[node] and ctl not in c.interpretation[node]:
+                    set_existential_value(c, node, ctl, c.context[node][ctl])
+                continue
+            # once determined, the value does not change anymore
+            if ctl in c.interpretation[node]:
                 continue
 
             has_unknown = False
             try:
                 successors = c.base_component.transitions[node]
                 for s in successors:
-                    if sub not in c.interpretation[s]:
+                    value = c.interpretation[s].get(sub)
+                    if value is None:
                         has_unknown = True
                         continue
-                    if c.interpretation[s][sub]:
-                        c.interpretation[node][ctl] = True
+                    if value:
+                        set_existential_value(c, node, ctl, True)
                         raise Found
 
                 if isinstance(node, rsm.BoxNode) and node.is_call_node:
                     ref_component = c.box_mapping[node.box]
                     box_successors = ref_component.base_component.transitions[node.node]
                     for s in box_successors:
-                        if sub not in ref_component.interpretation[s]:
+                        value = ref_component.interpretation[s].get(sub)
+                        if value is None:
                             has_unknown = True
                             continue
-                        if ref_component.interpretation[s][sub]:
-                            c.interpretation[node][ctl] = True
+                        if value:
+                            set_existential_value(c, node, ctl, True)
                             raise Found
 
             except Found:
                 continue
             # if no successor was found and no unknown successors are present the CTL is False
             if not has_unknown:
-                c.interpretation[node][ctl] = False
+                set_existential_value(c, node, ctl, False)
+
+    statistics.stop("EX")
 
     return False
 
 
-def check_until(machine, ctl):
+def check_until(machine, ctl, components=None, nodes=None):
+    """
+    For an EU type CTL, figure out its value in the nodes of the given components by a pessimistic and an optimistic
+    fixpoint computation
+
+    :param machine: The machine to check
+    :param ctl: The CTL to check against
+    :param components: set of contextualized components to evaluate, default: all of the machine. Their callees must
+    either be among them or be evaluated already, see check_existential_formula
+    :param nodes: the nodes to evaluate per contextualized component, default: all nodes. They must contain the
+    successors of the nodes in which ctl is unknown, see demanded_nodes
+    """
 
     path_formula = ctl.subformula(0)
     sub1 = path_formula.subformula(0)
     sub2 = path_formula.subformula(1)
 
+    if components is None:
+        components = machine.contextualized_components
+
+    statistics = stats.current()
+
     ###################
     # pessimistic run #
     ###################
 
-    sat = set()
+    statistics.start("EU pessimistic")
+
+    sat = callee_states(components, ctl, False)
     to_determine = set()
 
     # obvious deductions
-    for contextualized_component in machine.contextualized_components:
-        for node, node_interpretation in contextualized_component.interpretation.items():
+    for contextualized_component in components:
+        for node, node_interpretation in interpretation_items(contextualized_component, nodes):
             # don't search for truth value if it's already known
             if ctl in node_interpretation:
                 if node_interpretation[ctl] is True:
@@ -158,11 +305,11 @@ def check_until(machine, ctl):
                         sat.add((contextualized_component, node))
                     continue
                 # if phi_2 is true, then ctl is true
-                if sub2 in node_interpretation and node_interpretation[sub2] is True:
+                if node_interpretation.get(sub2) is True:
                     sat.add((contextualized_component, node))
                     continue
                 # if phi_1 is pessimistically false, we do not add it to search space
-                if sub1 not in node_interpretation or node_interpretation[sub1] is False:
+                if node_interpretation.get(sub1) is not True:
                     continue
 
             # if value still not known, add it to search space
@@ -172,6 +319,9 @@ def check_until(machine, ctl):
     # so we add nodes from to_determine to sat if they have a sat successor until we reach a fixed point
 
     while True:
+        statistics.count("fixpoint_rounds")
+        budget.check()
+        statistics.count("nodes_visited", len(to_determine))
         next_to_determine = set()
         for contextualized_component, node in to_determine:
             base_component = contextualized_component.base_component
@@ -196,18 +346,23 @@ def check_until(machine, ctl):
 
     # what is true pessimistically is definitely true
     for contextualized_component, node in sat:
-        contextualized_component.interpretation[node][ctl] = True
+        if ctl not in contextualized_component.interpretation[node]:
+            set_existential_value(contextualized_component, node, ctl, True)
+
+    statistics.stop("EU pessimistic")
 
     ##################
     # optimistic run #
     ##################
 
-    sat = set()
+    statistics.start("EU optimistic")
+
+    sat = callee_states(components, ctl, True)
     to_determine = set()
 
     # obvious deductions
-    for contextualized_component in machine.contextualized_components:
-        for node, node_interpretation in contextualized_component.interpretation.items():
+    for contextualized_component in components:
+        for node, node_interpretation in interpretation_items(contextualized_component, nodes):
             # don't search for truth value if it's already known
             if ctl in node_interpretation:
                 if node_interpretation[ctl] is True:
@@ -223,11 +378,11 @@ def check_until(machine, ctl):
                         sat.add((contextualized_component, node))
                     continue
                 # if phi_2 is true or unknown, ctl is optimistically satisfied
-                if sub2 not in node_interpretation or node_interpretation[sub2] is True:
+                if node_interpretation.get(sub2) is not False:
                     sat.add((contextualized_component, node))
                     continue
                 # only if we know for sure phi_1 does not hold, we exclude node from search space
-                if sub1 in node_interpretation and node_interpretation[sub1] is False:
+                if node_interpretation.get(sub1) is False:
                     continue
 
             # if value still not known and node wasn't excluded, add it to search space
@@ -237,6 +392,9 @@ def check_until(machine, ctl):
     # so we add nodes from to_determine to sat if they have a sat successor until we reach a fixed point
 
     while to_determine:
+        statistics.count("fixpoint_rounds")
+        budget.check()
+        statistics.count("nodes_visited", len(to_determine))
         next_to_determine = set()
         for contextualized_component, node in to_determine:
             base_component = contextualized_component.base_component
@@ -265,24 +423,166 @@ def check_until(machine, ctl):
 
     # what is false optimistically, is definitely false
 
-    for contextualized_component in machine.contextualized_components:
-        for node, node_interpretation in contextualized_component.interpretation.items():
+    for contextualized_component in components:
+        for node, node_interpretation in interpretation_items(contextualized_component, nodes):
+            if ctl not in node_interpretation and (contextualized_component, node) not in sat:
+                set_existential_value(contextualized_component, node, ctl, False)
+
+    statistics.stop("EU optimistic")
+
+
+def is_reachability(ctl):
+    """
+    :param ctl: CTL formula
+    :return: whether ctl is of the form E(true U phi), i.e., EF phi
+    """
+    if not isinstance(ctl, CTL.E) or not isinstance(ctl.subformula(0), CTL.U):
+        return False
+    sub1 = ctl.subformula(0).subformula(0)
+    return isinstance(sub1, CTL.Bool) and str(sub1) == "true"
+
+
+def check_reachability(machine, ctl, components=None, nodes=None):
+    """
+    For an EU type CTL with true as first operand, i.e., EF phi, figure out its value in the nodes of the given
+    components by a backward search from the nodes satisfying it. Besides the successors of the nodes in their component
+    and in the referenced components, call nodes lead to the return nodes of their box given by the entry-to-exit
+    summaries of the referenced component (see RSM.get_exit_summaries), so paths through a box do not have to wait for
+    the context of the referenced component. The search is done pessimistically from the nodes known to satisfy ctl and,
+    only if some relevant value is unknown, a second time optimistically. The optimistic search does not use the
+    summaries, such that the unknown values depend on each other as for check_until, which the lazy approach relies on
+    when requesting them.
+
+    :param machine: The machine to check
+    :param ctl: The CTL to check against
+    :param components: set of contextualized components to evaluate, default: all of the machine. Their callees must
+    either be among them or be evaluated already, see check_existential_formula
+    :param nodes: the nodes to evaluate per contextualized component, default: all nodes. They must contain the
+    successors of the nodes in which ctl is unknown, see demanded_nodes
+    """
+
+    sub = ctl.subformula(0).subformula(1)
+
+    if components is None:
+        components = machine.contextualized_components
+
+    statistics = stats.current()
+    statistics.start("EF")
+
+    summaries = machine.get_exit_summaries()
+
+    # predecessors of each state among the states in which ctl is unknown, and the call nodes leading to each return
+    # node according to the summaries
+    predecessors = defaultdict(list)
+    summary_predecessors = defaultdict(list)
+    sat = callee_states(components, ctl, False)
+    maybe_sat = set()
+    uncertain = len(callee_states(components, ctl, True)) != len(sat)
+    for contextualized_component in components:
+        base_component = contextualized_component.base_component
+        items = interpretation_items(contextualized_component, nodes)
+        statistics.count("nodes_visited", len(items))
+        for node, node_interpretation in items:
+            state = (contextualized_component, node)
+            if ctl in node_interpretation:
+                if node_interpretation[ctl] is True:
+                    sat.add(state)
+                continue
+            # exit nodes have no successors, apart from phi only the context determines their value
+            if base_component.is_exit(node):
+                value = contextualized_component.context[node].get(ctl)
+                if value is None and node_interpretation.get(sub) is True:
+                    value = True
+                if value is True:
+                    sat.add(state)
+                elif value is None:
+                    uncertain = True
+                    maybe_sat.add(state)
+                continue
+            value = node_interpretation.get(sub)
+            if value is True:
+                sat.add(state)
+                continue
+            if value is None:
+                uncertain = True
+                maybe_sat.add(state)
+
+            for s in base_component.transitions[node]:
+                predecessors[(contextualized_component, s)].append(state)
+            if isinstance(node, rsm.BoxNode) and node.is_call_node:
+                ref_component = contextualized_component.box_mapping[node.box]
+                for s in ref_component.base_component.transitions[node.node]:
+                    predecessors[(ref_component, s)].append(state)
+                for x in summaries[node.box.component.name].get(node.node.name, ()):
+                    return_node = base_component.return_node_name_dict.get((node.box.name, x))
+                    if return_node is not None:
+                        summary_predecessors[(contextualized_component, return_node)].append(state)
+
+    def backward_search(targets, use_summaries):
+        reached = set(targets)
+        stack = list(targets)
+        while stack:
+            target = stack.pop()
+            sources = predecessors.get(target, [])
+            if use_summaries:
+                sources = sources + summary_predecessors.get(target, [])
+            for state in sources:
+                if state not in reached:
+                    reached.add(state)
+                    stack.append(state)
+        return reached
+
+    # what is true pessimistically is definitely true
+    sat = backward_search(sat, True)
+    for contextualized_component, node in sat:
+        if ctl not in contextualized_component.interpretation[node]:
+            set_existential_value(contextualized_component, node, ctl, True)
+
+    # without unknown values the optimistic search would reach the same states
+    if uncertain:
+        statistics.count("EF_optimistic_searches")
+        sat = backward_search(sat | maybe_sat | callee_states(components, ctl, True), False)
+
+    # what is false optimistically, is definitely false
+    for contextualized_component in components:
+        for node, node_interpretation in interpretation_items(contextualized_component, nodes):
             if ctl not in node_interpretation and (contextualized_component, node) not in sat:
-                node_interpretation[ctl] = False
+                set_existential_value(contextualized_component, node, ctl, False)
 
+    statistics.stop("EF")
+
+
+def check_always(machine, ctl, components=None, nodes=None):
+    """
+    For an EG type CTL, figure out its value in the nodes of the given components by a pessimistic and an optimistic
+    fixpoint computation
 
-def check_always(machine, ctl):
+    :param machine: The machine to check
+    :param ctl: The CTL to check against
+    :param components: set of contextualized components to evaluate, default: all of the machine. Their callees must
+    either be among them or be evaluated already, see check_existential_formula
+    :param nodes: the nodes to evaluate per contextualized component, default: all nodes. They must contain the
+    successors of the nodes in which ctl is unknown, see demanded_nodes
+    """
     sub = ctl.subformula(0).subformula(0)
 
-    sat = set()
+    if components is None:
+        components = machine.contextualized_components
+
+    statistics = stats.current()
 
     ###################
     # pessimistic run #
     ###################
 
+    statistics.start("EG pessimistic")
+
+    callees = callee_states(components, ctl, False)
+    sat = set(callees)
+
     # initialization
-    for contextualized_component in machine.contextualized_components:
-        for node, node_interpretation in contextualized_component.interpretation.items():
+    for contextualized_component in components:
+        for node, node_interpretation in interpretation_items(contextualized_component, nodes):
             # don't search for truth value if it's already known
             if ctl in node_interpretation:
                 if node_interpretation[ctl] is True:
@@ -295,18 +595,25 @@ def check_always(machine, ctl):
                             contextualized_component.context[node][ctl] is True:
                         sat.add((contextualized_component, node))
                 # all nodes with phi_1 true may pessimistically satisfy ctl
-                elif sub in node_interpretation and node_interpretation[sub] is True:
+                elif node_interpretation.get(sub) is True:
                     sat.add((contextualized_component, node))
 
     # here we know all nodes in sat pessimistically satisfy phi_1
     # we now throw out all nodes w/o a sat-successor until we reach a fixed point
 
     while True:
+        statistics.count("fixpoint_rounds")
+        budget.check()
+        statistics.count("nodes_visited", len(sat))
         new_sat = sat.copy()
 
         for contextualized_component, node in sat:
             base_component = contextualized_component.base_component
 
+            # dont remove nodes of callees, their value is final
+            if (contextualized_component, node) in callees:
+                continue
+
             # dont remove context
             if base_component.is_exit(node) and ctl in contextualized_component.context[node] and \
                     contextualized_component.context[node][ctl] is True:
@@ -341,17 +648,23 @@ def check_always(machine, ctl):
     # what is true pessimistically, is definitely true
 
     for contextualized_component, node in sat:
-        contextualized_component.interpretation[node][ctl] = True
+        if ctl not in contextualized_component.interpretation[node]:
+            set_existential_value(contextualized_component, node, ctl, True)
+
+    statistics.stop("EG pessimistic")
 
     ##################
     # optimistic run #
     ##################
 
-    sat = set()
+    statistics.start("EG optimistic")
+
+    callees = callee_states(components, ctl, True)
+    sat = set(callees)
 
     # initialization
-    for contextualized_component in machine.contextualized_components:
-        for node, node_interpretation in contextualized_component.interpretation.items():
+    for contextualized_component in components:
+        for node, node_interpretation in interpretation_items(contextualized_component, nodes):
             # don't search for truth value if it's already known
             if ctl in node_interpretation:
                 if node_interpretation[ctl] is True:
@@ -366,7 +679,7 @@ def check_always(machine, ctl):
                     continue
                 # for non-exit nodes and when ctl is not in context for exit nodes, we optimistically assume
                 # satisfaction if the subformula is true or unknown
-                if sub not in node_interpretation or node_interpretation[sub] is True:
+                if node_interpretation.get(sub) is not False:
                     sat.add((contextualized_component, node))
                     continue
 
@@ -374,11 +687,18 @@ def check_always(machine, ctl):
     # we now throw out all nodes w/o a sat-successor until we reach a fixed point
 
     while True:
+        statistics.count("fixpoint_rounds")
+        budget.check()
+        statistics.count("nodes_visited", len(sat))
         new_sat = sat.copy()
 
         for contextualized_component, node in sat:
             base_component = contextualized_component.base_component
 
+            # dont remove nodes of callees, their value is final
+            if (contextualized_component, node) in callees:
+                continue
+
             # dont remove context
             if base_component.is_exit(node) and ctl in contextualized_component.context[node] \
                     and contextualized_component.context[node][ctl] is True:
@@ -412,19 +732,24 @@ def check_always(machine, ctl):
 
     # what is false optimistically, is definitely false
 
-    for contextualized_component in machine.contextualized_components:
-        for node, node_interpretation in contextualized_component.interpretation.items():
+    for contextualized_component in components:
+        for node, node_interpretation in interpretation_items(contextualized_component, nodes):
             if ctl not in node_interpretation and (contextualized_component, node) not in sat:
-                node_interpretation[ctl] = False
+                set_existential_value(contextualized_component, node, ctl, False)
+
+    statistics.stop("EG optimistic")
 
 
-def check_existential_formula(machine, ctl):
+def check_existential_formula(machine, ctl, groups=None, nodes=None):
     """
     For a CTL-formula of form EX, EG or EU calculate the value of the  CTL-formula in all nodes of the contextualized
     component as far as possible
 
     :param machine: RSM  for whose nodes satisfaction is to be determined
     :param ctl: EX-, EU- or EG-form CTL-formula to check against
+    :param groups: list of sets of contextualized components to evaluate, as given by RSM.get_evaluation_order.
+    default: all of the machine
+    :param nodes: the nodes to evaluate per contextualized component, default: all nodes (see demanded_nodes)
     :raises:
         ValueError: if ctl is not of EX-, EG- or EU-form
     """
@@ -439,56 +764,127 @@ def check_existential_formula(machine, ctl):
 
     # handle EX formulas separately
     if isinstance(path_formula, CTL.X):
-        return check_next(machine, ctl)
+        if groups is None:
+            return check_next(machine, ctl, nodes=nodes)
+        for components in groups:
+            check_next(machine, ctl, components, nodes)
+        return False
     # handle U/G via optimistic/pessimistic runs (see Godefroid)
-    if isinstance(path_formula, CTL.U):
-        return check_until(machine, ctl)
-    if isinstance(path_formula, CTL.G):
-        return check_always(machine, ctl)
+    # the value of a formula in a node only depends on its component and its callees, so the strongly connected parts
+    # of the call graph are evaluated bottom-up. the values in callees are final when their callers are evaluated, thus
+    # the fixpoints only iterate within one part instead of the whole machine
+    # EF formulas are plain reachability and are computed by a backward search instead
+    if is_reachability(ctl):
+        check = check_reachability
+    else:
+        check = check_until if isinstance(path_formula, CTL.U) else check_always
+    for components in groups if groups is not None else machine.get_evaluation_order():
+        check(machine, ctl, components, nodes)
+
+
+def callee_states(components, ctl, optimistic):
+    """
+    Collect the states outside of the given components that are entered by their boxes and satisfy an already
+    evaluated CTL, pessimistically (CTL is known to hold) or optimistically (CTL is not known to be violated).
+
+    :param components: set of contextualized components being evaluated
+    :param ctl: the CTL to check
+    :param optimistic: whether to collect the optimistically instead of the pessimistically satisfying states
+    :return: set of (contextualized component, node) pairs
+    """
+    states = set()
+    for c in components:
+        for box in c.base_component.boxes:
+            ref_component = c.box_mapping[box]
+            if ref_component in components:
+                continue
+            for call_node in box.call_nodes:
+                for s in ref_component.base_component.transitions[call_node.node]:
+                    value = ref_component.interpretation[s].get(ctl)
+                    if value is True or optimistic and value is None:
+                        states.add((ref_component, s))
+    return states
 
 
-def get_context_encoding(formulas, context, base_component):
+def demanded_nodes(machine, ctl):
     """
-    Get the encoding of a component's context wrt a ctl as a ternary string (using 0, 1 and ?)
+    Compute the slice of the machine that can influence the value of ctl in the initial node, starting from the initial
+    node and following the dependencies of unknown values: the subformulas of local formulas in the same node, the
+    subformulas of existential formulas in the same node and the formula itself in the successors (including the
+    successors of the entry nodes of called components), and for exit nodes the formula in the return nodes of all
+    callers, as these determine the contexts. Known values end the search, but are part of the slice.
+
+    :param machine: the RSM
+    :param ctl: the formula to check in the initial node
+    :return: dictionary mapping each formula to a dictionary mapping contextualized components to the set of their
+    nodes in which the formula is demanded
     """
-
-    ctl_str = ""
-    tmp_ctl_str = ""
-    enc = ""
-
-    sorted_exit_nodes = list(base_component.get_exit_nodes())
-    sorted_exit_nodes.sort(key=lambda x: x.name)
-
-    for node in sorted_exit_nodes:
-        for ctl in formulas:
-            if not ctl_str:
-                tmp_ctl_str += str(ctl).replace(" ", "") + "/"
-            if ctl not in context[node]:
-                enc += "?"
-            elif context[node][ctl] is True:
-                enc += "1"
+    callers = defaultdict(list)
+    for c in machine.contextualized_components:
+        for box, ref_component in c.box_mapping.items():
+            callers[ref_component].append((c, box))
+
+    demand = defaultdict(lambda: defaultdict(set))
+    demand[ctl][machine.initial_component].add(machine.initial_node)
+    subformulas = get_subformulas(ctl)
+    # formulas are only demanded by their superformulas, so all demands of a formula are known when it is reached
+    for depth in sorted(subformulas.keys(), reverse=True):
+        for f in subformulas[depth]:
+            if f not in demand or isinstance(f, CTL.AtomicProposition) or isinstance(f, CTL.Bool):
+                continue
+            demanded = demand[f]
+            path_formula = f.subformula(0) if isinstance(f, CTL.E) else None
+            if path_formula is None:
+                # local formulas only depend on their subformulas in the same node
+                same_node = [demand[sub] for sub in f.subformulas()]
+            elif isinstance(path_formula, CTL.X):
+                same_node = []
             else:
-                enc += "0"
-        if not ctl_str:
-            ctl_str = tmp_ctl_str
-        enc += "/"
-    return "_" + ctl_str + enc[:-1]
+                same_node = [demand[sub] for sub in path_formula.subformulas()]
+            # the value of EX in successors is not needed, only the value of its subformula
+            in_successors = demand[path_formula.subformula(0)] if isinstance(path_formula, CTL.X) else demanded
+
+            stack = [(c, node) for c, nodes in demanded.items() for node in nodes]
+            while stack:
+                c, node = stack.pop()
+                if c.interpretation[node].get(f) is not None:
+                    continue
+                for sub_demanded in same_node:
+                    sub_demanded[c].add(node)
+                if path_formula is None:
+                    continue
+                if c.base_component.is_exit(node):
+                    for caller, box in callers[c]:
+                        for rn in box.return_nodes:
+                            if rn.node == node and rn not in demanded[caller]:
+                                demanded[caller].add(rn)
+                                stack.append((caller, rn))
+                    continue
+                successors = [(c, s) for s in c.base_component.transitions[node]]
+                if isinstance(node, rsm.BoxNode) and node.is_call_node:
+                    ref_component = c.box_mapping[node.box]
+                    successors += [(ref_component, s) for s in ref_component.base_component.transitions[node.node]]
+                for successor_component, s in successors:
+                    if s not in in_successors[successor_component]:
+                        in_successors[successor_component].add(s)
+                        if in_successors is demanded:
+                            stack.append((successor_component, s))
+    return demand
 
 
 def box_stack_to_context(machine, box_stack, component=None):
     """
     :param machine: the RSM on which the box stack is defined
-    :param box_stack: a list of boxes, the first box being
+    :param box_stack: a BoxStack of the machine, or a list of boxes, the first box being entered first
     :param component: the component from which the box stack is executed. default: initial component of the RSM
     :return: contextualized component in which execution ends up in if boxes are entered in the specified order
     """
 
     if component is None:
+        if isinstance(box_stack, rsm.BoxStack):
+            return box_stack.context()
         component = machine.initial_component
 
-    if len(box_stack) == 0:
-        return component
-
-    next_box = box_stack[0]
-    next_component = component.box_mapping[next_box]
-    return box_stack_to_context(rsm, box_stack[1:], next_component)
+    for box in box_stack:
+        component = component.box_mapping[box]
+    return component